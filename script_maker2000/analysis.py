@@ -10,6 +10,13 @@ import datetime
 
 import plotly.graph_objects as go
 
+from script_maker2000.orca_parser import parse_orca_output
+from script_maker2000.parse_cache import (
+    get_output_fingerprint,
+    is_fingerprint_current,
+    parse_info_key,
+    result_file_cache,
+)
 
 single_value_entries = [
     "charge",
@@ -37,13 +44,56 @@ dict_entries = [
 
 special_entries = ["vibfreqs", "atomcoords", "vibirs"]
 
+# factors to convert the energies of the results from eV, the same as cclib.parser.utils.convertor uses
+energy_conversion_factors = {
+    "eV": 1.0,
+    **{
+        unit: cclib.parser.utils.convertor(1.0, "eV", unit)
+        for unit in ["hartree", "kcal/mol", "kJ/mol", "wavenumber"]
+    },
+}
 
-def extract_infos_from_results(raw_output_files: list) -> tuple:
+
+def convert_energies(energies, energy_unit):
+    """
+    Convert energies from eV to another unit.
+
+    Args:
+        energies (list|np.ndarray): The energies in eV.
+        energy_unit (str): One of the units in `energy_conversion_factors`.
+
+    Returns:
+        np.ndarray: The converted energies.
+    """
+    return np.asarray(energies, dtype=float) * energy_conversion_factors[energy_unit]
+
+
+def project_entries(data, entries=None):
+    """
+    Select the entries of a result dict that are needed for the requested entries.
+
+    Args:
+        data (dict): The parsed results.
+        entries (list, optional): The entries to keep. Defaults to None (all entries).
+
+    Returns:
+        dict: The selected entries.
+    """
+    if entries is None:
+        return data
+    # the atom labels belong to the coordinates
+    if "atomcoords" in entries:
+        entries = list(entries) + ["atomlabels"]
+    return {key: data[key] for key in entries if key in data}
+
+
+def extract_infos_from_results(raw_output_files: list, entries=None) -> tuple:
     """
     Extracts the information from the output files and adds it to the job_dict.
 
     Args:
         raw_output_files (list): List of output file paths or directories containing output files.
+        entries (list, optional): Only extract these entries of the result files. Defaults to None (all entries).
 
     Returns:
         tuple: A tuple containing the result dictionary and a list of corrections.
@@ -83,11 +133,12 @@ def extract_infos_from_results(raw_output_files: list) -> tuple:
     corrections_list = []
 
     for out_file in out_files:
-        with open(out_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = result_file_cache.load(out_file)
         filename = out_file.name.split("_calc_result.json")[0]
 
-        file_dict, file_corrections = extract_result_data(data)
+        file_dict, file_corrections = extract_result_data(
+            project_entries(data, entries)
+        )
 
         result_dict[filename] = file_dict
         result_dict[filename]["dirname"] = str(Path(out_file).parents[0])
@@ -155,36 +206,67 @@ def extract_result_data(data):
                 file_dict["vibirs"] = value
 
             elif key == "atomcoords":
-                coord_dict_list_list = {}
+                # (n_steps, n_atoms, 3), the viewer format is only built for the displayed step
+                file_dict["coords"] = {
+                    "symbols": data["atomlabels"],
+                    "positions": np.asarray(value, dtype=float).reshape(
+                        len(value), len(data["atomlabels"]), 3
+                    ),
+                }
 
-                atom_list = data["atomlabels"]
-                coord_step_list = value
-
-                for i, coord_step in enumerate(coord_step_list):
-                    new_coord_dict_list = []
-                    for atom, coord_row in zip(atom_list, coord_step):
-                        new_coord_dict_list.append(
-                            {
-                                "symbol": atom,
-                                "x": coord_row[0],
-                                "y": coord_row[1],
-                                "z": coord_row[2],
-                            }
-                        )
-
-                    coord_dict_list_list[f"Iteration_{i}"] = new_coord_dict_list
+    return file_dict, corrections_list
 
-                file_dict["coords"] = coord_dict_list_list
 
-    return file_dict, corrections_list
+def get_coords_frame(coords, index):
+    """
+    Get one step of a trajectory in the format of the molecule viewer.
 
+    Args:
+        coords (dict): The "coords" entry of `extract_result_data`, the positions can be an array or nested lists.
+        index (int): The index of the step.
 
-def parse_output_file(output_dir, failed_reason=None):
+    Returns:
+        list: One dict with the symbol and the x, y, z coordinates per atom.
+    """
+    positions = np.asarray(coords["positions"][index], dtype=float)
+    return [
+        {"symbol": symbol, "x": x, "y": y, "z": z}
+        for symbol, (x, y, z) in zip(coords["symbols"], positions.tolist())
+    ]
+
+
+def _load_cached_results(json_file, output_file, fingerprint):
+    """Return the results in the JSON file if they were parsed from the current output file."""
+    if not json_file.exists():
+        return None
+    try:
+        cached_results = result_file_cache.load(json_file)
+    except json.JSONDecodeError:
+        return None
+    if not is_fingerprint_current(
+        cached_results.get(parse_info_key), output_file, fingerprint
+    ):
+        return None
+    return cached_results
+
+
+def parse_output_file(
+    output_dir, failed_reason=None, use_cclib=False, use_content_hash=False
+):
     """
     Parses the output file and saves the results in a JSON file.
 
+    By default only the entries used by `extract_result_data` are read with the ORCA output parser.
+    With `use_cclib` all attributes cclib finds are stored instead.
+    The JSON file records the fingerprint of the output file (see parse_cache.py),
+    if it is still up to date the output isn't parsed again.
+
     Args:
         output_dir (str or Path): Path to the output file or directory containing the output file.
+        failed_reason (str, optional): The failed reason of the job, if it failed. Defaults to None.
+        use_cclib (bool, optional): Parse the output with cclib. Defaults to False.
+        use_content_hash (bool, optional): Add a hash of the output to the fingerprint,
+            so copied output files aren't parsed again. Defaults to False.
 
     Returns:
         str: Path to the JSON file containing the parsed results.
@@ -213,16 +295,33 @@ def parse_output_file(output_dir, failed_reason=None):
         json_file = output_dir.with_name(output_dir.stem + "_calc_result.json")
 
     if output_file.exists():
-        try:
-            cclib_results = cclib.io.ccread(str(output_file))
-        except Exception as e:
-            print(f"Error: {e}")
-            raise e
-        cclib_attr = cclib_results.getattributes()
-
-        result_dict = _convert_np_to_list(cclib_attr)
+        fingerprint = get_output_fingerprint(output_file, use_cclib, use_content_hash)
+        result_dict = _load_cached_results(json_file, output_file, fingerprint)
+
+        if result_dict is not None:
+            if result_dict.get("Failed") == failed_reason:
+                return json_file
+            # only the failed reason changed, the cached results are shared and must be copied
+            result_dict = dict(result_dict)
+            result_dict.pop("Failed", None)
+
+        elif not use_cclib:
+            result_dict = parse_orca_output(output_file)
+
+        else:
+            try:
+                cclib_results = cclib.io.ccread(str(output_file))
+            except Exception as e:
+                print(f"Error: {e}")
+                raise e
+            cclib_attr = cclib_results.getattributes()
+
+            result_dict = _convert_np_to_list(cclib_attr)
+
         if failed_reason is not None:
             result_dict["Failed"] = failed_reason
+        # cached results keep their fingerprint, which might contain the content hash
+        result_dict.setdefault(parse_info_key, fingerprint)
 
     elif failed_reason is not None:
         result_dict = {"Failed": failed_reason}
@@ -230,50 +329,145 @@ def parse_output_file(output_dir, failed_reason=None):
     # removed due to wrong embedding by rdkit
     # result_dict["connectivity_check"] = basic_connectivity_check(result_dict)
 
-    # Save the results in a JSON file
+    # Save the results in a JSON file, the files are collected into the result store of the batch run
     with open(json_file, "w", encoding="utf-8") as f:
-        json.dump(result_dict, f, indent=4)
+        json.dump(result_dict, f)
     return json_file
 
 
+# maximum number of (grid point, peak) pairs evaluated at once by the direct broadening
+broadening_chunk_size = 2**20
+
+
+def _line_shape(delta, line_profile, line_param):
+    """Evaluate the line profile at the distances `delta` to the peak centers."""
+    if line_profile == "Gaussian":
+        return np.exp(-((delta / line_param) ** 2))
+    if line_profile == "Lorentzian":
+        return 0.5 * line_param / (np.pi * (delta**2 + 0.25 * line_param**2))
+    raise ValueError(
+        f"Unknown line profile {line_profile}, use 'Gaussian' or 'Lorentzian'."
+    )
+
+
+def _broadening_grid(list_ex_energy, step):
+    return np.arange(np.amin(list_ex_energy) - 50, np.amax(list_ex_energy) + 50, step)
+
+
+def _broaden_direct(x, energies, strengths, line_profile, line_param):
+    y = np.empty(len(x))
+    # the (grid point, peak) matrix is built in chunks of grid points to limit the memory use
+    chunk = max(1, broadening_chunk_size // max(len(energies), 1))
+    for start in range(0, len(x), chunk):
+        delta = x[start : start + chunk, np.newaxis] - energies[np.newaxis, :]
+        y[start : start + chunk] = (
+            _line_shape(delta, line_profile, line_param) @ strengths
+        )
+    return y
+
+
+def _broaden_fft(x, energies, strengths, line_profile, line_param):
+    n_points = len(x)
+    if n_points == 0:
+        return np.zeros(0)
+    step = x[1] - x[0] if n_points > 1 else 1.0
+
+    # distribute every peak onto the two neighbouring grid points, this keeps its area and position
+    position = (energies - x[0]) / step
+    lower = np.clip(np.floor(position).astype(int), 0, n_points - 1)
+    upper_weight = np.clip(position - lower, 0, 1)
+    upper = np.minimum(lower + 1, n_points - 1)
+    sticks = np.bincount(
+        lower, weights=strengths * (1 - upper_weight), minlength=n_points
+    )
+    sticks += np.bincount(upper, weights=strengths * upper_weight, minlength=n_points)
+
+    # the kernel covers the whole grid, the Lorentzian tails are long
+    kernel = _line_shape(
+        np.arange(-(n_points - 1), n_points) * step, line_profile, line_param
+    )
+    n_fft = 1 << (n_points + len(kernel) - 2).bit_length()
+    y = np.fft.irfft(np.fft.rfft(sticks, n_fft) * np.fft.rfft(kernel, n_fft), n_fft)
+    return y[n_points - 1 : 2 * n_points - 1]
+
+
+def _broaden(x, list_ex_energy, list_osci_strength, line_profile, line_param, method):
+    energies = np.asarray(list_ex_energy, dtype=float)
+    strengths = np.asarray(list_osci_strength, dtype=float)
+    if method == "direct":
+        return _broaden_direct(x, energies, strengths, line_profile, line_param)
+    if method == "fft":
+        return _broaden_fft(x, energies, strengths, line_profile, line_param)
+    raise ValueError(f"Unknown broadening method {method}, use 'direct' or 'fft'.")
+
+
 def add_broadening(
     list_ex_energy,
     list_osci_strength,
     line_profile="Lorentzian",
     line_param=10,
     step=10,
+    method="direct",
 ):
     """
     Adds broadening to the given energy and intensity lists.
 
+    The "direct" method evaluates the line profile of every peak at every grid point.
+    The "fft" method places the peaks on the grid and convolves them with the line profile,
+    which is faster for fine grids and many peaks. The peak positions are rounded
+    to the grid, so the results differ slightly for steps close to the line width.
+
     Args:
         list_ex_energy (list): List of excitation energies.
         list_osci_strength (list): List of oscillator strengths.
         line_profile (str, optional): Line profile type. Defaults to "Lorentzian".
         line_param (int, optional): Line parameter. Defaults to 10.
         step (int, optional): Step size. Defaults to 10.
+        method (str, optional): "direct" or "fft". Defaults to "direct".
 
     Returns:
         tuple: A tuple containing the broadened energy and intensity lists.
     """
 
-    x_min = np.amin(list_ex_energy) - 50
-    x_max = np.amax(list_ex_energy) + 50
-    x = np.arange(x_min, x_max, step)
-    y = np.zeros((len(x)))
-
-    # Go through the frames and calculate the spectrum for each frame
-    for xp in range(len(x)):
-        for e, f in zip(list_ex_energy, list_osci_strength):
-            if line_profile == "Gaussian":
-                y[xp] += f * np.exp(-(((e - x[xp]) / line_param) ** 2))
-            elif line_profile == "Lorentzian":
-                y[xp] += (
-                    0.5
-                    * line_param
-                    * f
-                    / (np.pi * ((x[xp] - e) ** 2 + 0.25 * line_param**2))
-                )
+    x = _broadening_grid(list_ex_energy, step)
+    y = _broaden(
+        x, list_ex_energy, list_osci_strength, line_profile, line_param, method
+    )
+    return x, y
+
+
+def add_broadening_batch(
+    ex_energy_lists,
+    osci_strength_lists,
+    line_profile="Lorentzian",
+    line_param=10,
+    step=10,
+    method="direct",
+):
+    """
+    Adds broadening to the spectra of several molecules on a common grid, e.g. to overlay them.
+
+    Args:
+        ex_energy_lists (list): One list of excitation energies per molecule.
+        osci_strength_lists (list): One list of oscillator strengths per molecule.
+        line_profile (str, optional): Line profile type. Defaults to "Lorentzian".
+        line_param (int, optional): Line parameter. Defaults to 10.
+        step (int, optional): Step size. Defaults to 10.
+        method (str, optional): "direct" or "fft". Defaults to "direct".
+
+    Returns:
+        tuple: The common grid and an array with one broadened spectrum per row.
+    """
+
+    x = _broadening_grid(np.concatenate([np.ravel(e) for e in ex_energy_lists]), step)
+    y = np.zeros((len(ex_energy_lists), len(x)))
+    for i, (list_ex_energy, list_osci_strength) in enumerate(
+        zip(ex_energy_lists, osci_strength_lists)
+    ):
+        if len(list_ex_energy):
+            y[i] = _broaden(
+                x, list_ex_energy, list_osci_strength, line_profile, line_param, method
+            )
     return x, y
 
 
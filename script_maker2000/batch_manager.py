@@ -2,11 +2,9 @@ from collections import defaultdict
 import asyncio
 import logging
 import itertools
-import json
 from pathlib import Path
 from tqdm import tqdm
 import traceback
-import zipfile
 
 from script_maker2000.files import (
     read_config,
@@ -18,6 +16,20 @@ from script_maker2000.files import (
 from script_maker2000.work_manager import WorkManager
 from script_maker2000.orca import OrcaModule
 from script_maker2000.job import Job
+from script_maker2000.job_registry import JobRegistry
+from script_maker2000.job_graph import build_step_graph
+from script_maker2000.result_parser import ResultParser
+from script_maker2000.result_store import write_result_store
+from script_maker2000.results_index import write_results_indices
+from script_maker2000.campaign_archive import CampaignArchiver, is_job_done
+from script_maker2000.step_archive import StepArchiver
+from script_maker2000.slurm import (
+    SlurmClient,
+    SacctPoller,
+    CompletionSpool,
+    completion_spool_name,
+)
+from script_maker2000.job_store import create_job_store, read_job_backup
 
 
 class BatchManager:
@@ -55,6 +67,7 @@ class BatchManager:
             ) = self.initialize_files()
 
             self.job_dict = self._jobs_from_initial_json(self.new_json_file)
+            self.job_store = create_job_store(self.main_config, self.working_dir)
 
             self.work_managers = self.setup_work_modules_manager()
             self.copy_input_files_to_first_work_manager()
@@ -63,8 +76,8 @@ class BatchManager:
             self.working_dir = Path(self.main_config["main_config"]["output_dir"])
             self.new_input_path = self.working_dir / "start_input_files"
             self.new_json_file = self.working_dir / "new_input.csv"
-            input_json_file = self.working_dir / "job_backup.json"
-            self.job_dict = self._jobs_from_backup_json(input_json_file)
+            self.job_store = create_job_store(self.main_config, self.working_dir)
+            self.job_dict = self._jobs_from_backup_dict(self.job_store.load())
 
             self.work_managers = self.setup_work_modules_manager()
 
@@ -127,7 +140,7 @@ class BatchManager:
             json_file_path (str): The path to the initial JSON file.
 
         Returns:
-            dict: A dictionary of job objects, where the keys are the unique job IDs.
+            JobRegistry: A dictionary of job objects, where the keys are the unique job IDs.
         """
         input_mol_dict = read_mol_input_json(json_file_path)
 
@@ -151,51 +164,64 @@ class BatchManager:
                 job = Job(job_id, combination, self.working_dir, charge, multiplicity)
                 jobs.append(job)
         # search for jobs that have the same steps.
+        self._build_step_graph(jobs)
 
-        if self.main_config["main_config"]["parallel_layer_run"]:
-            for job1 in jobs:
-                for job2 in jobs:
-
-                    # test if jobs are elligible for overlap
-                    if job1 == job2:
-                        continue
-                    if job1.mol_id != job2.mol_id:
-                        continue
-
-                    # test if they have overlapping pathways
-                    for i in range(len(job1.all_keys)):
-                        if job1.all_keys[:i] == job2.all_keys[:i] and job1.all_keys[:i]:
-
-                            if job2 not in job1.overlapping_jobs:
-                                job1.overlapping_jobs.append(job2)
-                            if job1 not in job2.overlapping_jobs:
-                                job2.overlapping_jobs.append(job1)
-
-        job_dict = {job.unique_job_id: job for job in jobs}
+        job_dict = JobRegistry(jobs)
         return job_dict
 
     def _jobs_from_backup_json(self, json_file_path):
         """
-        Creates job objects from a backup JSON file.
+        Creates job objects from a backup JSON file and the job journal next to it.
 
         Args:
             json_file_path (str): The path to the backup JSON file.
 
         Returns:
-            dict: A dictionary of job objects, where the keys are the unique job IDs.
+            JobRegistry: A dictionary of job objects, where the keys are the unique job IDs.
+        """
+        return self._jobs_from_backup_dict(read_job_backup(json_file_path))
+
+    def _jobs_from_backup_dict(self, job_backup):
+        """
+        Creates job objects from exported job dicts.
+
+        Args:
+            job_backup (dict): unique_job_id -> exported job dict, as returned by the job store.
+
+        Returns:
+            JobRegistry: A dictionary of job objects, where the keys are the unique job IDs.
         """
         # prepare all job ids
-        job_dict = {}
-        with open(json_file_path, "r", encoding="utf-8") as json_file:
-            job_backup = json.load(json_file)
+        job_dict = JobRegistry()
 
         for job_id_backup, job_dict_backup in tqdm(job_backup.items()):
             job_dict[job_id_backup] = Job.import_from_dict(
                 job_dict_backup, self.working_dir
             )
+        self._build_step_graph(job_dict.values())
 
         return job_dict
 
+    def _build_step_graph(self, jobs):
+        """
+        Connect the jobs that share calculation steps.
+
+        Each shared step is only submitted once, by the first job passing through it.
+
+        Args:
+            jobs (Iterable[Job]): The jobs of the batch run.
+        """
+        jobs = list(jobs)
+        self.step_graph = build_step_graph(jobs)
+
+        # the file handler of self.log is only set up after the jobs are created
+        logging.getLogger("BatchManager").info(
+            "%d jobs with %d steps need %d calculations.",
+            len(jobs),
+            sum(len(job.all_keys) for job in jobs),
+            len(self.step_graph),
+        )
+
     def setup_work_modules_manager(self):
         """
         Sets up the work managers based on the main configuration.
@@ -205,10 +231,66 @@ class BatchManager:
         """
         work_managers = defaultdict(list)
 
+        # all work managers share one client to limit the load on the slurm controller
+        main_config = self.main_config["main_config"]
+        self.slurm_client = SlurmClient(
+            max_parallel_calls=main_config.get("max_parallel_slurm_calls", 4),
+            timeout=main_config.get("slurm_call_timeout", 120),
+            retries=main_config.get("slurm_call_retries", 3),
+        )
+        # one sacct call per tick for the jobs of all layers
+        sacct_poll_interval = main_config.get(
+            "sacct_poll_interval", main_config["wait_for_results_time"] / 2
+        )
+        completion_spool = None
+        if main_config.get("use_completion_spool", False):
+            # the jobs report their end through the spool, sacct only reconciles lost records
+            completion_spool = CompletionSpool(self.working_dir / completion_spool_name)
+            sacct_poll_interval = main_config.get(
+                "completion_reconcile_interval",
+                main_config["wait_for_results_time"] * 10,
+            )
+        self.sacct_poller = SacctPoller(
+            self.slurm_client,
+            max_age=sacct_poll_interval,
+            completion_spool=completion_spool,
+        )
+
+        # output files of all layers are parsed in one process pool
+        self.result_parser = ResultParser(
+            max_workers=main_config.get("max_parse_workers", None),
+            timeout=main_config.get("result_parse_timeout", 600),
+            use_cclib=main_config.get("parse_with_cclib", False),
+            use_content_hash=main_config.get("parse_content_hash", True),
+        )
+
+        # the results of done jobs are packed while the other jobs are still running
+        self.campaign_archiver = CampaignArchiver(
+            self.working_dir,
+            max_workers=main_config.get("max_archive_workers", None),
+            compression=main_config.get("archive_compression", "deflated"),
+            compresslevel=main_config.get("archive_compression_level", None),
+            exclude_patterns=main_config.get("archive_exclude_patterns", []),
+        )
+
+        # the jobs hand their cleaned up step dirs to the archiver of the registry
+        self.step_archiver = StepArchiver(
+            steps_per_archive=main_config.get("steps_per_step_archive", 1000),
+            compression=main_config.get("step_archive_compression", "deflated"),
+            compresslevel=main_config.get("archive_compression_level", None),
+        )
+        self.job_dict.step_archiver = self.step_archiver
+
         for key, value in self.main_config["loop_config"].items():
             if value["type"] == "orca":
                 orca_module = OrcaModule(self.main_config, key)
-                work_manager = WorkManager(orca_module, job_dict=self.job_dict)
+                work_manager = WorkManager(
+                    orca_module,
+                    job_dict=self.job_dict,
+                    slurm_client=self.slurm_client,
+                    sacct_poller=self.sacct_poller,
+                    result_parser=self.result_parser,
+                )
                 work_managers[work_manager.step_id].append(work_manager)
 
             elif value["type"] == "crest":
@@ -248,11 +330,28 @@ class BatchManager:
     def advance_jobs(self):
         """
         Advances all jobs to the next step.
+
+        Only the finished and failed jobs are advanced, all other jobs are counted as "not_finished"
+        from the job state table. Done jobs without step dirs are settled,
+        they are counted with their last result until they change again.
         """
+        state_table = self.job_dict.state_table
         advancement_dict = defaultdict(lambda: 0)
-        for job in self.job_dict.values():
+
+        n_waiting = state_table.count_waiting()
+        if n_waiting:
+            advancement_dict["not_finished"] += n_waiting
+
+        for job in state_table.get_jobs(state_table.rows_to_advance()):
             advancement_output = job.advance_to_next_key()
             advancement_dict[advancement_output] += 1
+            if is_job_done(job):
+                self.campaign_archiver.archive_job(job)
+                if not job.get_step_dirs():
+                    state_table.settle(job, advancement_output)
+
+        for advancement_output, num in state_table.count_settled().items():
+            advancement_dict[advancement_output] += num
 
         log_message = "Advancement dict: "
         for key, value in advancement_dict.items():
@@ -277,18 +376,14 @@ class BatchManager:
 
         return manager_runs
 
-    def save_current_jobs(self):
+    def save_current_jobs(self, compact=False):
         """
-        Saves the current jobs to a backup JSON file.
-        """
-        job_backup = {}
-        for job in self.job_dict.values():
-            job_backup[job.unique_job_id] = job.export_as_dict()
+        Saves the jobs that changed since the last save to the job store.
 
-        with open(
-            self.working_dir / "job_backup.json", "w", encoding="utf-8"
-        ) as json_file:
-            json.dump(job_backup, json_file, indent=4)
+        Args:
+            compact (bool, optional): Write a complete job_backup.json now. Defaults to False.
+        """
+        self.job_store.save(self.job_dict, compact=compact)
 
     async def batch_processing_loop(self):
         """
@@ -304,6 +399,8 @@ class BatchManager:
         while True:
             self.advance_jobs()
             self.save_current_jobs()
+            # the jobs of this loop only changed the results indices in memory
+            write_results_indices()
             i += 1
 
             if all([task.done() for task in manager_tasks]):
@@ -317,18 +414,22 @@ class BatchManager:
             await asyncio.sleep(self.wait_time)
             if self.show_current_job_status:
                 self.collect_current_job_status()
+
+        # leave a complete job_backup.json for the result collection
+        self.save_current_jobs(compact=True)
+        write_results_indices()
         return manager_tasks
 
     def collect_current_job_status(self):
 
+        state_table = self.job_dict.state_table
         status_dict = defaultdict(lambda: 0)
-
-        for job in self.job_dict.values():
-            status = job.current_status
-            status_dict[status] += 1
-            for key, status in job.status_per_key.items():
-                if key != job.current_key:
-                    status_dict[status] += 1
+        for status, num in state_table.count_statuses().items():
+            status_dict[status] += num
+        for status, num in state_table.count_key_statuses(
+            exclude_current_key=True
+        ).items():
+            status_dict[status] += num
 
         progress_msg = "Current jobs status: "
         # possible states are: submitted, failed, finished
@@ -342,15 +443,14 @@ class BatchManager:
         """
         Collects the result overview of the jobs.
         """
+        state_table = self.job_dict.state_table
         status_dict = defaultdict(lambda: 0)
-        failed_set = set()
-        for job in self.job_dict.values():
-
-            if job.current_status == "failed":
-                status_dict[job.failed_reason] += 1
-                failed_set.add(job.failed_reason)
-
-            status_dict[job.current_status] += 1
+        failed_reasons = state_table.count_failed_reasons()
+        failed_set = set(failed_reasons)
+        for status, num in failed_reasons.items():
+            status_dict[status] += num
+        for status, num in state_table.count_statuses().items():
+            status_dict[status] += num
 
         log_message = "Status overview: \n"
         for status, num in status_dict.items():
@@ -360,6 +460,7 @@ class BatchManager:
                 log_message += f"\t{num} jobs failed in total. \n"
             else:
                 log_message += f"\t{num} jobs with {status} \n"
+        log_message += f"\t{state_table.count_restarted()} jobs were restarted after a walltime error. \n"
         self.log.info(log_message)
         return status_dict
 
@@ -396,23 +497,16 @@ class BatchManager:
         self.create_config_entry()
 
         task_results = asyncio.run(self.batch_processing_loop())
+        self.result_parser.shutdown()
+        self.step_archiver.shutdown()
         result_dict = self.collect_result_overview()
 
-        # create a zip ball of the output directory
+        # collect the parsed results into one store, which is part of the zip ball
+        write_result_store(self.working_dir / "finished" / "raw_results")
 
+        # the results of the jobs are already packed, only the remaining files are added now
         output_filename = self.working_dir / f"{self.working_dir.stem}.zip"
-        source_dir = Path(self.working_dir)
-
-        # Find all subfolders and files
-        all_files = list(source_dir.glob("**/*"))
-
-        with zipfile.ZipFile(output_filename, "w") as zipf:
-            for file in all_files:
-                if file.is_file():  # Only add files, not directories
-                    zipf.write(
-                        str(file),
-                        str(file.relative_to(source_dir)),
-                    )
+        self.campaign_archiver.finalize(self.job_dict.values(), output_filename)
 
         # check tasks for errors:
         exit_code = 0
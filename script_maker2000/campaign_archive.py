@@ -0,0 +1,282 @@
+"""
+This module provides the campaign archive, which packs the output dir of a batch run into zip files.
+
+Packing a large batch run into one zip file after all calculations are done takes hours.
+The CampaignArchiver packs the final dirs of every job into its own part archive as soon as the job is done,
+in a thread pool while the other jobs are still running. At the end of the batch run only the remaining files
+(configs, logs, the result store, ...) are packed into the main archive, together with a manifest of the parts:
+
+- <output dir>/<output dir name>.zip: the remaining files and archive_manifest.json.
+- <output dir>/archive_parts/<unique job id>.zip: the final dirs of a job.
+
+The parts are shipped next to the main archive, the end of a batch run only merges their member lists
+into the manifest instead of copying them. All member names are relative to the output dir,
+`extract_campaign_archive` (or `script_maker_cli extract-archive`) restores the complete output dir.
+
+The compression is set with the optional "archive_compression" ("stored", "deflated", "bzip2" or "lzma")
+and "archive_compression_level" entries of the main config, files are skipped
+if their path relative to the output dir contains one of the "archive_exclude_patterns".
+"""
+
+import json
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+archive_parts_dir_name = "archive_parts"
+archive_manifest_name = "archive_manifest.json"
+
+compression_methods = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+
+def is_job_done(job):
+    """
+    Check if a job won't change its final dirs anymore.
+
+    Args:
+        job (Job): The job.
+
+    Returns:
+        bool: True if the job failed or finished its last key.
+    """
+    if job.current_status == "failed":
+        return True
+    return job.current_status == "finished" and job.current_key == job.all_keys[-1]
+
+
+def _write_zip(zip_path, files, base_dir, compression, compresslevel, texts=None):
+    """
+    Write the files into a new zip file and return the member names.
+    `texts` maps additional member names to their content.
+    """
+    members = []
+    # unique per thread, the zip file is only replaced once it is complete
+    tmp_zip_path = zip_path.with_name(
+        f"{zip_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    with zipfile.ZipFile(
+        tmp_zip_path, "w", compression=compression, compresslevel=compresslevel
+    ) as zipf:
+        for file in files:
+            arcname = file.relative_to(base_dir).as_posix()
+            zipf.write(file, arcname)
+            members.append(arcname)
+        for arcname, text in (texts or {}).items():
+            zipf.writestr(arcname, text)
+            members.append(arcname)
+    os.replace(tmp_zip_path, zip_path)
+    return members
+
+
+class CampaignArchiver:
+    """
+    Packs the results of a batch run into part archives while the batch run is still running.
+    """
+
+    def __init__(
+        self,
+        working_dir,
+        max_workers=None,
+        compression="deflated",
+        compresslevel=None,
+        exclude_patterns=None,
+    ):
+        """
+        Initializes a CampaignArchiver.
+
+        Args:
+            working_dir (str|Path): The output dir of the batch run.
+            max_workers (int, optional): Number of threads packing archives.
+                Defaults to None (number of CPUs, at most 4).
+            compression (str, optional): One of `compression_methods`. Defaults to "deflated".
+            compresslevel (int, optional): The compression level, see zipfile.ZipFile. Defaults to None.
+            exclude_patterns (list, optional): Skip files whose relative path contains one of the patterns.
+                Defaults to None.
+
+        Raises:
+            ValueError: If the compression is unknown.
+        """
+        if compression not in compression_methods:
+            raise ValueError(
+                f"Unknown archive compression {compression}, use one of {list(compression_methods)}."
+            )
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+
+        self.working_dir = Path(working_dir)
+        self.parts_dir = self.working_dir / archive_parts_dir_name
+        self.max_workers = max(int(max_workers), 1)
+        self.compression = compression_methods[compression]
+        self.compresslevel = compresslevel
+        self.exclude_patterns = list(exclude_patterns or [])
+
+        self.log = logging.getLogger("CampaignArchiver")
+
+        self._executor = None
+        # unique job id -> (archived final dirs, future returning the member names)
+        self._parts = {}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="CampaignArchiver"
+            )
+        return self._executor
+
+    def is_excluded(self, file):
+        relative_path = file.relative_to(self.working_dir).as_posix()
+        return any(pattern in relative_path for pattern in self.exclude_patterns)
+
+    def get_part_path(self, job):
+        return self.parts_dir / f"{job.unique_job_id}.zip"
+
+    def _write_part(self, part_path, final_dirs):
+        files = []
+        for final_dir in final_dirs:
+            if final_dir.is_dir():
+                files.extend(
+                    file
+                    for file in sorted(final_dir.rglob("*"))
+                    if file.is_file() and not self.is_excluded(file)
+                )
+        return _write_zip(
+            part_path, files, self.working_dir, self.compression, self.compresslevel
+        )
+
+    def archive_job(self, job):
+        """
+        Pack the final dirs of a done job into its part archive in the background.
+        A job is only packed again if its final dirs changed.
+
+        Args:
+            job (Job): The job, see `is_job_done`.
+        """
+        final_dirs = tuple(sorted(Path(path) for path in job.final_dirs.values()))
+        if job.unique_job_id in self._parts:
+            archived_dirs, future = self._parts[job.unique_job_id]
+            if archived_dirs == final_dirs:
+                return
+            # don't let the old part replace the new one
+            future.result()
+
+        self.parts_dir.mkdir(exist_ok=True)
+        future = self.executor.submit(
+            self._write_part, self.get_part_path(job), final_dirs
+        )
+        self._parts[job.unique_job_id] = (final_dirs, future)
+
+    def finalize(self, jobs, output_file):
+        """
+        Wait for the part archives and pack all other files of the output dir into the main archive.
+
+        Jobs that were done before the archiver was started are packed now,
+        unless their part archive was written by a previous run.
+
+        Args:
+            jobs (iterable): All jobs of the batch run.
+            output_file (str|Path): The main archive.
+
+        Returns:
+            Path: The main archive.
+        """
+        output_file = Path(output_file)
+
+        done_job_ids = set()
+        existing_parts = {}
+        for job in jobs:
+            if not is_job_done(job):
+                continue
+            done_job_ids.add(job.unique_job_id)
+            part_path = self.get_part_path(job)
+            if job.unique_job_id not in self._parts and part_path.exists():
+                # the final dirs don't change once a job is done
+                existing_parts[job.unique_job_id] = part_path
+            else:
+                self.archive_job(job)
+
+        manifest = {"parts": {}}
+        for unique_job_id, (_, future) in self._parts.items():
+            part_path = self.parts_dir / f"{unique_job_id}.zip"
+            members = future.result()
+            if unique_job_id not in done_job_ids:
+                # e.g. a failed job that was restarted and didn't finish again
+                part_path.unlink(missing_ok=True)
+                continue
+            manifest["parts"][
+                part_path.relative_to(self.working_dir).as_posix()
+            ] = members
+        for part_path in existing_parts.values():
+            with zipfile.ZipFile(part_path, "r") as zipf:
+                manifest["parts"][
+                    part_path.relative_to(self.working_dir).as_posix()
+                ] = zipf.namelist()
+        self.shutdown()
+
+        archived_members = {
+            member for members in manifest["parts"].values() for member in members
+        }
+        remaining_files = []
+        for file in sorted(self.working_dir.rglob("*")):
+            if not file.is_file() or self.parts_dir in file.parents:
+                continue
+            # the main archive of a previous run and the temporary file of this one
+            if file.parent == output_file.parent and file.name.startswith(
+                output_file.name
+            ):
+                continue
+            if file.relative_to(self.working_dir).as_posix() in archived_members:
+                continue
+            if self.is_excluded(file):
+                continue
+            remaining_files.append(file)
+
+        self.log.info(
+            f"Packing {len(remaining_files)} files into {output_file}, "
+            + f"{len(archived_members)} files are in {len(manifest['parts'])} part archives."
+        )
+        _write_zip(
+            output_file,
+            remaining_files,
+            self.working_dir,
+            self.compression,
+            self.compresslevel,
+            texts={archive_manifest_name: json.dumps(manifest)},
+        )
+
+        return output_file
+
+    def shutdown(self):
+        """Wait for the running part archives and stop the threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def extract_campaign_archive(archive_file, extract_path):
+    """
+    Extract a main archive and all part archives listed in its manifest.
+
+    Args:
+        archive_file (str|Path): The main archive, the part archives are expected next to it.
+        extract_path (str|Path): The dir to restore the output dir in.
+    """
+    archive_file = Path(archive_file)
+    with zipfile.ZipFile(archive_file, "r") as zipf:
+        zipf.extractall(extract_path)
+        if archive_manifest_name not in zipf.namelist():
+            # archives of older batch runs contain all files
+            return
+        manifest = json.loads(zipf.read(archive_manifest_name))
+
+    for part in manifest["parts"]:
+        with zipfile.ZipFile(archive_file.parent / part, "r") as zipf:
+            zipf.extractall(extract_path)
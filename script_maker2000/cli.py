@@ -10,6 +10,8 @@ from threading import Timer
 from script_maker2000.dash_ui.dash_main_gui import create_main_app
 from script_maker2000 import BatchManager
 from script_maker2000.remote_connection import RemoteConnection
+from script_maker2000.job_store import read_job_status_counts
+from script_maker2000.campaign_archive import extract_campaign_archive
 
 from script_maker2000.files import (
     check_config,
@@ -453,3 +455,40 @@ def collect_results(results_path, exclude_patterns=None):
     click.echo(f"zip file created at {result_zip}")
 
     return 0
+
+
+@script_maker_cli.command()
+@click.option("--results_path", "-r", help="Path to the output folder of a batch run.")
+@click.option(
+    "--per_key", is_flag=True, help="Count the status per config key instead."
+)
+def job_status(results_path, per_key=False):
+    """Print the number of jobs per status as json."""
+
+    try:
+        status_counts = read_job_status_counts(Path(results_path), per_key=per_key)
+    except FileNotFoundError as e:
+        click.echo(f"Error reading the job status: {e}")
+        return 1
+
+    click.echo(json.dumps(status_counts, indent=4))
+    return 0
+
+
+@script_maker_cli.command()
+@click.option(
+    "--zip", "-z", "zip_file", help="Path to the main archive of a batch run."
+)
+@click.option(
+    "--extract_path", "-e", default=".", help="Path to restore the output dir in."
+)
+def extract_archive(zip_file, extract_path):
+    """Restore the output dir of a batch run from its main archive and the part archives in it."""
+
+    if zip_file is None or not Path(zip_file).exists():
+        click.echo(f"zip file not found at {zip_file}")
+        return 1
+
+    extract_campaign_archive(zip_file, extract_path)
+    click.echo(f"Archive extracted at {Path(extract_path).resolve()}")
+    return 0
@@ -197,6 +197,10 @@ def create_results_table():
                                             "label": "kJ/mol",
                                             "value": "kJ/mol",
                                         },
+                                        {
+                                            "label": "1/cm",
+                                            "value": "wavenumber",
+                                        },
                                     ],
                                     value="kJ/mol",
                                     style={"width": "50%"},
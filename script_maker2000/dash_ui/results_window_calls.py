@@ -5,7 +5,6 @@ import pandas as pd
 from tempfile import mkdtemp
 from collections import defaultdict
 import zipfile
-import cclib
 import numpy as np
 import plotly.graph_objects as go
 import os
@@ -17,10 +16,22 @@ from script_maker2000.files import (
     add_dir_to_config,
 )
 from script_maker2000.analysis import (
-    extract_infos_from_results,
+    convert_energies,
+    get_coords_frame,
     parse_output_file,
     plot_ir_spectrum,
 )
+from script_maker2000.job_store import read_job_status_counts, count_job_status
+from script_maker2000.results_index import (
+    find_raw_results_dirs,
+    get_results_index,
+    get_results_index_file,
+)
+from script_maker2000.result_store import (
+    extract_infos_from_store,
+    extract_result_details,
+    get_result_store_dir,
+)
 
 new_tmpdir = mkdtemp()
 
@@ -138,37 +149,50 @@ def get_job_progress_dict_(
         return None
 
     if remote_local_switch == "local":
-        result_location = Path(calculation_dir) / "job_backup.json"
-
-        if not Path(result_location).exists():
+        try:
+            status_counts = read_job_status_counts(calculation_dir)
+        except FileNotFoundError:
             error_message = "Error: The job progress file was not found "
-            error_message += f"at the specified location '{result_location}'."
+            error_message += f"at the specified location '{calculation_dir}'."
 
             return {"ERROR": error_message}
 
     elif remote_local_switch == "remote":
-        progress_json = calculation_dir + "/job_backup.json"
-        backup_json = Path(new_tmpdir) / "job_backup.json"
+        # count the jobs on the remote, this avoids downloading all jobs
+        status_result = remote_connection.run(
+            "ml devel/python/3.11.4 >/dev/null ;script_maker_cli job-status "
+            + f"--results_path {calculation_dir}",
+            hide=True,
+            warn=True,
+            timeout=120,
+        )
         try:
-            result_location = remote_connection.get(progress_json, str(backup_json))
-            result_location = result_location.local
+            status_counts = json.loads(status_result.stdout)
+        except json.JSONDecodeError:
+            status_counts = None
 
-        except FileNotFoundError:
-            error_message = "Error: The job progress file was not found "
-            error_message += f"at the specified location '{progress_json}'.\n"
+        # older versions of the script manager can't count the jobs themselves
+        if status_result.return_code != 0 or not isinstance(status_counts, dict):
+            progress_json = calculation_dir + "/job_backup.json"
+            backup_json = Path(new_tmpdir) / "job_backup.json"
+            try:
+                result_location = remote_connection.get(progress_json, str(backup_json))
+                result_location = result_location.local
 
-            if "\\" in calculation_dir and remote_local_switch == "remote":
-                error_message += (
-                    "It seems you have given a windows path to a remote calculation. "
-                )
-                +"Please use a linux path instead.\n"
+            except FileNotFoundError:
+                error_message = "Error: The job progress file was not found "
+                error_message += f"at the specified location '{progress_json}'.\n"
 
-            return {"ERROR": error_message}
+                if "\\" in calculation_dir and remote_local_switch == "remote":
+                    error_message += "It seems you have given a windows path to a remote calculation. "
+                    +"Please use a linux path instead.\n"
+
+                return {"ERROR": error_message}
 
-    with open(result_location, "r") as f:
-        job_progress_dict = json.load(f)
+            with open(result_location, "r") as f:
+                status_counts = count_job_status(json.load(f))
 
-    return {calculation_dir: job_progress_dict}
+    return {calculation_dir: status_counts}
 
 
 def get_jobs_overview(job_progress_dict):
@@ -176,20 +200,12 @@ def get_jobs_overview(job_progress_dict):
     if job_progress_dict is None:
         return ""
 
-    calculation_dir, job_progress_dict = list(job_progress_dict.items())[0]
+    calculation_dir, status_dict = list(job_progress_dict.items())[0]
 
     if calculation_dir == "ERROR":
-        return job_progress_dict
+        return status_dict
 
-    status_dict = defaultdict(lambda: 0)
-
-    for unique_job in job_progress_dict.values():
-        current_status = unique_job["_current_status"]
-        if current_status == "failed":
-            status_dict[unique_job["failed_reason"]] += 1
-            continue
-
-        status_dict[current_status] += 1
+    status_dict = defaultdict(lambda: 0, status_dict)
 
     output_string = f"Status overivew for {calculation_dir}: \n"
 
@@ -308,9 +324,14 @@ def _get_all_mol_dirs_in_finished_dirs(config_dict, files_filter_value):
         return all(filter not in sub_dir_name for filter in filters)
 
     def parse_if_needed(sub_dir, failed_reason=None):
+        # the output is only parsed if the results are missing or outdated,
+        # the content hash recognizes outputs that were downloaded from the cluster
+        output_file = sub_dir / f"{sub_dir.stem}.out"
         result_file = sub_dir / f"{sub_dir.stem}_calc_result.json"
-        if not result_file.exists():
-            parse_output_file(sub_dir, failed_reason=failed_reason)
+        if output_file.exists() or not result_file.exists():
+            parse_output_file(
+                sub_dir, failed_reason=failed_reason, use_content_hash=True
+            )
 
     all_output_dict = {"title": "Calculation Overview:", "key": "all", "children": []}
 
@@ -324,53 +345,33 @@ def _get_all_mol_dirs_in_finished_dirs(config_dict, files_filter_value):
         }
 
         for finished_dir in finished_dirs:
-            finished_dir_path = Path(finished_dir)
-
-            for mol_main_dir in finished_dir_path.glob("**/raw_results/*"):
-                mol_main_dict = {
-                    "title": mol_main_dir.stem,
-                    "key": f"__main__{str(mol_main_dir)}",
-                    "children": [],
-                }
-
-                for mol_sub_dir in mol_main_dir.glob("*"):
-                    if "failed" in mol_sub_dir.stem:
-
-                        failed_dir = mol_sub_dir
-                        for failed_reason_dir in failed_dir.glob("*"):
-                            for failed_mol_dir in failed_reason_dir.glob("*"):
-                                if should_skip_file(
-                                    failed_mol_dir.stem, files_filter_value
-                                ):
-                                    continue
-                                parse_if_needed(
-                                    failed_mol_dir, failed_reason=failed_reason_dir.stem
-                                )
-                                mol_main_dict["children"].append(
-                                    {
-                                        "title": failed_mol_dir.stem,
-                                        "key": "__failed__" + str(failed_mol_dir),
-                                        "children": [],
-                                    }
-                                )
-
+            for raw_results_dir in find_raw_results_dirs(finished_dir):
+                # only dirs that changed since the last call are listed again
+                results_index = get_results_index(raw_results_dir)
+                for calc_dir, failed_reason in results_index.refresh():
+                    parse_if_needed(calc_dir, failed_reason=failed_reason)
+
+                mol_main_dicts = {}
+                for mol_main_dir, calc_dir, failed_reason in results_index.iter_calcs():
+                    if should_skip_file(calc_dir.stem, files_filter_value):
                         continue
-                    else:
-                        parse_if_needed(mol_sub_dir)
-
-                        if should_skip_file(mol_sub_dir.stem, files_filter_value):
-                            continue
-
-                        mol_main_dict["children"].append(
-                            {
-                                "title": mol_sub_dir.stem,
-                                "key": str(mol_sub_dir),
-                                "children": [],
-                            }
+
+                    if mol_main_dir not in mol_main_dicts:
+                        mol_main_dicts[mol_main_dir] = {
+                            "title": mol_main_dir.stem,
+                            "key": f"__main__{str(mol_main_dir)}",
+                            "children": [],
+                        }
+                        tree_config_dict["children"].append(
+                            mol_main_dicts[mol_main_dir]
                         )
 
-                if mol_main_dict["children"]:
-                    tree_config_dict["children"].append(mol_main_dict)
+                    key = str(calc_dir)
+                    if failed_reason is not None:
+                        key = "__failed__" + key
+                    mol_main_dicts[mol_main_dir]["children"].append(
+                        {"title": calc_dir.stem, "key": key, "children": []}
+                    )
 
         if tree_config_dict["children"]:
             all_output_dict["children"].append(tree_config_dict)
@@ -408,6 +409,67 @@ def create_results_file_tree(files_filter_value):
     return raw_tree_dict
 
 
+# entries of the result files needed for the column groups of the result table
+table_column_entries = {
+    "mol_info": ["charge", "mult", "natom", "nbasis", "nmo"],
+    "calc_setup": ["metadata", "optdone", "connectivity_check"],
+    "energies": ["final_sp_energy", "scfenergies", "ccenergies", "energy_corrections"],
+    "thermo": ["enthalpy", "entropy", "freeenergy", "zpve", "temperature", "vibfreqs"],
+}
+
+
+# results table of the last selection in eV and converted to the energy units, so changing the unit is instant
+_results_table_cache = {}
+
+
+def _get_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _get_results_fingerprint(selected_data):
+    """
+    Get the modification times of the files that change when the results of the selected dirs change.
+
+    Results are added to the raw_results dir of a batch run together with its results index,
+    the result store is written at the end of the run. Dirs outside of a raw_results dir use their own
+    modification time.
+
+    Args:
+        selected_data (list): The selected dirs.
+
+    Returns:
+        tuple: The modification times, changed if the results might have changed.
+    """
+    fingerprint_files = set()
+    for selected_dir in selected_data:
+        selected_dir = Path(selected_dir)
+        for parent in [selected_dir] + list(selected_dir.parents):
+            if parent.name == "raw_results":
+                fingerprint_files.add(get_results_index_file(parent))
+                fingerprint_files.add(get_result_store_dir(parent) / "table.json")
+                break
+        else:
+            fingerprint_files.add(selected_dir)
+    return tuple((str(path), _get_mtime_ns(path)) for path in sorted(fingerprint_files))
+
+
+def _convert_table_energies(records, energy_keys, energy_unit):
+    converted_records = [dict(record) for record in records]
+    for energy_key in energy_keys:
+        rows = [
+            i for i, record in enumerate(records) if record.get(energy_key) is not None
+        ]
+        if not rows:
+            continue
+        energies = convert_energies([records[i][energy_key] for i in rows], energy_unit)
+        for i, energy in zip(rows, energies.tolist()):
+            converted_records[i][energy_key] = energy
+    return converted_records
+
+
 def update_table_values(
     tree_dict_selected, table_column_input, energy_unit_select, complete_table_data
 ):
@@ -428,9 +490,48 @@ def update_table_values(
 
         selected_data.append(selected_entry)
 
-    table_data, corrections_list = extract_infos_from_results(selected_data)
+    # the cached table is kept until the selection, the columns or the results change,
+    # the complete results store is reset when new results are downloaded
+    table_key = (
+        tuple(selected_data),
+        tuple(table_column_input),
+        _get_results_fingerprint(selected_data),
+    )
+    if _results_table_cache.get("key") != table_key or not complete_table_data:
+        _results_table_cache.clear()
+        _results_table_cache["key"] = table_key
+        (
+            _results_table_cache["records"],
+            _results_table_cache["columns"],
+            _results_table_cache["complete_table_data"],
+            _results_table_cache["energy_keys"],
+        ) = _build_results_table(selected_data, table_column_input)
+
+    records_per_unit = _results_table_cache["records"]
+    if energy_unit_select not in records_per_unit:
+        records_per_unit[energy_unit_select] = _convert_table_energies(
+            records_per_unit["eV"],
+            _results_table_cache["energy_keys"],
+            energy_unit_select,
+        )
+    return (
+        records_per_unit[energy_unit_select],
+        _results_table_cache["columns"],
+        _results_table_cache["complete_table_data"],
+    )
+
 
-    complete_table_data = table_data
+def _build_results_table(selected_data, table_column_input):
+    # only the entries of the selected columns are read, the details are loaded when a row is selected
+    entries = ["Failed"]
+    for column_group in table_column_input:
+        entries.extend(table_column_entries.get(column_group, []))
+    table_data, corrections_list = extract_infos_from_store(selected_data, entries)
+
+    complete_table_data = {
+        name: {"dirname": entry["dirname"], "filename": entry["filename"]}
+        for name, entry in table_data.items()
+    }
 
     columns_mol_info = [
         {"name": ["Molecular Informations", "Failed"], "id": "Failed"},
@@ -486,31 +587,22 @@ def update_table_values(
     if "thermo" in table_column_input:
         columns.extend(columns_thermo)
 
-    table_df = pd.DataFrame(table_data).T
-
     column_ids = [x["id"] for x in columns]
-    for df_column in table_df.columns:
-        if df_column not in column_ids:
-            table_df.drop(df_column, axis=1, inplace=True)
-
-    if energy_unit_select != "eV":
-        energy_keys = [
-            "final_sp_energy",
-            "scfenergies",
-            "total_correction",
-            "enthalpy",
-            "freeenergy",
-            "zpve",
-        ]
-        energy_keys.extend(corrections_list)
-        for energy_key in energy_keys:
-            if energy_key not in table_df.columns:
-                continue
+    records = [
+        {column_id: entry[column_id] for column_id in column_ids if column_id in entry}
+        for entry in table_data.values()
+    ]
 
-            table_df[energy_key] = table_df[energy_key].apply(
-                lambda x: cclib.parser.utils.convertor(x, "eV", energy_unit_select)
-            )
-    return table_df.to_dict("records"), columns, complete_table_data
+    energy_keys = [
+        "final_sp_energy",
+        "scfenergies",
+        "total_correction",
+        "enthalpy",
+        "freeenergy",
+        "zpve",
+    ]
+    energy_keys.extend(corrections_list)
+    return {"eV": records}, columns, complete_table_data, energy_keys
 
 
 def download_table_data(
@@ -533,7 +625,14 @@ def update_detailed_screen_header(selected_row, table_data, complete_table_data)
     index = selected_row[-1]
     table_entry = table_data[index]
 
-    complete_table_entry = complete_table_data[table_entry["filename"]]
+    # the table only holds the selected columns, all results of the row are read now
+    table_row = complete_table_data[table_entry["filename"]]
+    complete_table_entry = extract_result_details(
+        table_row["dirname"], table_row["filename"]
+    )
+    if complete_table_entry is None:
+        # e.g. the results were moved or removed since the table was loaded
+        return f"No results found for {table_row['filename']}.", {}, False
     return f"Details for {complete_table_entry['filename']}", complete_table_entry, True
 
 
@@ -542,17 +641,17 @@ def update_xyz_slider(table_entry):
     if table_entry is None:
         return 0, 0, 1, {0: "0"}, False
 
-    coords = table_entry["coords"]
+    n_steps = len(table_entry["coords"]["positions"])
 
-    if len(coords) == 1:
+    if n_steps == 1:
         step = 1
         marks = {1: "1"}
         is_in = False
     else:
         step = 1
-        marks = {int(i): str(int(i)) for i in np.linspace(0, len(coords), 8, dtype=int)}
+        marks = {int(i): str(int(i)) for i in np.linspace(0, n_steps, 8, dtype=int)}
         is_in = True
-    return len(coords) - 1, len(coords) - 1, step, marks, is_in
+    return n_steps - 1, n_steps - 1, step, marks, is_in
 
 
 def update_xyz_data(slider_value, table_entry):
@@ -560,9 +659,7 @@ def update_xyz_data(slider_value, table_entry):
     if table_entry is None or slider_value is None:
         return None
 
-    coords = list(table_entry["coords"].values())
-    data = coords[slider_value]
-    return data
+    return get_coords_frame(table_entry["coords"], slider_value)
 
 
 def update_energy_convergence_plot(table_entry, energy_unit_select):
@@ -574,13 +671,7 @@ def update_energy_convergence_plot(table_entry, energy_unit_select):
         return go.Figure(), False
 
     index = np.arange(len(table_entry["final_energy_path"]))
-    energies = table_entry["final_energy_path"]
-
-    if energy_unit_select != "eV":
-        energies = [
-            float(cclib.parser.utils.convertor(x, "eV", energy_unit_select))
-            for x in energies
-        ]
+    energies = convert_energies(table_entry["final_energy_path"], energy_unit_select)
 
     fig = go.Figure(data=go.Scatter(x=index, y=energies))
 
@@ -9,6 +9,8 @@ import os
 import copy
 import re
 
+from script_maker2000.staging import make_dirs, stage_file
+
 batchLogger = logging.getLogger("BatchManager")
 
 
@@ -75,14 +77,15 @@ def create_working_dir_structure(
     sub_dir_names = [pathlib.Path(key) for key in main_config["loop_config"]]
     batchLogger.info(f"Creating subfolders: {sub_dir_names}")
 
-    for subfolder in sub_dir_names:
-        if main_config["main_config"]["continue_previous_run"] is False:
-            # Create input, output, finished, and failed folders for each subfolder
-            (output_dir / "working" / subfolder / "input").mkdir(parents=True)
-            (output_dir / "working" / subfolder / "output").mkdir(parents=True)
-            (output_dir / "working" / subfolder / "finished").mkdir(parents=True)
-            (output_dir / "working" / subfolder / "failed").mkdir(parents=True)
+    if main_config["main_config"]["continue_previous_run"] is False:
+        # Create input, output, finished, and failed folders for each subfolder
+        make_dirs(
+            output_dir / "working" / subfolder / layer_dir
+            for subfolder in sub_dir_names
+            for layer_dir in ["input", "output", "finished", "failed"]
+        )
 
+        for subfolder in sub_dir_names:
             # Copy template files to sub-folder if the type is "orca"
             if main_config["loop_config"][str(subfolder)]["type"] == "orca":
                 slurm_template_path = (
@@ -115,7 +118,11 @@ def create_working_dir_structure(
         orig_file = pathlib.Path(entry["path"])
         batchLogger.info(orig_file)
         new_file_path = new_input_path / orig_file.name
-        shutil.copy(orig_file, new_file_path)
+        if new_file_path.exists():
+            shutil.copy(orig_file, new_file_path)
+        else:
+            # the original files belong to the user and might be edited, no hardlinks
+            stage_file(orig_file, new_file_path, hardlink=False)
         job_input[key]["path"] = str(new_file_path)
 
     new_json_file = output_dir / input_path.name
@@ -1,13 +1,332 @@
-import shutil
+from collections.abc import Mapping, MutableMapping
 from pathlib import Path
 import pint
 
+from script_maker2000.results_index import get_results_index
+from script_maker2000.staging import make_dirs, move_path, stage_file
+from script_maker2000.step_archive import pack_step_dirs
+
+# The statuses are stored as small integer codes, 0 means that there is no status.
+# Statuses that aren't listed here get the next free code when they are first used.
+job_statuses = [
+    None,
+    "not_assigned",
+    "not_found",
+    "already_finished",
+    "found",
+    "not_started",
+    "submitted",
+    "returned",
+    "finished",
+    "failed",
+    "missing_output",
+]
+_status_codes = {status: code for code, status in enumerate(job_statuses)}
+# statuses of older job backups -> current status
+# the followers of a submitted step were "submitted_overlapping_job", now the step node owns the status
+_legacy_statuses = {"submitted_overlapping_job": "submitted"}
+
+# current_dirs entry -> layer dirs below working/<config key>
+current_dir_layers = {
+    "input": ("input",),
+    "output": ("output",),
+    "finished": ("finished",),
+    "missing_ram_error": ("failed", "missing_ram_error"),
+    "walltime_error": ("failed", "walltime_error"),
+    "unknown_error": ("failed", "unknown_error"),
+    "missing_output": ("failed", "missing_output"),
+}
+
+
+def get_status_code(status):
+    """
+    Get the integer code of a status.
+
+    Args:
+        status (str): The status.
+
+    Returns:
+        int: The code, see `job_statuses`.
+    """
+    code = _status_codes.get(status)
+    if code is None:
+        code = _status_codes.setdefault(status, len(job_statuses))
+        if code == len(job_statuses):
+            job_statuses.append(status)
+    return code
+
+
+class KeyChain:
+    """
+    The config keys of a job together with the step id prefix of every key.
+    All jobs with the same keys share one KeyChain, see `JobLayout.get_key_chain`.
+    """
+
+    __slots__ = ("keys", "index", "step_prefixes")
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.step_prefixes = [
+            "__".join(self.keys[: i + 1]) for i in range(len(self.keys))
+        ]
+
+
+class JobLayout:
+    """
+    The directory layout of a batch run. All jobs of a working dir share one JobLayout,
+    their step dirs are derived from it when they are accessed instead of being stored per job.
+    """
+
+    __slots__ = ("working_dir", "raw_results_dir", "_layer_dirs", "_key_chains")
+
+    def __init__(self, working_dir):
+        """
+        Initializes a JobLayout.
+
+        Args:
+            working_dir (str|Path): The working directory of the batch run.
+        """
+        self.working_dir = Path(working_dir)
+        self.raw_results_dir = self.working_dir / "finished" / "raw_results"
+        # (config key, layers) -> Path
+        self._layer_dirs = {}
+        # tuple of config keys -> KeyChain
+        self._key_chains = {}
+
+    def get_key_chain(self, keys):
+        keys = tuple(keys)
+        key_chain = self._key_chains.get(keys)
+        if key_chain is None:
+            key_chain = self._key_chains[keys] = KeyChain(keys)
+        return key_chain
+
+    def layer_dir(self, key, layers):
+        """
+        Get a layer dir of a config key, e.g. working/<key>/failed/walltime_error.
+
+        Args:
+            key (str): The config key.
+            layers (tuple[str]): The dirs below working/<key>, see `current_dir_layers`.
+
+        Returns:
+            Path: The layer dir.
+        """
+        layer_dir = self._layer_dirs.get((key, layers))
+        if layer_dir is None:
+            layer_dir = self._layer_dirs[(key, layers)] = self.working_dir.joinpath(
+                "working", key, *layers
+            )
+        return layer_dir
+
+
+_job_layouts = {}
+
+
+def get_job_layout(working_dir):
+    """
+    Get the shared JobLayout of a working dir.
+
+    Args:
+        working_dir (str|Path): The working directory of the batch run.
+
+    Returns:
+        JobLayout: The layout.
+    """
+    working_dir = Path(working_dir)
+    job_layout = _job_layouts.get(working_dir)
+    if job_layout is None:
+        job_layout = _job_layouts[working_dir] = JobLayout(working_dir)
+    return job_layout
+
+
+class StepDirs(Mapping):
+    """The dirs of the current step of a job (see `current_dir_layers`), derived when they are accessed."""
+
+    __slots__ = ("_layout", "_key", "_step_id")
+
+    def __init__(self, layout, key, step_id):
+        self._layout = layout
+        self._key = key
+        self._step_id = step_id
+
+    def __getitem__(self, name):
+        return (
+            self._layout.layer_dir(self._key, current_dir_layers[name]) / self._step_id
+        )
+
+    def __iter__(self):
+        return iter(current_dir_layers)
+
+    def __len__(self):
+        return len(current_dir_layers)
+
+
+class DirsPerKey(Mapping):
+    """The dirs of one layer for all config keys of a job, derived when they are accessed."""
+
+    __slots__ = ("_job", "_layers")
+
+    def __init__(self, job, layers):
+        self._job = job
+        self._layers = layers
+
+    def __getitem__(self, key):
+        return self._job._layout.layer_dir(key, self._layers) / self._job.get_step_id(
+            key
+        )
+
+    def __iter__(self):
+        return iter(self._job.all_keys)
+
+    def __len__(self):
+        return len(self._job.all_keys)
+
+
+class StatusPerKey(MutableMapping):
+    """
+    The status of a job per config key. The statuses of the job's keys are stored as codes in a bytearray,
+    other keys (e.g. "not_assigned") in a small dict that is only created when needed.
+    The status of a step the job has reached is owned by its StepNode and takes precedence over the stored one.
+    """
+
+    __slots__ = ("_job",)
+
+    def __init__(self, job):
+        self._job = job
+
+    def __getitem__(self, key):
+        job = self._job
+        index = job._key_chain.index.get(key)
+        if index is None:
+            if job._extra_status is None:
+                raise KeyError(key)
+            return job._extra_status[key]
+        code = job._status_code_for(index)
+        if not code:
+            raise KeyError(key)
+        return job_statuses[code]
+
+    def __setitem__(self, key, status):
+        job = self._job
+        index = job._key_chain.index.get(key)
+        if index is None:
+            if job._extra_status is None:
+                job._extra_status = {}
+            job._extra_status[key] = status
+        else:
+            job._key_status[index] = get_status_code(status)
+
+    def __delitem__(self, key):
+        job = self._job
+        index = job._key_chain.index.get(key)
+        if index is None:
+            if job._extra_status is None:
+                raise KeyError(key)
+            del job._extra_status[key]
+        elif not job._key_status[index]:
+            raise KeyError(key)
+        else:
+            job._key_status[index] = 0
+
+    def __iter__(self):
+        job = self._job
+        for index, key in enumerate(job._key_chain.keys):
+            if job._status_code_for(index):
+                yield key
+        if job._extra_status is not None:
+            yield from list(job._extra_status)
+
+    def __len__(self):
+        job = self._job
+        n_extra = 0 if job._extra_status is None else len(job._extra_status)
+        codes = job.key_status_codes()
+        return len(codes) - codes.count(0) + n_extra
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class SlurmIdPerKey(MutableMapping):
+    """
+    The slurm id of a job per config key. The slurm id of a step the job has reached is owned by its StepNode,
+    the slurm ids of jobs without step nodes are stored in a dict of the job.
+    """
+
+    __slots__ = ("_job",)
+
+    def __init__(self, job):
+        self._job = job
+
+    def __getitem__(self, key):
+        node = self._job._reached_node(key)
+        if node is not None and node.slurm_id is not None:
+            return node.slurm_id
+        return self._job._slurm_ids[key]
+
+    def __setitem__(self, key, slurm_id):
+        node = self._job._reached_node(key)
+        if node is not None:
+            node.slurm_id = slurm_id
+        else:
+            self._job._slurm_ids[key] = slurm_id
+
+    def __delitem__(self, key):
+        node = self._job._reached_node(key)
+        if node is not None and node.slurm_id is not None:
+            node.slurm_id = None
+        else:
+            del self._job._slurm_ids[key]
+
+    def __iter__(self):
+        job = self._job
+        for key in job._key_chain.keys:
+            if key in self:
+                yield key
+        for key in list(job._slurm_ids):
+            if key not in job._key_chain.index:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 
 class Job:
     """This class will save all necessary information for a job.
     This includes current and past results, output and input files, and the main settings.
+
+    Jobs are kept in memory for every molecule and every combination of the layers,
+    so they only store their state: the config keys and statuses are stored as integer codes
+    and all dirs are derived from the shared JobLayout of the working dir.
     """
 
+    __slots__ = (
+        "mol_id",
+        "unique_job_id",
+        "current_step",
+        "current_step_id",
+        "input_file_types",
+        "charge",
+        "multiplicity",
+        "final_dirs",
+        "efficiency_data",
+        "finished_keys",
+        "iterations_per_key",
+        "step_nodes",
+        "_layout",
+        "_key_chain",
+        "_key_index",
+        "_current_status",
+        "_key_status",
+        "_extra_status",
+        "_failed_reason",
+        "_slurm_ids",
+        "_registry",
+    )
+
     def __init__(
         self,
         input_id,
@@ -27,58 +346,46 @@ class Job:
             multiplicity (int): The multiplicity of the job.
             input_file_types (list[str], optional): A list of input file types to consider. Defaults to [".xyz"].
         """
+        self._layout = get_job_layout(working_dir)
+        self._key_chain = self._layout.get_key_chain(all_keys)
 
         # public attributes
         self.mol_id = input_id
-        self.unique_job_id = "__".join(all_keys) + "___" + input_id
+        self.unique_job_id = self._key_chain.step_prefixes[-1] + "___" + input_id
         self.current_step = 0
         self.current_step_id = "START___" + input_id
-        self.all_keys = all_keys
-
-        if isinstance(working_dir, str):
-            working_dir = Path(working_dir)
 
         # private attributes
         self.input_file_types = input_file_types
         self.charge = charge
         self.multiplicity = multiplicity
 
-        self.current_key = "not_assigned"
-        self._current_status = (
-            "not_assigned"  # not_assigned,found, submitted, finished, failed
-        )
-        self.current_dirs = {
-            "input": None,
-            "output": None,
-            "finished": None,
-            "failed": None,
-        }
+        # -1: not_assigned
+        self._key_index = -1
+        # not_assigned,found, submitted, finished, failed
+        self._current_status = _status_codes["not_assigned"]
+        # config_key -> final dir (str)
         self.final_dirs = {}
         self._failed_reason = None
 
         self.efficiency_data = {}
 
-        # for each config_key this will save the location of the job_dir
-        self.input_dir_per_key = {}
-        self.output_dir_per_key = {}
-        self.failed_per_key = {}
-        self.finished_per_key = {}
-        self.slurm_id_per_key = {}
-        self.status_per_key = {}
+        # status code per config key, see StatusPerKey
+        self._key_status = bytearray(len(self._key_chain.keys))
+        self._extra_status = None
+        # slurm ids of the keys without step node, see SlurmIdPerKey
+        self._slurm_ids = {}
         # this will be used to keep track of the jobs that are finished
         self.finished_keys = []
 
         self.iterations_per_key = {}
 
-        self._init_all_dicts(working_dir, all_keys)
-
-        # self.tqdm = None
-
-        # prepare final_output dirs
-        self.raw_success_dir = working_dir / "finished" / "raw_results" / self.mol_id
-        self.raw_failed_dir = self.raw_success_dir / "failed"
+        # config_key -> StepNode, set by job_graph.build_step_graph.
+        # The nodes own the state of the steps the job has reached.
+        self.step_nodes = {}
 
-        self._overlapping_jobs = []
+        # the JobRegistry this job belongs to, it is set by the registry itself
+        self._registry = None
 
     def __repr__(self):
         rep_str = (
@@ -93,86 +400,219 @@ class Job:
             rep_str += ", failed reason: " + self.failed_reason
         return rep_str
 
-    def _init_all_dicts(
-        self,
-        working_dir,
-        all_keys,
-    ):
-        """Initialize dictionaries for storing directories related to each calculation step.
+    @property
+    def all_keys(self):
+        return self._key_chain.keys
+
+    @property
+    def current_key(self):
+        if self._key_index < 0:
+            return "not_assigned"
+        return self._key_chain.keys[self._key_index]
+
+    @current_key.setter
+    def current_key(self, key):
+        if key == "not_assigned":
+            self._key_index = -1
+        elif key in self._key_chain.index:
+            self._key_index = self._key_chain.index[key]
+        else:
+            raise ValueError(f"{key} is not a config key of {self.unique_job_id}.")
+
+    def get_step_id(self, key):
+        """Get the step id of a config key, e.g. opt__sp___mol for the key sp."""
+        return (
+            self._key_chain.step_prefixes[self._key_chain.index[key]]
+            + "___"
+            + self.mol_id
+        )
+
+    @property
+    def current_dirs(self):
+        if self._key_index < 0:
+            return {"input": None, "output": None, "finished": None, "failed": None}
+        key = self.current_key
+        return StepDirs(self._layout, key, self.get_step_id(key))
+
+    @property
+    def input_dir_per_key(self):
+        return DirsPerKey(self, current_dir_layers["input"])
+
+    @property
+    def output_dir_per_key(self):
+        return DirsPerKey(self, current_dir_layers["output"])
+
+    @property
+    def finished_per_key(self):
+        return DirsPerKey(self, current_dir_layers["finished"])
+
+    @property
+    def failed_per_key(self):
+        return DirsPerKey(self, ("failed",))
+
+    @property
+    def raw_success_dir(self):
+        return self._layout.raw_results_dir / self.mol_id
+
+    @property
+    def raw_failed_dir(self):
+        return self.raw_success_dir / "failed"
+
+    @property
+    def status_per_key(self):
+        return StatusPerKey(self)
+
+    @status_per_key.setter
+    def status_per_key(self, status_dict):
+        self._key_status = bytearray(len(self._key_chain.keys))
+        self._extra_status = None
+        self.status_per_key.update(status_dict)
+
+    @property
+    def slurm_id_per_key(self):
+        return SlurmIdPerKey(self)
+
+    @slurm_id_per_key.setter
+    def slurm_id_per_key(self, slurm_id_dict):
+        self._slurm_ids = {}
+        self.slurm_id_per_key.update(slurm_id_dict)
+
+    def _update_registry(self):
+        """Report a status change to the JobRegistry this job belongs to (if any)."""
+        if self._registry is not None:
+            self._registry.update_job(self)
+
+    def attach_step_nodes(self, step_nodes):
+        """
+        Attach the step nodes of this job, see `job_graph.build_step_graph`.
+
+        The state the job has stored for the steps it has already reached is moved to the nodes
+        that don't have a state yet, so a continued run keeps the state of its steps.
 
         Args:
-            working_dir (str|Path): The working directory where the directories will be created.
-            all_keys (list[str]): A list of all the calculation steps that will be performed by this job.
+            step_nodes (dict): config_key -> StepNode for all keys of the job.
         """
+        self.step_nodes = step_nodes
+        for index in range(self._key_index + 1):
+            key = self._key_chain.keys[index]
+            node = step_nodes[key]
+            if node.status is not None or not self._key_status[index]:
+                continue
+            node.status = job_statuses[self._key_status[index]]
+            node.slurm_id = self._slurm_ids.get(key)
+            if index == self._key_index:
+                node.failed_reason = self._failed_reason
+        self._update_registry()
+
+    def _reached_node(self, key):
+        """The step node of a key the job has already reached, None if there is none."""
+        index = self._key_chain.index.get(key)
+        if index is None or index > self._key_index:
+            return None
+        return self.step_nodes.get(key)
+
+    def _set_node_state(self, node, **state):
+        """Set the state of a step node and report the change for all jobs passing through it."""
+        for name, value in state.items():
+            setattr(node, name, value)
+        for job in node.jobs:
+            job._update_registry()  # noqa
+
+    def _status_code_for(self, index):
+        """The status code of the key at the given index, the step node owns the status of a reached key."""
+        if index <= self._key_index:
+            node = self.step_nodes.get(self._key_chain.keys[index])
+            if node is not None and node.status is not None:
+                return get_status_code(node.status)
+        return self._key_status[index]
+
+    def key_status_codes(self):
+        """
+        Get the status codes of all keys of the job.
 
-        for i, key in enumerate(all_keys):
-            id_for_step = "__".join(all_keys[: i + 1]) + "___" + self.mol_id
-            self.input_dir_per_key[key] = (
-                working_dir / "working" / key / "input" / id_for_step
-            )
-            self.output_dir_per_key[key] = (
-                working_dir / "working" / key / "output" / id_for_step
-            )
-            self.finished_per_key[key] = (
-                working_dir / "working" / key / "finished" / id_for_step
-            )
-            self.failed_per_key[key] = (
-                working_dir / "working" / key / "failed" / id_for_step
-            )
+        Returns:
+            bytearray: The status code per key, 0 if the job has no status for the key.
+        """
+        return bytearray(
+            self._status_code_for(index) for index in range(len(self._key_status))
+        )
 
     @property
-    def current_status(self):
+    def status_code(self):
+        """The code of the current status, see `job_statuses`."""
+        if self._key_index >= 0:
+            node = self.step_nodes.get(self._key_chain.keys[self._key_index])
+            if node is not None and node.status is not None:
+                return get_status_code(node.status)
         return self._current_status
 
+    @property
+    def current_status(self):
+        return job_statuses[self.status_code]
+
     @current_status.setter
     def current_status(self, value):
         """Set the current status of the job.
 
+        The status of a step is owned by its StepNode,
+        so all jobs passing through the step have the new status.
+
         Args:
             value (str): The new status value.
 
         Returns:
             None
         """
-        self._current_status = value
-        self.status_per_key[self.current_key] = value
-
-        # set status for all overlapping jobs
-        if value in ["submitted", "finished", "failed"]:
+        step_node = self.step_nodes.get(self.current_key)
+        if step_node is not None:
+            self._set_node_state(step_node, status=value)
+            return
 
-            if value == "submitted":
-                value = "submitted_overlapping_job"
-            for overlapping_job in self.overlapping_jobs:
-                if (
-                    overlapping_job.current_key == self.current_key
-                    and overlapping_job.current_status != value
-                ):
-                    overlapping_job._current_status = value  # noqa
-                    overlapping_job.status_per_key[self.current_key] = value
-                    overlapping_job.slurm_id_per_key[self.current_key] = (
-                        self.slurm_id_per_key[self.current_key]
-                    )
+        self._current_status = get_status_code(value)
+        self.status_per_key[self.current_key] = value
+        self._update_registry()
 
     @property
     def failed_reason(self):
+        step_node = self.step_nodes.get(self.current_key)
+        if step_node is not None:
+            return step_node.failed_reason
         return self._failed_reason
 
     @failed_reason.setter
     def failed_reason(self, value):
+        step_node = self.step_nodes.get(self.current_key)
+        if step_node is not None:
+            self._set_node_state(step_node, failed_reason=value)
+            return
+
         self._failed_reason = value
-        for overlapping_job in self.overlapping_jobs:
-            if overlapping_job.failed_reason is None:
-                overlapping_job._failed_reason = value
+        self._update_registry()
 
     @property
     def overlapping_jobs(self):
-        return self._overlapping_jobs
+        """The other jobs that share the calculation of the current step with this job."""
+        step_node = self.step_nodes.get(self.current_key)
+        if step_node is None:
+            return []
+        return [job for job in step_node.jobs if job is not self]
+
+    def runs_step(self, key):
+        """
+        Check if this job schedules and executes the step of the given key.
 
-    @overlapping_jobs.setter
-    def overlapping_jobs(self, value):
-        self._overlapping_jobs = value
+        Every step is run once by the primary job of its StepNode, the other jobs follow its state.
 
-    def check_status_for_key(self, key, ignore_overlapping_jobs=True):
+        Args:
+            key (str): The config key.
+
+        Returns:
+            bool: True if the job runs the step or has no step node for the key.
+        """
+        step_node = self.step_nodes.get(key)
+        return step_node is None or step_node.primary_job is self
+
+    def check_status_for_key(self, key):
         """
         Check the status of the job for the given key.
 
@@ -182,7 +622,6 @@ class Job:
         - already_finished
         - found
         - submitted
-        - submitted_overlapping_job
         - returned
         - failed
         - finished
@@ -191,31 +630,26 @@ class Job:
         Args:
             key (str): The config key for the job.
 
-            ignore_overlapping_jobs (bool, optional): Whether to ignore overlapping jobs. Defaults to True.
-
         Returns:
             str: The status of the job for the given key.
         """
-        if key not in self.all_keys:
+        index = self._key_chain.index.get(key)
+        if index is None:
             return "not_assigned"
 
         # if job previously failed, it will not be re-submitted
-        if self.current_status == "failed":
+        if self.status_code == _status_codes["failed"]:
             return "failed"
 
-        if key != self.current_key and key not in self.finished_keys:
+        if index != self._key_index and key not in self.finished_keys:
             return "not_found"
 
-        if key != self.current_key and key in self.finished_keys:
+        if index != self._key_index and key in self.finished_keys:
             return "already_finished"
 
-        if key in self.status_per_key:
-            if (
-                self.status_per_key[key] == "submitted_overlapping_job"
-                and ignore_overlapping_jobs
-            ):
-                return "submitted"
-            return self.status_per_key[key]
+        code = self._status_code_for(index)
+        if code:
+            return job_statuses[code]
 
         return "not_found"
 
@@ -233,32 +667,18 @@ class Job:
 
         self.current_key = key
         self.current_step = step
-        self.current_step_id = (
-            "__".join(self.all_keys[: step + 1]) + "___" + self.mol_id
-        )
-
-        checked_status = self.check_status_for_key(key)
-        if checked_status != "submitted":
-            self.current_status = "found"
+        self.current_step_id = self._key_chain.step_prefixes[step] + "___" + self.mol_id
+
+        step_node = self.step_nodes.get(key)
+        if step_node is not None:
+            # the first job reaching the step starts it, the others keep its status
+            if step_node.status is None:
+                self._set_node_state(step_node, status="found")
+        elif self.check_status_for_key(key) != "submitted":
+            self._current_status = _status_codes["found"]
             self.status_per_key[key] = "found"
 
-        self.current_dirs = {
-            "input": self.input_dir_per_key[key],
-            "output": self.output_dir_per_key[key],
-            "finished": self.finished_per_key[key],
-            "missing_ram_error": self.failed_per_key[key].parents[0]
-            / "missing_ram_error"
-            / self.failed_per_key[key].name,
-            "walltime_error": self.failed_per_key[key].parents[0]
-            / "walltime_error"
-            / self.failed_per_key[key].name,
-            "unknown_error": self.failed_per_key[key].parents[0]
-            / "unknown_error"
-            / self.failed_per_key[key].name,
-            "missing_output": self.failed_per_key[key].parents[0]
-            / "missing_output"
-            / self.failed_per_key[key].name,
-        }
+        self._update_registry()
 
     def reset_key(self, key):
         """
@@ -275,9 +695,9 @@ class Job:
         if self.iterations_per_key.get(key, 0) == 0:
             # if no walltime error has been encountered, the job will be resubmitted
             self.failed_reason = None
+            self.iterations_per_key[key] = 1
             self.current_status = "found"
             self.status_per_key[key] = "found"
-            self.iterations_per_key[key] = 1
             return "reset"
 
         if self.iterations_per_key.get(key, 0) > 0:
@@ -300,14 +720,14 @@ class Job:
         if return_str == "success":
             self.current_status = "finished"
             if not self.current_dirs["finished"].exists():
-                shutil.move(self.current_dirs["output"], self.current_dirs["finished"])
+                move_path(self.current_dirs["output"], self.current_dirs["finished"])
         else:
 
             if return_str == "walltime_error":
                 check_reset = self.reset_key(self.current_key)
                 if check_reset == "reset":
 
-                    shutil.move(
+                    move_path(
                         self.current_dirs["output"], self.current_dirs[return_str]
                     )
 
@@ -321,7 +741,7 @@ class Job:
             self.failed_reason = return_str
 
             if not self.current_dirs[self.failed_reason].exists():
-                shutil.move(
+                move_path(
                     self.current_dirs["output"], self.current_dirs[self.failed_reason]
                 )
 
@@ -358,17 +778,19 @@ class Job:
                 self.start_new_key(next_key, self.current_step + 1)
                 if current_key not in self.finished_keys:
                     self.finished_keys.append(current_key)
+                    self._update_registry()
 
                     for input_file_type in self.input_file_types:
                         input_file = old_finished_dir / (old_step_id + input_file_type)
 
                         new_input_dir = self.current_dirs["input"]
-                        new_input_dir.mkdir(parents=True, exist_ok=True)
+                        make_dirs([new_input_dir])
                         new_file_name = self.current_step_id + input_file_type
                         new_file = new_input_dir / new_file_name
 
                         if not new_file.exists():
-                            shutil.copy(input_file, new_file)
+                            # the finished files don't change anymore, a hardlink is enough
+                            stage_file(input_file, new_file)
                         else:
                             return "file_exists"
                     return "success"
@@ -376,6 +798,7 @@ class Job:
             elif self.current_status == "failed":
                 if current_key not in self.finished_keys:
                     self.finished_keys.append(current_key)
+                    self._update_registry()
 
                 self.wrap_up_combined()
 
@@ -389,6 +812,7 @@ class Job:
             if self.current_status in ["finished", "failed"]:
                 if current_key not in self.finished_keys:
                     self.finished_keys.append(current_key)
+                    self._update_registry()
 
                 return_str = self.wrap_up_combined()
 
@@ -397,10 +821,22 @@ class Job:
 
             return return_str
 
+    def get_step_dirs(self):
+        """Get the existing input and output dirs of all keys, they are removed by the clean up.
+
+        Returns:
+            list: The existing step dirs.
+        """
+        dir_list = list(self.output_dir_per_key.values()) + list(
+            self.input_dir_per_key.values()
+        )
+        return [dir for dir in dir_list if dir.exists()]
+
     def _clean_up(self):
         """Clean up the input and output directories.
 
         This method is used to clean up the input and output directories by archiving them and then removing them.
+        If the job is part of a JobRegistry with a StepArchiver, they are archived in the background.
         """
 
         # check if all overlapping jobs have finished
@@ -410,15 +846,16 @@ class Job:
                     return
 
         # only clean up if all overlapping jobs have finished
-        dir_list = list(self.output_dir_per_key.values()) + list(
-            self.input_dir_per_key.values()
-        )
-        for dir in dir_list:
-            if dir.exists():
-                shutil.make_archive(
-                    dir.parents[0] / ("archive_" + dir.stem), "zip", dir
-                )
-                shutil.rmtree(dir)
+        dir_list = self.get_step_dirs()
+        if not dir_list:
+            return
+
+        # the dirs are appended to the step archives of their layer, see step_archive.py
+        step_archiver = getattr(self._registry, "step_archiver", None)
+        if step_archiver is not None:
+            step_archiver.submit(dir_list)
+        else:
+            pack_step_dirs(dir_list)
 
     def wrap_up_combined(self):
         """
@@ -428,6 +865,7 @@ class Job:
             str: The wrap up status, either "finalized" or the reason for failure.
         """
         wrap_up_return_str = "finalized"
+        results_moved = False
 
         final_dir = self.raw_success_dir
         for key in self.finished_keys:  # pylint: disable=C0206
@@ -454,7 +892,7 @@ class Job:
                 wrap_up_return_str = self.failed_reason
 
                 if self.failed_reason == "missing_output":
-                    src_dir.mkdir(parents=True, exist_ok=True)
+                    make_dirs([src_dir])
                     missing_file = src_dir / "missing_output.txt"
                     with open(missing_file, "w", encoding="utf-8") as f:
                         f.write(
@@ -476,9 +914,14 @@ class Job:
                 if continuing:
                     continue
 
-            shutil.move(src_dir, target_dir)
+            move_path(src_dir, target_dir)
+
+            self.final_dirs[key] = str(target_dir)
+            results_moved = True
 
-            self.final_dirs[key] = target_dir
+        if results_moved:
+            # keep the dashboard from listing the raw_results dir again
+            get_results_index(self.raw_success_dir.parent).update_mol_dir(self.mol_id)
 
         self._clean_up()
         return wrap_up_return_str
@@ -486,7 +929,7 @@ class Job:
     def prepare_initial_job(self, key, step, input_file):
         """Prepare the initial job for execution.
 
-        This method prepares the initial job for execution by copying the input file to the correct input directory.
+        This method prepares the initial job for execution by staging the input file in the correct input directory.
 
         Args:
             key (str): The key for the job.
@@ -498,8 +941,8 @@ class Job:
         """
         self.start_new_key(key, step)
 
-        # Copy the input files to the correct input directory
-        self.current_dirs["input"].mkdir(parents=True, exist_ok=True)
+        # Stage the input files in the correct input directory
+        make_dirs([self.current_dirs["input"]])
 
         new_file = self.current_dirs["input"] / (
             self.current_step_id + input_file.suffix
@@ -508,7 +951,7 @@ class Job:
             # Only create the file if it does not exist
             # When using parallel jobs, the file of a primary stage might be needed for multiple secondary stages
             # but we don't want to make the calculation multiple times
-            shutil.copy(input_file, new_file)
+            stage_file(input_file, new_file)
 
     def export_as_dict(self):
 
@@ -517,16 +960,14 @@ class Job:
         export_dict["unique_job_id"] = self.unique_job_id
         export_dict["current_step"] = self.current_step
         export_dict["current_step_id"] = self.current_step_id
-        export_dict["all_keys"] = self.all_keys
+        export_dict["all_keys"] = list(self.all_keys)
         export_dict["input_file_types"] = self.input_file_types
         export_dict["charge"] = int(self.charge)
         export_dict["multiplicity"] = int(self.multiplicity)
         export_dict["current_key"] = self.current_key
-        export_dict["_current_status"] = self._current_status
+        export_dict["_current_status"] = self.current_status
         export_dict["finished_keys"] = self.finished_keys
-        export_dict["final_dirs"] = {
-            key: str(value) for key, value in self.final_dirs.items()
-        }
+        export_dict["final_dirs"] = dict(self.final_dirs)
         export_dict["failed_reason"] = self.failed_reason
 
         export_dict["slurm_id_per_key"] = {
@@ -552,35 +993,26 @@ class Job:
         new_job.current_step = input_dict["current_step"]
         new_job.current_step_id = input_dict["current_step_id"]
         new_job.current_key = input_dict["current_key"]
-        new_job._current_status = input_dict["_current_status"]
-
-        new_job.current_dirs = {
-            "input": new_job.input_dir_per_key[new_job.current_key],
-            "output": new_job.output_dir_per_key[new_job.current_key],
-            "finished": new_job.finished_per_key[new_job.current_key],
-            "missing_ram_error": new_job.failed_per_key[new_job.current_key].parents[0]
-            / "missing_ram_error"
-            / new_job.failed_per_key[new_job.current_key].name,
-            "walltime_error": new_job.failed_per_key[new_job.current_key].parents[0]
-            / "walltime_error"
-            / new_job.failed_per_key[new_job.current_key].name,
-            "unknown_error": new_job.failed_per_key[new_job.current_key].parents[0]
-            / "unknown_error"
-            / new_job.failed_per_key[new_job.current_key].name,
-        }
+        new_job._current_status = get_status_code(
+            _legacy_statuses.get(
+                input_dict["_current_status"], input_dict["_current_status"]
+            )
+        )
 
         new_job.final_dirs = {
-            key: Path(value) for key, value in input_dict["final_dirs"].items()
+            key: str(value) for key, value in input_dict["final_dirs"].items()
         }
         new_job.failed_reason = input_dict["failed_reason"]
 
         new_job.slurm_id_per_key = input_dict["slurm_id_per_key"]
-        new_job.status_per_key = input_dict["status_per_key"]
+        new_job.status_per_key = {
+            key: _legacy_statuses.get(status, status)
+            for key, status in input_dict["status_per_key"].items()
+        }
         new_job.finished_keys = input_dict["finished_keys"]
 
-        new_job.efficiency_data = {
-            int(key): value for key, value in input_dict["efficiency_data"].items()
-        }
+        # the efficiency data is stored per config key
+        new_job.efficiency_data = dict(input_dict["efficiency_data"])
 
         return new_job
 
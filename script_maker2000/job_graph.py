@@ -0,0 +1,92 @@
+"""
+This module provides the step graph, which describes which calculations of a batch run are shared between jobs.
+
+With `parallel_layer_run` every combination of the layers is its own job,
+e.g. for the layers opt_1 -> (sp_1, sp_2) the jobs opt_1__sp_1 and opt_1__sp_2 of one molecule.
+Both start with the same opt_1 calculation, which only has to run once.
+
+Each node of the graph is one calculation step of one molecule, identified by (mol_id, key prefix).
+All jobs with this key prefix pass through the node. The node owns the state of the step
+(status, slurm id and failed reason), so the step is scheduled and executed once by its primary job
+and every other job reads its state for this key from the node. The children of a node are the next
+calculation steps, which all start from the output geometry of the node.
+"""
+
+
+class StepNode:
+    """
+    A single calculation step of one molecule that is shared by all jobs with the same key prefix.
+    """
+
+    def __init__(self, mol_id, keys):
+        """
+        Initializes a StepNode.
+
+        Args:
+            mol_id (str): The molecule of this step.
+            keys (tuple[str]): The config keys leading to this step, the last one is the key of the step itself.
+        """
+        self.mol_id = mol_id
+        self.keys = tuple(keys)
+        # same format as Job.current_step_id
+        self.step_id = "__".join(self.keys) + "___" + mol_id
+
+        # all jobs passing through this step, in the order they were added
+        self.jobs = []
+        # next config key -> StepNode
+        self.children = {}
+
+        # the state of the step, shared by all jobs that have reached it. None until the first job reaches it.
+        self.status = None
+        self.slurm_id = None
+        self.failed_reason = None
+
+    def __repr__(self):
+        return f"StepNode({self.step_id}, {len(self.jobs)} jobs, status: {self.status})"
+
+    @property
+    def key(self):
+        return self.keys[-1]
+
+    @property
+    def primary_job(self):
+        """The job that performs the calculation of this step."""
+        return self.jobs[0]
+
+
+def build_step_graph(jobs):
+    """
+    Build the step graph for the given jobs and attach the nodes to the jobs.
+
+    Every job is added to the node of each of its key prefixes,
+    so this is linear in the number of jobs times the number of steps.
+    Afterwards `job.step_nodes[key]` is the node the job passes at this key.
+    The state of the steps the jobs have already reached (e.g. when continuing a run) is moved to the nodes,
+    see `Job.attach_step_nodes`.
+
+    Args:
+        jobs (Iterable[Job]): The jobs of the batch run.
+
+    Returns:
+        dict: (mol_id, key prefix) -> StepNode for all steps.
+    """
+    step_graph = {}
+    for job in jobs:
+        parent_node = None
+        step_nodes = {}
+        for i, key in enumerate(job.all_keys):
+            node_id = (job.mol_id, tuple(job.all_keys[: i + 1]))
+            node = step_graph.get(node_id)
+            if node is None:
+                node = StepNode(*node_id)
+                step_graph[node_id] = node
+                if parent_node is not None:
+                    parent_node.children[key] = node
+
+            node.jobs.append(job)
+            step_nodes[key] = node
+            parent_node = node
+
+        job.attach_step_nodes(step_nodes)
+
+    return step_graph
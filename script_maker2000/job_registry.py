@@ -0,0 +1,188 @@
+"""
+This module provides the JobRegistry, the container that holds all jobs of a batch run.
+
+The registry behaves like the plain job dictionary used throughout the batch and work managers
+(unique_job_id -> Job) but additionally keeps secondary indexes of config_key -> status -> jobs.
+These indexes are updated by the jobs themselves whenever their status changes,
+so a work manager can look up its jobs per status without checking every single job.
+The registry also keeps a JobStateTable with the state of all jobs as numpy arrays for bulk status queries.
+"""
+
+from collections import defaultdict
+from collections.abc import MutableMapping
+
+from script_maker2000.job_state_table import JobStateTable
+
+
+class JobRegistry(MutableMapping):
+    """
+    A mapping of unique job ids to Job objects with a per config key status index.
+
+    The status stored in the index for a given config key is the result of `Job.check_status_for_key(key)`.
+    Jobs report every change of their status to the registry they are part of,
+    a StepNode reports the changes of its state for all jobs passing through it.
+    """
+
+    def __init__(self, jobs=None):
+        """
+        Initializes a new JobRegistry.
+
+        Args:
+            jobs (dict|list, optional): Either a dict of unique_job_id -> Job or a list of jobs.
+                Defaults to None.
+        """
+        self._jobs = {}
+
+        # config_key -> status -> {unique_job_id: job}
+        # dicts are used instead of sets to keep a reproducible insertion order
+        self._status_index = defaultdict(lambda: defaultdict(dict))
+        # unique_job_id -> {config_key: status}
+        self._indexed_status = {}
+        # jobs that changed since the last call of pop_changed_jobs
+        self._changed_job_ids = {}
+        # the state of all jobs as numpy arrays, see job_state_table.py
+        self.state_table = JobStateTable()
+
+        # packs the step dirs the jobs clean up, set by the BatchManager
+        self.step_archiver = None
+
+        if jobs is None:
+            jobs = {}
+        if isinstance(jobs, dict):
+            jobs = jobs.values()
+
+        for job in jobs:
+            self[job.unique_job_id] = job
+
+    def __repr__(self):
+        return f"JobRegistry({len(self._jobs)} jobs)"
+
+    def __getitem__(self, job_id):
+        return self._jobs[job_id]
+
+    def __setitem__(self, job_id, job):
+        if job_id in self._jobs:
+            self._remove_from_index(self._jobs[job_id])
+
+        self._jobs[job_id] = job
+        job._registry = self  # noqa
+        self.update_job(job)
+
+    def __delitem__(self, job_id):
+        job = self._jobs.pop(job_id)
+        self._remove_from_index(job)
+        self.state_table.remove_job(job)
+        self._changed_job_ids.pop(job_id, None)
+        job._registry = None  # noqa
+
+    def __iter__(self):
+        return iter(self._jobs)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    # direct views of the underlying dict, these are used in many hot loops
+    def keys(self):
+        return self._jobs.keys()
+
+    def values(self):
+        return self._jobs.values()
+
+    def items(self):
+        return self._jobs.items()
+
+    def _remove_from_index(self, job):
+        """Remove a job from all status indexes."""
+        old_status_dict = self._indexed_status.pop(job.unique_job_id, {})
+        for key, status in old_status_dict.items():
+            self._status_index[key][status].pop(job.unique_job_id, None)
+
+    def update_job(self, job):
+        """
+        Re-evaluate the status of a job for all of its keys and move it to the matching buckets.
+
+        This is called by the job whenever its status, current key or finished keys change.
+        Its cost only depends on the number of keys of the job, not on the number of jobs.
+        The job is also marked as changed for `pop_changed_jobs`.
+
+        Args:
+            job (Job): The job that changed.
+        """
+        job_id = job.unique_job_id
+        if self._jobs.get(job_id) is not job:
+            return
+
+        self._changed_job_ids[job_id] = None
+        self.state_table.update_job(job)
+
+        old_status_dict = self._indexed_status.get(job_id, {})
+        new_status_dict = {}
+
+        for key in job.all_keys:
+            status = job.check_status_for_key(key)
+            new_status_dict[key] = status
+
+            old_status = old_status_dict.get(key)
+            if old_status == status:
+                continue
+            if old_status is not None:
+                self._status_index[key][old_status].pop(job_id, None)
+            self._status_index[key][status][job_id] = job
+
+        self._indexed_status[job_id] = new_status_dict
+
+    def jobs_for_key(self, key, statuses=None, step_runners_only=False):
+        """
+        Collect all jobs of a config key grouped by their status.
+
+        Args:
+            key (str): The config key.
+            statuses (list, optional): Only collect these statuses. Defaults to None (all statuses).
+            step_runners_only (bool, optional): Only collect the jobs that run the step of this key,
+                i.e. one job per StepNode, see `Job.runs_step`. Defaults to False.
+
+        Returns:
+            defaultdict(list): A dictionary of status -> list of jobs.
+        """
+        current_job_dict = defaultdict(list)
+
+        for status, bucket in self._status_index[key].items():
+            if statuses is not None and status not in statuses:
+                continue
+            if step_runners_only:
+                current_job_dict[status].extend(
+                    job for job in bucket.values() if job.runs_step(key)
+                )
+            else:
+                current_job_dict[status].extend(bucket.values())
+
+        return current_job_dict
+
+    def count_for_key(self, key):
+        """
+        Count the jobs of a config key per status without collecting them.
+
+        Args:
+            key (str): The config key.
+
+        Returns:
+            defaultdict(int): A dictionary of status -> number of jobs.
+        """
+        count_dict = defaultdict(int)
+        for status, bucket in self._status_index[key].items():
+            count_dict[status] += len(bucket)
+        return count_dict
+
+    def pop_changed_jobs(self):
+        """
+        Collect all jobs that changed since the last call and reset the change tracking.
+
+        Returns:
+            list: The changed jobs in the order of their first change.
+        """
+        changed_jobs = [self._jobs[job_id] for job_id in self._changed_job_ids]
+        self._changed_job_ids = {}
+        return changed_jobs
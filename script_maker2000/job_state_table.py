@@ -0,0 +1,286 @@
+"""
+This module provides the JobStateTable, a columnar copy of the state of all jobs of a JobRegistry.
+
+Every job is one row of a few numpy arrays (struct of arrays):
+
+- status: the code of the current status, see `job.job_statuses`. 0 marks rows of removed jobs.
+- failed_reason: the code of the failed reason, 0 if the job didn't fail.
+- key_column: the column of the current config key, -1 if no key is assigned.
+- key_status: the status code per config key column, 0 if the job has no status for this key.
+- iterations: the iterations (restarts after a walltime error) per config key column.
+- settled: the code of the advancement result of done jobs that don't need to be advanced anymore, else 0.
+- step_runner: whether the job runs the step of its current key, see `Job.runs_step`.
+  All jobs of a step share its status, so counting the step runners counts every step once.
+
+The columns of the config keys are shared by all jobs of the registry. Rows are updated by the registry
+whenever a job reports a change, so counting statuses and selecting the jobs that have to be advanced
+only needs vectorized masks and touches the Job objects of the selected rows only.
+Slurm ids stay on the step nodes of the jobs, they are only needed for the submitted jobs of a work manager.
+"""
+
+import numpy as np
+
+from script_maker2000.job import get_status_code, job_statuses
+
+
+class JobStateTable:
+    """
+    The state of all jobs of a JobRegistry as numpy arrays with one row per job.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        Initializes an empty JobStateTable.
+
+        Args:
+            capacity (int, optional): The initial number of rows, the arrays grow as needed. Defaults to 1024.
+        """
+        capacity = max(int(capacity), 1)
+
+        # row -> Job, None for removed jobs
+        self.jobs = []
+        # unique_job_id -> row
+        self.rows = {}
+        # column -> config key
+        self.config_keys = []
+        self._columns = {}
+        # KeyChain -> columns of its keys
+        self._chain_columns = {}
+
+        self.status = np.zeros(capacity, dtype=np.uint8)
+        self.failed_reason = np.zeros(capacity, dtype=np.uint8)
+        self.key_column = np.full(capacity, -1, dtype=np.int16)
+        self.key_status = np.zeros((capacity, 0), dtype=np.uint8)
+        self.iterations = np.zeros((capacity, 0), dtype=np.int16)
+        self.settled = np.zeros(capacity, dtype=np.uint8)
+        self.step_runner = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def n_rows(self):
+        return len(self.jobs)
+
+    def _grow_rows(self):
+        capacity = len(self.status)
+        if self.n_rows < capacity:
+            return
+        self.status = np.concatenate([self.status, np.zeros_like(self.status)])
+        self.failed_reason = np.concatenate(
+            [self.failed_reason, np.zeros_like(self.failed_reason)]
+        )
+        self.key_column = np.concatenate(
+            [self.key_column, np.full_like(self.key_column, -1)]
+        )
+        self.key_status = np.concatenate(
+            [self.key_status, np.zeros_like(self.key_status)]
+        )
+        self.iterations = np.concatenate(
+            [self.iterations, np.zeros_like(self.iterations)]
+        )
+        self.settled = np.concatenate([self.settled, np.zeros_like(self.settled)])
+        self.step_runner = np.concatenate(
+            [self.step_runner, np.zeros_like(self.step_runner)]
+        )
+
+    def _get_column(self, key):
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = len(self.config_keys)
+            self.config_keys.append(key)
+            self.key_status = np.pad(self.key_status, ((0, 0), (0, 1)))
+            self.iterations = np.pad(self.iterations, ((0, 0), (0, 1)))
+        return column
+
+    def _get_chain_columns(self, key_chain):
+        columns = self._chain_columns.get(key_chain)
+        if columns is None:
+            columns = self._chain_columns[key_chain] = np.array(
+                [self._get_column(key) for key in key_chain.keys], dtype=np.intp
+            )
+        return columns
+
+    def update_job(self, job):
+        """
+        Add a job or update its row.
+
+        Args:
+            job (Job): The job.
+        """
+        row = self.rows.get(job.unique_job_id)
+        if row is None:
+            self._grow_rows()
+            row = self.rows[job.unique_job_id] = self.n_rows
+            self.jobs.append(job)
+        else:
+            self.jobs[row] = job
+
+        # the compact state of the job is read directly, see Job.__slots__
+        columns = self._get_chain_columns(job._key_chain)  # noqa
+        self.status[row] = job.status_code
+        self.failed_reason[row] = (
+            0 if job.failed_reason is None else get_status_code(job.failed_reason)
+        )
+        self.key_column[row] = (
+            columns[job._key_index] if job._key_index >= 0 else -1  # noqa
+        )
+        self.key_status[row] = 0
+        self.key_status[row, columns] = np.frombuffer(
+            job.key_status_codes(), dtype=np.uint8
+        )
+        self.iterations[row] = 0
+        if job.iterations_per_key:
+            for key, iterations in job.iterations_per_key.items():
+                self.iterations[row, self._get_column(key)] = iterations
+        # a changed job has to be advanced again
+        self.settled[row] = 0
+        self.step_runner[row] = job.runs_step(job.current_key)
+
+    def remove_job(self, job):
+        """
+        Remove a job, its row is kept empty.
+
+        Args:
+            job (Job): The job.
+        """
+        row = self.rows.pop(job.unique_job_id, None)
+        if row is None:
+            return
+        self.jobs[row] = None
+        self.status[row] = 0
+        self.failed_reason[row] = 0
+        self.key_column[row] = -1
+        self.key_status[row] = 0
+        self.iterations[row] = 0
+        self.settled[row] = 0
+        self.step_runner[row] = False
+
+    def settle(self, job, advancement_output):
+        """
+        Mark a done job as settled, it is skipped by `rows_to_advance` until it changes again.
+
+        Args:
+            job (Job): The job.
+            advancement_output (str): The last result of `Job.advance_to_next_key`.
+        """
+        self.settled[self.rows[job.unique_job_id]] = get_status_code(advancement_output)
+
+    def status_mask(self, statuses):
+        """
+        Get a mask of the rows with one of the given current statuses.
+
+        Args:
+            statuses (list): The statuses.
+
+        Returns:
+            np.ndarray: A bool array with one entry per row.
+        """
+        codes = [get_status_code(status) for status in statuses]
+        return np.isin(self.status[: self.n_rows], codes)
+
+    def count_status(self, status):
+        """Count the jobs with the given current status."""
+        return int(
+            np.count_nonzero(self.status[: self.n_rows] == get_status_code(status))
+        )
+
+    def count_steps(self, status):
+        """Count the steps with the given current status, the jobs following a step aren't counted."""
+        return int(
+            np.count_nonzero(
+                (self.status[: self.n_rows] == get_status_code(status))
+                & self.step_runner[: self.n_rows]
+            )
+        )
+
+    def count_restarted(self):
+        """Count the jobs that were restarted for at least one config key."""
+        return int(np.count_nonzero((self.iterations[: self.n_rows] > 0).any(axis=1)))
+
+    def _count_codes(self, codes):
+        counts = np.bincount(codes, minlength=len(job_statuses))
+        return {
+            job_statuses[code]: int(count)
+            for code, count in enumerate(counts)
+            if code and count
+        }
+
+    def count_statuses(self):
+        """
+        Count the jobs per current status.
+
+        Returns:
+            dict: status -> number of jobs.
+        """
+        return self._count_codes(self.status[: self.n_rows])
+
+    def count_failed_reasons(self):
+        """
+        Count the failed jobs per failed reason.
+
+        Returns:
+            dict: failed reason -> number of jobs.
+        """
+        failed_mask = self.status_mask(["failed"])
+        return self._count_codes(self.failed_reason[: self.n_rows][failed_mask])
+
+    def count_key_statuses(self, exclude_current_key=False):
+        """
+        Count the statuses of all jobs for all of their config keys.
+
+        Args:
+            exclude_current_key (bool, optional): Skip the status of the current key of each job. Defaults to False.
+
+        Returns:
+            dict: status -> number of (job, config key) pairs.
+        """
+        key_status = self.key_status[: self.n_rows]
+        mask = key_status > 0
+        if exclude_current_key:
+            mask &= (
+                np.arange(len(self.config_keys))
+                != self.key_column[: self.n_rows, np.newaxis]
+            )
+        return self._count_codes(key_status[mask])
+
+    def rows_to_advance(self):
+        """
+        Get the rows of the jobs that have to be advanced, all other jobs return "not_finished"
+        or their settled result.
+
+        Returns:
+            np.ndarray: The rows of the finished or failed jobs that aren't settled.
+        """
+        mask = self.status_mask(["finished", "failed"])
+        mask &= self.settled[: self.n_rows] == 0
+        return np.flatnonzero(mask)
+
+    def count_waiting(self):
+        """Count the jobs that are neither finished nor failed."""
+        active_mask = self.status[: self.n_rows] > 0
+        return int(
+            np.count_nonzero(active_mask & ~self.status_mask(["finished", "failed"]))
+        )
+
+    def count_settled(self):
+        """
+        Count the settled jobs per advancement result.
+
+        Returns:
+            dict: advancement result -> number of jobs.
+        """
+        settled = self.settled[: self.n_rows]
+        return self._count_codes(settled[settled > 0])
+
+    def get_jobs(self, rows):
+        """
+        Get the jobs of the given rows.
+
+        Args:
+            rows (iterable): The rows.
+
+        Returns:
+            list: The jobs.
+        """
+        return [self.jobs[row] for row in rows]
@@ -0,0 +1,370 @@
+"""
+This module provides the job stores, which persist the state of all jobs of a batch run.
+
+The backend is selected with the optional "job_store" entry of the main config:
+
+- "json" (default): the changed jobs are appended to job_backup_journal.jsonl every tick
+  and the journal is regularly compacted into job_backup.json.
+- "sqlite": jobs, their status and slurm id per config key and their efficiency data are kept
+  in indexed tables of job_store.sqlite. Status overviews are simple queries that don't need to load all jobs.
+
+Both backends write a complete job_backup.json at the end of a run,
+which is used by the result collection and the dashboard.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+
+job_backup_name = "job_backup.json"
+# changes of the jobs since the last job_backup.json snapshot, one json entry per line
+job_journal_name = "job_backup_journal.jsonl"
+job_database_name = "job_store.sqlite"
+
+possible_job_stores = ["json", "sqlite"]
+
+
+def write_job_snapshot(job_dict, working_dir):
+    """
+    Write all jobs to job_backup.json.
+
+    The file is replaced in one step, so an interrupted write can't corrupt it.
+
+    Args:
+        job_dict (JobRegistry): All jobs of the batch run.
+        working_dir (Path): The output dir of the batch run.
+    """
+    job_backup = {}
+    for job in job_dict.values():
+        job_backup[job.unique_job_id] = job.export_as_dict()
+
+    tmp_backup_file = Path(working_dir) / (job_backup_name + ".tmp")
+    with open(tmp_backup_file, "w", encoding="utf-8") as json_file:
+        json.dump(job_backup, json_file, indent=4)
+    os.replace(tmp_backup_file, Path(working_dir) / job_backup_name)
+
+
+def read_job_backup(json_file_path):
+    """
+    Read a job_backup.json snapshot and replay the job journal next to it.
+
+    Args:
+        json_file_path (str|Path): The path to the backup JSON file.
+
+    Returns:
+        dict: unique_job_id -> exported job dict.
+    """
+    with open(json_file_path, "r", encoding="utf-8") as json_file:
+        job_backup = json.load(json_file)
+
+    # replay the changes since the last snapshot, later entries are newer
+    journal_file_path = Path(json_file_path).parent / job_journal_name
+    if journal_file_path.exists():
+        with open(journal_file_path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    job_entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line can be incomplete if the run was killed while writing
+                    logging.getLogger("JobStore").warning(
+                        "Skipping incomplete line in %s.", journal_file_path
+                    )
+                    continue
+                job_backup[job_entry["unique_job_id"]] = job_entry
+
+    return job_backup
+
+
+class JsonJobStore:
+    """
+    Job store based on job_backup.json and an append-only journal of the job changes.
+    """
+
+    def __init__(self, working_dir, compaction_interval=30):
+        """
+        Initializes a JsonJobStore.
+
+        Args:
+            working_dir (Path): The output dir of the batch run.
+            compaction_interval (int, optional): Number of saves after which the journal
+                is folded into a new job_backup.json. Defaults to 30.
+        """
+        self.working_dir = Path(working_dir)
+        self.compaction_interval = compaction_interval
+
+        # the first save writes a full snapshot
+        self._saves_since_compaction = compaction_interval
+
+    def save(self, job_dict, compact=False):
+        """
+        Append the jobs that changed since the last save to the journal
+        and compact the journal every `compaction_interval` saves.
+
+        Args:
+            job_dict (JobRegistry): All jobs of the batch run.
+            compact (bool, optional): Write a new snapshot now. Defaults to False.
+        """
+        changed_jobs = job_dict.pop_changed_jobs()
+
+        # journal first, so replaying the journal on top of the new snapshot is always safe
+        if changed_jobs:
+            with open(
+                self.working_dir / job_journal_name, "a", encoding="utf-8"
+            ) as journal_file:
+                for job in changed_jobs:
+                    journal_file.write(json.dumps(job.export_as_dict()) + "\n")
+
+        self._saves_since_compaction += 1
+        if not compact and self._saves_since_compaction < self.compaction_interval:
+            return
+
+        write_job_snapshot(job_dict, self.working_dir)
+        (self.working_dir / job_journal_name).unlink(missing_ok=True)
+        self._saves_since_compaction = 0
+
+    def load(self):
+        """
+        Load all jobs from the snapshot and the journal.
+
+        Returns:
+            dict: unique_job_id -> exported job dict.
+        """
+        return read_job_backup(self.working_dir / job_backup_name)
+
+
+class SQLiteJobStore:
+    """
+    Job store based on a SQLite database with indexed tables for the jobs,
+    their status and slurm id per config key and their efficiency data.
+
+    Every save is one transaction, which only contains the jobs that changed since the last save.
+    The database uses write-ahead logging, so it can be read while the batch run is writing to it.
+    """
+
+    def __init__(self, working_dir):
+        """
+        Initializes a SQLiteJobStore.
+
+        Args:
+            working_dir (Path): The output dir of the batch run.
+        """
+        self.working_dir = Path(working_dir)
+        self.database_path = self.working_dir / job_database_name
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.database_path)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                self._connection.executescript("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        unique_job_id TEXT PRIMARY KEY,
+                        mol_id TEXT,
+                        current_key TEXT,
+                        current_status TEXT,
+                        failed_reason TEXT,
+                        job_data TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS jobs_status ON jobs (current_status);
+                    CREATE TABLE IF NOT EXISTS key_status (
+                        unique_job_id TEXT,
+                        config_key TEXT,
+                        status TEXT,
+                        slurm_id TEXT,
+                        PRIMARY KEY (unique_job_id, config_key)
+                    );
+                    CREATE INDEX IF NOT EXISTS key_status_status ON key_status (config_key, status);
+                    CREATE TABLE IF NOT EXISTS efficiency_data (
+                        unique_job_id TEXT,
+                        config_key TEXT,
+                        data TEXT,
+                        PRIMARY KEY (unique_job_id, config_key)
+                    );
+                    """)
+        return self._connection
+
+    def save(self, job_dict, compact=False):
+        """
+        Write the jobs that changed since the last save in a single transaction.
+
+        Args:
+            job_dict (JobRegistry): All jobs of the batch run.
+            compact (bool, optional): Also write a complete job_backup.json. Defaults to False.
+        """
+        changed_jobs = job_dict.pop_changed_jobs()
+
+        job_rows = []
+        key_status_rows = []
+        efficiency_rows = []
+        for job in changed_jobs:
+            export_dict = job.export_as_dict()
+            job_id = export_dict["unique_job_id"]
+            job_rows.append(
+                (
+                    job_id,
+                    export_dict["mol_id"],
+                    export_dict["current_key"],
+                    export_dict["_current_status"],
+                    export_dict["failed_reason"],
+                    json.dumps(export_dict),
+                )
+            )
+            for key, status in export_dict["status_per_key"].items():
+                key_status_rows.append(
+                    (job_id, key, status, export_dict["slurm_id_per_key"].get(key))
+                )
+            for key, data in export_dict["efficiency_data"].items():
+                efficiency_rows.append((job_id, key, json.dumps(data)))
+
+        if changed_jobs:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)", job_rows
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO key_status VALUES (?, ?, ?, ?)",
+                    key_status_rows,
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO efficiency_data VALUES (?, ?, ?)",
+                    efficiency_rows,
+                )
+
+        if compact:
+            write_job_snapshot(job_dict, self.working_dir)
+
+    def load(self):
+        """
+        Load all jobs from the database.
+
+        If there is no database yet (e.g. the run was started with the json store),
+        the jobs are read from job_backup.json instead.
+
+        Returns:
+            dict: unique_job_id -> exported job dict.
+        """
+        if not self.database_path.exists():
+            return read_job_backup(self.working_dir / job_backup_name)
+
+        cursor = self._connect().execute("SELECT unique_job_id, job_data FROM jobs")
+        return {job_id: json.loads(job_data) for job_id, job_data in cursor}
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def create_job_store(main_config, working_dir):
+    """
+    Create the job store selected in the main config.
+
+    Args:
+        main_config (dict): The main config.
+        working_dir (Path): The output dir of the batch run.
+
+    Raises:
+        NotImplementedError: If the job store type is unknown.
+
+    Returns:
+        JsonJobStore|SQLiteJobStore: The job store.
+    """
+    job_store_type = main_config["main_config"].get("job_store", "json")
+
+    if job_store_type == "json":
+        return JsonJobStore(
+            working_dir,
+            compaction_interval=main_config["main_config"].get(
+                "journal_compaction_interval", 30
+            ),
+        )
+    if job_store_type == "sqlite":
+        return SQLiteJobStore(working_dir)
+
+    raise NotImplementedError(
+        f"Job store {job_store_type} is not implemented. "
+        + f"Possible job stores are {possible_job_stores}."
+    )
+
+
+def count_job_status(job_backup, per_key=False):
+    """
+    Count the jobs per status. Failed jobs are counted per failed reason.
+
+    Args:
+        job_backup (dict): unique_job_id -> exported job dict.
+        per_key (bool, optional): Count the status per config key instead. Defaults to False.
+
+    Returns:
+        dict: status -> number of jobs, or config_key -> status -> number of jobs if `per_key` is set.
+    """
+    if per_key:
+        status_dict = defaultdict(lambda: defaultdict(int))
+        for job in job_backup.values():
+            for key, status in job["status_per_key"].items():
+                status_dict[key][status] += 1
+        return {key: dict(value) for key, value in status_dict.items()}
+
+    status_dict = defaultdict(int)
+    for job in job_backup.values():
+        if job["_current_status"] == "failed":
+            status_dict[job["failed_reason"]] += 1
+            continue
+        status_dict[job["_current_status"]] += 1
+    return dict(status_dict)
+
+
+def read_job_status_counts(working_dir, per_key=False):
+    """
+    Count the jobs of a batch run per status.
+
+    If the run uses the sqlite job store the counts are queried from the database,
+    otherwise job_backup.json (and the job journal) are read.
+
+    Args:
+        working_dir (str|Path): The output dir of the batch run.
+        per_key (bool, optional): Count the status per config key instead. Defaults to False.
+
+    Raises:
+        FileNotFoundError: If neither a job database nor a job_backup.json exist.
+
+    Returns:
+        dict: status -> number of jobs, or config_key -> status -> number of jobs if `per_key` is set.
+    """
+    working_dir = Path(working_dir)
+    database_path = working_dir / job_database_name
+
+    if not database_path.exists():
+        if not (working_dir / job_backup_name).exists():
+            raise FileNotFoundError(
+                f"Can't find {job_database_name} or {job_backup_name} in {working_dir}."
+            )
+        return count_job_status(
+            read_job_backup(working_dir / job_backup_name), per_key=per_key
+        )
+
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    try:
+        if per_key:
+            status_dict = defaultdict(dict)
+            rows = connection.execute(
+                "SELECT config_key, status, COUNT(*) FROM key_status "
+                + "GROUP BY config_key, status"
+            )
+            for key, status, count in rows:
+                status_dict[key][status] = count
+            return dict(status_dict)
+
+        rows = connection.execute(
+            "SELECT CASE WHEN current_status = 'failed' THEN failed_reason "
+            + "ELSE current_status END AS status, COUNT(*) FROM jobs GROUP BY status"
+        )
+        return {status: count for status, count in rows}
+    finally:
+        connection.close()
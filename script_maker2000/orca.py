@@ -8,12 +8,16 @@ The module contains the following classes:
 from pathlib import Path
 import copy
 import datetime
+import mmap
+import os
 import subprocess
 import shutil
 import re
 from typing import Union
 from script_maker2000.template import TemplateModule
 from script_maker2000.job import Job
+from script_maker2000.slurm import completion_spool_name
+from script_maker2000.staging import move_path
 from script_maker2000.analysis import extract_infos_from_results, parse_output_file
 
 
@@ -21,6 +25,23 @@ orca_ram_scaling = (
     0.65  # 65% of the available ram is used for orca this is subject to change
 )
 
+# patterns used to find the status of a returned job
+slurm_walltime_error_pattern = re.compile(
+    rb"slurmstepd: error: \*\*\* JOB [0-9]+ ON [A-Za-z0-9]+ "
+    + rb"CANCELLED AT [0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}"
+    + rb"(\.[0-9]{1,3})? DUE TO TIME LIMIT \*\*\*",
+    re.IGNORECASE,
+)
+orca_memory_error_pattern = re.compile(
+    rb"Error  \(ORCA_SCF\): Not enough memory available!", re.IGNORECASE
+)
+orca_normal_termination_pattern = re.compile(rb"ORCA TERMINATED NORMALLY")
+
+# output files are searched in chunks of this size (in bytes),
+# the overlap has to be longer than any match of the patterns above
+scan_chunk_size = 1024 * 1024
+scan_chunk_overlap = 1024
+
 
 class OrcaModule(TemplateModule):
     """
@@ -61,6 +82,14 @@ class OrcaModule(TemplateModule):
             "main_config"
         ]["orca_version"]
 
+        # the jobs write a completion record into this dir when they end
+        self.completion_spool_dir = None
+        if self.main_config["main_config"].get("use_completion_spool", False):
+            self.completion_spool_dir = (
+                Path(self.main_config["main_config"]["output_dir"])
+                / completion_spool_name
+            ).resolve()
+
     def prepare_jobs(self, input_dirs, **kwargs) -> dict:
         """
         Prepares the jobs for the Orca module.
@@ -117,6 +146,7 @@ class OrcaModule(TemplateModule):
             - __input_file (str): Relative path to the input file (this gets copied).
             - __output_file (str): Saves the ORCA output (full path to the original directory).
             - __marked_files (str): File paths in the format "/home/usr/dir/{file1,file2,file3,file4}".
+            - __completion_spool (str): Dir for the completion record of the job, empty if not used.
 
         Args:
             orca_file_dict (dict): Dictionary with ORCA file information.
@@ -160,6 +190,7 @@ class OrcaModule(TemplateModule):
                 "__output_file": working_dir / "output" / f"{key}" / f"{key}.out",
                 "__marked_files": f"{key}.inp",
                 "__timestemp": date_str,
+                "__completion_spool": self.completion_spool_dir or "",
             }
         return slurm_dict
 
@@ -282,13 +313,8 @@ class OrcaModule(TemplateModule):
                 "mul": multiplicity,
             }
 
-            # Create a new directory in the working directory for the XYZ file
-            (self.working_dir / "input" / xyz_path.stem).mkdir(
-                parents=True, exist_ok=True
-            )
-
-            # Move the XYZ file to the new directory
-            shutil.move(
+            # Move the XYZ file to a new directory in the working directory
+            move_path(
                 xyz_path,
                 self.working_dir / "input" / xyz_path.stem / f"{xyz_path.stem}.xyz",
             )
@@ -381,6 +407,38 @@ class OrcaModule(TemplateModule):
                                          This object can be used to check if the job was submitted successfully.
         """
 
+        slurm_file = self.get_slurm_file(job)
+
+        if shutil.which("sbatch"):
+            process = subprocess.run(
+                [shutil.which("sbatch"), str(slurm_file)],
+                shell=False,
+                check=False,
+                capture_output=True,
+                text=True,
+                # shell = False is important on justus
+            )
+        else:
+            raise ValueError(
+                "sbatch not found in path. Please make sure that slurm is installed on your system."
+            )
+
+        return process
+
+    def get_slurm_file(self, job):
+        """
+        Returns the sbatch file of a prepared job.
+
+        Args:
+            job (Job): The job object to be submitted. The name of the job is assumed to be
+                the stem of its input directory.
+
+        Raises:
+            FileNotFoundError: If the necessary SLURM or ORCA input files are not found in the job's input directory.
+
+        Returns:
+            Path: The sbatch file of the job.
+        """
         job_dir = job.current_dirs["input"]
         key = job_dir.stem
         slurm_file = job_dir / (key + ".sbatch")
@@ -389,28 +447,84 @@ class OrcaModule(TemplateModule):
             f"Submitting orca job: {key} with slurm file: {slurm_file} and orca file: {orca_file}"
         )
 
-        if slurm_file.is_file() and orca_file.is_file():
-
-            if shutil.which("sbatch"):
-                process = subprocess.run(
-                    [shutil.which("sbatch"), str(slurm_file)],
-                    shell=False,
-                    check=False,
-                    capture_output=True,
-                    text=True,
-                    # shell = False is important on justus
-                )
-            else:
-                raise ValueError(
-                    "sbatch not found in path. Please make sure that slurm is installed on your system."
-                )
-
-        else:
+        if not slurm_file.is_file() or not orca_file.is_file():
             raise FileNotFoundError(
                 f"Can't find slurm file: {slurm_file} or orca file: {orca_file} for job {job}."
                 + " Please check your file name or provide the necessary files."
             )
-        return process
+        return slurm_file
+
+    def write_job_array(self, jobs, max_parallel=None):
+        """
+        Writes the files to submit a batch of jobs as a single SLURM job array.
+
+        This function writes an index file, where line n contains the input directory of the job
+        that is run by array task n-1, and an array sbatch script based on the orca_array_template.sbatch.
+        Each array task executes the regular sbatch script of its job,
+        so the jobs have to be prepared with `prepare_jobs` beforehand.
+
+        Args:
+            jobs (list): A list of Job objects to be submitted.
+            max_parallel (int, optional): The maximum number of array tasks running at the same time
+                (the %N throttle of the job array). Defaults to None (no throttle).
+
+        Raises:
+            FileNotFoundError: If the necessary SLURM or ORCA input files are not found for one of the jobs.
+
+        Returns:
+            Path: The sbatch script of the job array.
+        """
+
+        input_dirs = [self.get_slurm_file(job).parent.resolve() for job in jobs]
+
+        options = self.internal_config["options"]
+        working_dir = self.working_dir.resolve()
+
+        date_str = datetime.datetime.now().strftime("%dd_%mm_%yy-%Hh_%Mm_%Ss_%fus")
+        array_dir = working_dir / "array_jobs" / f"array_{date_str}"
+        array_dir.mkdir(parents=True, exist_ok=True)
+
+        index_file = array_dir / "index.txt"
+        with open(index_file, "w", encoding="utf-8") as f:
+            for input_dir in input_dirs:
+                f.write(f"{input_dir}\n")
+
+        array_range = f"0-{len(input_dirs) - 1}"
+        if max_parallel is not None:
+            array_range += f"%{max(int(max_parallel), 1)}"
+
+        array_dict = {
+            "__jobname": f"{self.config_key}_array",
+            "__ntasks": options["n_cores_per_calculation"],
+            "__memcore": options["ram_per_core"],
+            "__walltime": options["walltime"],
+            "__scratchsize": options["disk_storage"],
+            "__array_range": array_range,
+            "__array_dir": array_dir,
+            "__index_file": index_file,
+            "__output_base": working_dir / "output",
+        }
+
+        # a custom array template can be placed next to the orca_template.sbatch of this layer
+        array_template_path = self.working_dir / "orca_array_template.sbatch"
+        if not array_template_path.exists():
+            array_template_path = (
+                Path(__file__).parent / "data" / "orca_array_template.sbatch"
+            )
+        with open(array_template_path, "r", encoding="utf-8") as f:
+            array_script = f.read()
+
+        for replace_key, input_value in array_dict.items():
+            array_script = array_script.replace(replace_key, str(input_value))
+
+        array_slurm_file = array_dir / f"array_{date_str}.sbatch"
+        with open(array_slurm_file, "w", encoding="utf-8") as f:
+            f.write(array_script)
+
+        self.log.debug(
+            f"Prepared {len(input_dirs)} orca jobs as array with slurm file: {array_slurm_file}"
+        )
+        return array_slurm_file
 
     def restart_jobs(self, reset_job_list, key):
         """
@@ -446,12 +560,13 @@ class OrcaModule(TemplateModule):
             new_key = list(result_dict.keys())[0]
 
             # Get the last coordinates of the job
-            last_xyz_coords = list(result_dict[new_key]["coords"].values())[-1]
+            coords = result_dict[new_key]["coords"]
+            last_xyz_coords = coords["positions"][-1].tolist()
 
             # Create a new XYZ input file based on the last coordinates
             new_xyz_input = [
-                f"{atom['symbol']} {atom['x']} {atom['y']} {atom['z']}"
-                for atom in last_xyz_coords
+                f"{symbol} {x} {y} {z}"
+                for symbol, (x, y, z) in zip(coords["symbols"], last_xyz_coords)
             ]
             new_xyz_dict[new_key] = {
                 "coords": new_xyz_input,
@@ -545,28 +660,6 @@ class OrcaModule(TemplateModule):
             str: A string indicating the status of the job.
         """
 
-        # Define a function to check for a SLURM walltime error in a text
-        def check_slurm_walltime_error(input_text):
-            pattern = re.compile(
-                r"slurmstepd: error: \*\*\* JOB [0-9]+ ON [A-Za-z0-9]+ "
-                + r"CANCELLED AT [0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}"
-                + r"(\.[0-9]{1,3})? DUE TO TIME LIMIT \*\*\*",
-                re.IGNORECASE,
-            )
-            return pattern.search(input_text)
-
-        # Define a function to check for an ORCA memory error in a text
-        def check_orca_memory_error(input_text):
-            pattern = re.compile(
-                r"Error  \(ORCA_SCF\): Not enough memory available!", re.IGNORECASE
-            )
-            return pattern.search(input_text)
-
-        # Define a function to check for a normal ORCA termination in a text
-        def check_orca_normal_termination(input_text):
-            pattern = re.compile(r"ORCA TERMINATED NORMALLY")
-            return pattern.search(input_text)
-
         # Get the output directory of the job
         job_out_dir = job.current_dirs["output"]
 
@@ -584,30 +677,18 @@ class OrcaModule(TemplateModule):
         output_string = "unknown_error"
 
         # If the ORCA output file exists, check for errors in it
+        # the files are scanned in chunks, so the memory use doesn't depend on the output size
         if orca_out_file.exists():
-            try:
-                with open(orca_out_file, encoding="utf-8") as f:
-                    file_contents = f.read()
-            except UnicodeDecodeError:
-                file_contents = _handle_encoding_error(orca_out_file)
-
-            # Check for a normal ORCA termination
-            if check_orca_normal_termination(file_contents):
+            # Check for a normal ORCA termination, which is printed at the end of the file
+            if _search_file_backwards(orca_out_file, orca_normal_termination_pattern):
                 output_string = "success"
             # Check for an ORCA memory error
-            if check_orca_memory_error(file_contents):
+            if _search_file(orca_out_file, orca_memory_error_pattern):
                 output_string = "missing_ram_error"
 
         # If the SLURM file exists, check for a walltime error in it
         if slurm_file.exists():
-            try:
-                with open(slurm_file, encoding="utf-8") as f:
-                    file_contents = f.read()
-            except UnicodeDecodeError:
-                file_contents = _handle_encoding_error(slurm_file)
-
-            # Check for a SLURM walltime error
-            if check_slurm_walltime_error(file_contents):
+            if _search_file_backwards(slurm_file, slurm_walltime_error_pattern):
                 output_string = "walltime_error"
 
         # If either the ORCA output file or the SLURM file does not exist,
@@ -619,52 +700,56 @@ class OrcaModule(TemplateModule):
         return output_string
 
 
-def _handle_encoding_error(filename):
+def _search_file_backwards(file_path, pattern):
     """
-    Handles a UnicodeDecodeError when reading a file.
+    Search a file for a pattern, starting at the end of the file.
 
-    This function reads a file as bytes and tries to decode it as UTF-8.
-    If a UnicodeDecodeError occurs,
-    it prints a message indicating the error and the last characters before the error occurred.
-    It then reopens the file with error handling to replace the misbehaving character with a
-    '?' and returns the file contents.
+    The file is read backwards in chunks of `scan_chunk_size` bytes. Each chunk also contains
+    the first `scan_chunk_overlap` bytes of the chunk after it, to find matches on chunk borders.
 
+    Args:
+        file_path (Path): The file to search.
+        pattern (re.Pattern): A compiled bytes pattern.
 
-    Note that this function was designed for a specific problem
-     manifesting in some test cases and should technically never be actually needed.
+    Returns:
+        bool: True if the pattern was found.
+    """
+    with open(file_path, "rb") as f:
+        chunk_end = f.seek(0, os.SEEK_END)
+        while chunk_end > 0:
+            chunk_start = max(0, chunk_end - scan_chunk_size)
+            f.seek(chunk_start)
+            chunk = f.read(chunk_end - chunk_start + scan_chunk_overlap)
+            if pattern.search(chunk):
+                return True
+            chunk_end = chunk_start
+    return False
+
+
+def _search_file(file_path, pattern):
+    """
+    Search a file for a pattern from start to end.
+
+    The file is memory mapped, so it is never read into memory as a whole.
+    If the file can't be mapped (e.g. it is empty), it is read forward in chunks instead.
 
     Args:
-        filename (str): The name of the file to read.
+        file_path (Path): The file to search.
+        pattern (re.Pattern): A compiled bytes pattern.
 
     Returns:
-        str: The contents of the file, with misbehaving characters replaced by '?'.
+        bool: True if the pattern was found.
     """
-
-    # Read the file as bytes to find the misbehaving character
-    with open(filename, "rb") as f:
-        byte_data = f.read()
-
-    try:
-        # Try to decode the byte data as UTF-8
-        byte_data.decode("utf-8")
-        return
-    except UnicodeDecodeError as e:
-        # If a UnicodeDecodeError occurs, get the position of the error
-        error_position = e.start
-
-    # Decode the byte data up to the error position
-    partial_decoded_data = byte_data[:error_position].decode("utf-8", errors="ignore")
-
-    # Print a message indicating the error and the last characters before the error occurred
-    print(
-        f"An encoding error occured in {filename}. Unreadable symbol will be replaced by '?'"
-    )
-    print("Here are the last characters before the error occured:")
-    print(partial_decoded_data[-500:])
-
-    # Reopen the file with error handling to replace the misbehaving character with a '?'
-    with open(filename, encoding="utf-8", errors="replace") as f:
-        file_contents = f.read()
-
-    # Return the file contents
-    return file_contents
+    with open(file_path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                return pattern.search(mapped_file) is not None
+        except (ValueError, OSError):
+            pass
+
+        previous_end = b""
+        while chunk := f.read(scan_chunk_size):
+            if pattern.search(previous_end + chunk):
+                return True
+            previous_end = chunk[-scan_chunk_overlap:]
+    return False
@@ -0,0 +1,322 @@
+"""
+This module provides a lightweight parser for ORCA output files.
+
+cclib parses every attribute of an output file, but the result analysis only uses a few of them
+(see `single_value_entries`, `multi_value_entries`, `dict_entries` and `special_entries` in analysis.py).
+`parse_orca_output` reads the output file once and only collects these fields.
+The returned dict has the same keys and units as the cclib attributes,
+so the _calc_result.json files can be read by `extract_result_data` either way.
+"""
+
+# stored with the parsed results, increase it when the parsed entries change
+parser_version = 1
+
+# same conversion factor as cclib.parser.utils.convertor
+hartree_to_ev = 27.21138505
+
+# ORCA prints the zero frequencies of the translations and rotations first
+max_zero_frequencies = 6
+
+# lines are dispatched by their first characters, so most lines only cost one dict lookup
+prefix_length = 7
+# headers that are printed centered, they are matched after stripping the line
+indented_prefix = " " * prefix_length
+
+
+def _last_float(line):
+    return float(line.split()[-1])
+
+
+def _value_after_dots(line):
+    """Return the first value after the '...' of an ORCA key-value line."""
+    return float(line.split("...", 1)[1].split()[0].lstrip("."))
+
+
+class _OrcaOutputScanner:
+    """
+    State of a single pass through an ORCA output file.
+
+    Every handler gets the line starting with its marker. Handlers of multi line blocks
+    set `block` to a block handler, which gets the following lines until it returns True.
+    """
+
+    # marker at the start of the line -> handler
+    line_markers = {
+        "CARTESIAN COORDINATES (ANGSTROEM)": "_start_coords",
+        "Total Energy       :": "_scf_energy",
+        "FINAL SINGLE POINT ENERGY": "_final_sp_energy",
+        "Dispersion correction": "_energy_correction",
+        "gCP correction": "_energy_correction",
+        "E(CCSD)": "_ccsd_energy",
+        "E(CCSD(T))": "_ccsd_t_energy",
+        "T1 diagnostic": "_t1_diagnostic",
+        "VIBRATIONAL FREQUENCIES": "_start_frequencies",
+        "IR SPECTRUM": "_start_ir_spectrum",
+        "THERMOCHEMISTRY AT": "_start_thermochemistry",
+        "Temperature": "_thermochemistry_value",
+        "Pressure": "_thermochemistry_value",
+        "Zero point energy": "_thermochemistry_value",
+        "Total enthalpy": "_thermochemistry_value",
+        "Final entropy term": "_thermochemistry_value",
+        "Final Gibbs free energy": "_thermochemistry_value",
+        " Total Charge": "_charge",
+        " Multiplicity": "_mult",
+        " Basis Dimension": "_nmo",
+        " Density Functional     Method": "_dft_method",
+        " Ab initio Hamiltonian  Method": "_hf_method",
+        "Number of atoms": "_natom",
+        "Number of basis functions": "_nbasis",
+        "Your calculation utilizes the basis:": "_basis_set",
+        indented_prefix: "_indented_line",
+    }
+
+    # keys of the thermochemistry values, the entropy is divided by the temperature at the end
+    thermochemistry_keys = {
+        "Temperature": "temperature",
+        "Pressure": "pressure",
+        "Zero point energy": "zpve",
+        "Total enthalpy": "enthalpy",
+        "Final entropy term": "final_entropy_term",
+        "Final Gibbs free energy": "freeenergy",
+    }
+
+    def __init__(self):
+        self.result_dict = {}
+        self.metadata = {
+            "package": "ORCA",
+            "methods": [],
+            "keywords": [],
+            "success": False,
+        }
+
+        self.scfenergies = []
+        self.final_sp_energy = []
+        self.ccenergies = []
+        self.energy_corrections = {}
+        self.atomcoords = []
+        self.atomlabels = []
+        self.frequencies = []
+        self.ir_intensities = {}
+        self.thermochemistry = {}
+
+        self.is_optimization = False
+        self.optdone = False
+        self.in_thermochemistry = False
+        self.ccsd_energy_pending = False
+
+        self.block = None
+        self.block_lines_to_skip = 0
+
+        self.handlers = {}
+        for marker, handler_name in self.line_markers.items():
+            self.handlers.setdefault(marker[:prefix_length], []).append(
+                (marker, getattr(self, handler_name))
+            )
+
+    def scan(self, lines):
+        handlers = self.handlers
+        for line in lines:
+            if self.block is not None:
+                if self.block_lines_to_skip:
+                    self.block_lines_to_skip -= 1
+                elif self.block(line.strip()):
+                    self.block = None
+                continue
+
+            marker_handlers = handlers.get(line[:prefix_length])
+            if marker_handlers is None:
+                continue
+            for marker, handler in marker_handlers:
+                if line.startswith(marker):
+                    handler(line, marker)
+                    break
+
+    def _start_block(self, block, lines_to_skip):
+        self.block = block
+        self.block_lines_to_skip = lines_to_skip
+
+    def _start_coords(self, line, marker):
+        self.atomcoords.append([])
+        self._start_block(self._coords_line, 1)
+
+    def _coords_line(self, line):
+        if not line:
+            return True
+        label, x, y, z = line.split()[:4]
+        self.atomcoords[-1].append([float(x), float(y), float(z)])
+        if len(self.atomcoords) == 1:
+            self.atomlabels.append(label)
+
+    def _scf_energy(self, line, marker):
+        self.scfenergies.append(float(line.split()[3]) * hartree_to_ev)
+
+    def _final_sp_energy(self, line, marker):
+        self.final_sp_energy.append(_last_float(line) * hartree_to_ev)
+
+    def _energy_correction(self, line, marker):
+        # skip lines like "Dispersion correction in the Hessian ... done"
+        try:
+            correction = _last_float(line)
+        except ValueError:
+            return
+        name = marker.split()[0]
+        self.energy_corrections.setdefault(name, []).append(correction * hartree_to_ev)
+
+    def _ccsd_energy(self, line, marker):
+        self.ccenergies.append(_last_float(line) * hartree_to_ev)
+        self.metadata["methods"].append("CCSD")
+        self.ccsd_energy_pending = True
+
+    def _ccsd_t_energy(self, line, marker):
+        # the triples energy replaces the CCSD energy of the same calculation
+        if self.ccsd_energy_pending:
+            self.ccenergies.pop()
+        self.ccenergies.append(_last_float(line) * hartree_to_ev)
+        self.metadata["methods"].append("CCSD(T)")
+        self.ccsd_energy_pending = False
+
+    def _t1_diagnostic(self, line, marker):
+        self.metadata["t1_diagnostic"] = _last_float(line)
+
+    def _start_frequencies(self, line, marker):
+        self.frequencies = []
+        self._start_block(self._frequency_line, 1)
+
+    def _frequency_line(self, line):
+        if not line:
+            # the empty lines before the first frequency are skipped
+            return bool(self.frequencies)
+        if "cm**-1" in line:
+            self.frequencies.append(float(line.split()[1]))
+
+    def _start_ir_spectrum(self, line, marker):
+        self.ir_intensities = {}
+        # dashes, empty line, two header lines and dashes
+        self._start_block(self._ir_spectrum_line, 5)
+
+    def _ir_spectrum_line(self, line):
+        if not line:
+            return True
+        mode, _, _, intensity = line.split()[:4]
+        self.ir_intensities[int(mode.rstrip(":"))] = float(intensity)
+
+    def _start_thermochemistry(self, line, marker):
+        self.in_thermochemistry = True
+
+    def _thermochemistry_value(self, line, marker):
+        if self.in_thermochemistry:
+            self.thermochemistry[self.thermochemistry_keys[marker]] = _value_after_dots(
+                line
+            )
+            # the free energy is the last value of the section
+            if marker == "Final Gibbs free energy":
+                self.in_thermochemistry = False
+
+    def _charge(self, line, marker):
+        self.result_dict["charge"] = int(_last_float(line))
+
+    def _mult(self, line, marker):
+        self.result_dict["mult"] = int(_last_float(line))
+
+    def _nmo(self, line, marker):
+        self.result_dict["nmo"] = int(_last_float(line))
+
+    def _natom(self, line, marker):
+        self.result_dict["natom"] = int(_last_float(line))
+
+    def _nbasis(self, line, marker):
+        self.result_dict["nbasis"] = int(_last_float(line))
+
+    def _dft_method(self, line, marker):
+        self.metadata["methods"].append("DFT")
+
+    def _hf_method(self, line, marker):
+        self.metadata["methods"].append("HF")
+
+    def _basis_set(self, line, marker):
+        self.metadata.setdefault("basis_set", line.split(":", 1)[1].strip())
+
+    def _indented_line(self, line, marker):
+        line = line.strip()
+        if not line:
+            return
+        if line == "INPUT FILE" and not self.metadata["keywords"]:
+            self._start_block(self._input_line, 0)
+        elif line.startswith("Program Version"):
+            self.metadata.setdefault("package_version", line.split()[2])
+        elif line == "* Geometry Optimization Run *":
+            self.is_optimization = True
+        elif "THE OPTIMIZATION HAS CONVERGED" in line:
+            self.optdone = True
+        elif line == "****ORCA TERMINATED NORMALLY****":
+            self.metadata["success"] = True
+
+    def _input_line(self, line):
+        if line.endswith("****END OF INPUT****"):
+            return True
+        input_line = line.split(">", 1)[-1].strip()
+        if input_line.startswith("!"):
+            self.metadata["keywords"].extend(input_line[1:].split())
+
+    def results(self, output_file):
+        if "package_version" not in self.metadata:
+            raise ValueError(f"{output_file} is not an ORCA output file.")
+        self.metadata["legacy_package_version"] = self.metadata["package_version"]
+
+        result_dict = self.result_dict
+        if self.is_optimization:
+            result_dict["optdone"] = self.optdone
+
+        thermochemistry = self.thermochemistry
+        if "final_entropy_term" in thermochemistry:
+            thermochemistry["entropy"] = (
+                thermochemistry.pop("final_entropy_term")
+                / thermochemistry["temperature"]
+            )
+        result_dict.update(thermochemistry)
+
+        for key in ["scfenergies", "final_sp_energy", "ccenergies"]:
+            if getattr(self, key):
+                result_dict[key] = getattr(self, key)
+        if self.energy_corrections:
+            result_dict["energy_corrections"] = self.energy_corrections
+
+        if self.atomcoords:
+            result_dict["atomcoords"] = self.atomcoords
+            result_dict["atomlabels"] = self.atomlabels
+
+        if self.frequencies:
+            n_zero_frequencies = 0
+            while (
+                n_zero_frequencies < min(max_zero_frequencies, len(self.frequencies))
+                and self.frequencies[n_zero_frequencies] == 0
+            ):
+                n_zero_frequencies += 1
+            result_dict["vibfreqs"] = self.frequencies[n_zero_frequencies:]
+            # modes without IR intensity are missing in the IR spectrum
+            result_dict["vibirs"] = [
+                self.ir_intensities.get(mode, 0.0)
+                for mode in range(n_zero_frequencies, len(self.frequencies))
+            ]
+
+        result_dict["metadata"] = self.metadata
+        return result_dict
+
+
+def parse_orca_output(output_file):
+    """
+    Parse an ORCA output file in a single pass.
+
+    Args:
+        output_file (str|Path): Path to the ORCA output file.
+
+    Raises:
+        ValueError: If the file is not an ORCA output.
+
+    Returns:
+        dict: The parsed results with the same keys and units as the cclib attributes.
+    """
+    scanner = _OrcaOutputScanner()
+    with open(output_file, "r", encoding="utf-8", errors="replace") as f:
+        scanner.scan(f)
+    return scanner.results(output_file)
@@ -0,0 +1,147 @@
+"""
+This module provides the parse cache, which makes sure an output file is only parsed once.
+
+Every _calc_result.json file records the fingerprint of the output it was parsed from
+(file size, modification time, parser version and optionally a content hash).
+The fingerprint moves with the calculation dir when a job is moved between the working,
+finished and failed dirs, so the result dashboard, the result collection of the work managers
+and the restart of jobs all see the same cache entry. The output is only parsed again
+if the output file or the parser changed.
+
+Decoded result files are kept in a small LRU cache, so repeatedly loading the same results
+(e.g. when the selection in the result dashboard changes) doesn't decode the json files again.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import cclib
+
+from script_maker2000.orca_parser import parser_version as orca_parser_version
+
+# key of the fingerprint in the _calc_result.json files
+parse_info_key = "parse_info"
+
+
+def get_parser_version(use_cclib=False):
+    if use_cclib:
+        return f"cclib-{cclib.__version__}"
+    return f"orca_parser-{orca_parser_version}"
+
+
+def get_content_hash(file_path, chunk_size=1024 * 1024):
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_output_fingerprint(output_file, use_cclib=False, use_content_hash=False):
+    """
+    Get the fingerprint of an output file, which is stored in the parsed result file.
+
+    Args:
+        output_file (str|Path): The output file.
+        use_cclib (bool, optional): Whether the file is parsed with cclib. Defaults to False.
+        use_content_hash (bool, optional): Add a hash of the file content. Defaults to False.
+
+    Returns:
+        dict: The fingerprint.
+    """
+    stat = os.stat(output_file)
+    fingerprint = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "parser": get_parser_version(use_cclib),
+    }
+    if use_content_hash:
+        fingerprint["sha256"] = get_content_hash(output_file)
+    return fingerprint
+
+
+def is_fingerprint_current(stored_fingerprint, output_file, fingerprint):
+    """
+    Check if a stored fingerprint still belongs to the output file.
+
+    The modification time changes when a file is copied (e.g. downloaded from the cluster),
+    in this case the content hash is compared, if both fingerprints have one.
+
+    Args:
+        stored_fingerprint (dict): The fingerprint in the result file.
+        output_file (str|Path): The output file.
+        fingerprint (dict): The current fingerprint of the output file.
+
+    Returns:
+        bool: True if the stored results are up to date.
+    """
+    if not stored_fingerprint:
+        return False
+    if stored_fingerprint.get("parser") != fingerprint["parser"]:
+        return False
+    if stored_fingerprint.get("size") != fingerprint["size"]:
+        return False
+    if stored_fingerprint.get("mtime_ns") == fingerprint["mtime_ns"]:
+        return True
+    if "sha256" not in stored_fingerprint:
+        return False
+    content_hash = fingerprint.get("sha256") or get_content_hash(output_file)
+    return stored_fingerprint["sha256"] == content_hash
+
+
+class ResultFileCache:
+    """
+    LRU cache of decoded _calc_result.json files.
+
+    Entries are keyed by the path, size and modification time of the result file,
+    so rewritten files are decoded again.
+    """
+
+    def __init__(self, max_size=512):
+        """
+        Initializes a ResultFileCache.
+
+        Args:
+            max_size (int, optional): Number of decoded files to keep. Defaults to 512.
+        """
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def load(self, json_file):
+        """
+        Load a result file. The returned dict is shared, it must not be changed.
+
+        Args:
+            json_file (str|Path): The result file.
+
+        Returns:
+            dict: The decoded results.
+        """
+        json_file = Path(json_file)
+        stat = os.stat(json_file)
+        key = (str(json_file), stat.st_size, stat.st_mtime_ns)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        with open(json_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        self._cache[key] = data
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return data
+
+    def clear(self):
+        self._cache.clear()
+
+
+# shared by all result readers of a process
+result_file_cache = ResultFileCache()
@@ -0,0 +1,188 @@
+"""
+This module provides the ResultParser, which parses the output of finished calculations
+in a process pool shared by all work managers of a batch run.
+
+Parsing an output file with cclib can take several seconds for large outputs.
+Running it in the event loop would block all work managers for that time,
+so the parsing is done in separate processes while the managers keep working.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from script_maker2000.analysis import parse_output_file
+
+# queue of the worker process to report the parses it started, set by the pool initializer
+_started_queue = None
+
+
+def _init_worker(started_queue):
+    global _started_queue
+    _started_queue = started_queue
+
+
+def _parse_in_worker(token, *args):
+    # the timeout of a parse starts once a worker picked it up
+    _started_queue.put(token)
+    return parse_output_file(*args)
+
+
+class ResultParser:
+    """
+    Bounded process pool for parsing the output files of finished calculations.
+
+    At most `max_workers` files are handed to the pool at the same time,
+    further requests wait until a worker is free. Every file has a timeout that starts
+    once a worker picked it up, errors are raised to the caller, which decides what happens to the job.
+    A parse that timed out can't be cancelled, so the pool is stopped and a new one is started
+    for the next request.
+    """
+
+    def __init__(
+        self, max_workers=None, timeout=600, use_cclib=False, use_content_hash=True
+    ):
+        """
+        Initializes a ResultParser.
+
+        Args:
+            max_workers (int, optional): Number of worker processes. Defaults to None (number of CPUs, at most 4).
+            timeout (float, optional): Timeout in seconds for parsing a single output. Defaults to 600.
+            use_cclib (bool, optional): Parse the outputs with cclib instead of the ORCA output parser.
+                Defaults to False.
+            use_content_hash (bool, optional): Store a hash of the outputs with the results,
+                so they aren't parsed again after being copied. Defaults to True.
+        """
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+        self.max_workers = max(int(max_workers), 1)
+        self.timeout = timeout
+        self.use_cclib = use_cclib
+        self.use_content_hash = use_content_hash
+
+        self.log = logging.getLogger("ResultParser")
+
+        # the pool is started on the first request
+        self._executor = None
+        self._started_queue = None
+        # token of a running parse -> time.monotonic() when a worker started it, None until then
+        self._start_times = {}
+        self._tokens = itertools.count()
+
+        # asyncio primitives are bound to the event loop they are first used in
+        self._loop = None
+        self._semaphore = None
+
+    def _init_loop_primitives(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._started_queue = multiprocessing.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self._started_queue,),
+            )
+        return self._executor
+
+    def _collect_start_times(self):
+        while True:
+            try:
+                token = self._started_queue.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                return
+            # parses that already returned are skipped
+            if token in self._start_times:
+                self._start_times[token] = time.monotonic()
+
+    def _recycle(self, executor):
+        """Stop the worker processes of `executor`, the next request starts a new pool."""
+        if executor is not self._executor:
+            # already replaced by another request
+            return
+        # the processes are terminated, running parses can't be cancelled otherwise
+        for process in list((executor._processes or {}).values()):  # noqa
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._started_queue.close()
+        self._executor = None
+        self._started_queue = None
+        self._start_times.clear()
+
+    async def parse(self, output_dir, failed_reason=None):
+        """
+        Parse the output in `output_dir` and write the _calc_result.json file next to it.
+
+        Args:
+            output_dir (Path): The directory of the calculation.
+            failed_reason (str, optional): The failed reason of the job, if it failed. Defaults to None.
+
+        Raises:
+            TimeoutError: If the parsing took longer than `timeout` seconds.
+            Exception: Any error raised while parsing the output.
+
+        Returns:
+            Path: The path to the _calc_result.json file.
+        """
+        self._init_loop_primitives()
+
+        async with self._semaphore:
+            executor = self.executor
+            token = next(self._tokens)
+            self._start_times[token] = None
+            future = self._loop.run_in_executor(
+                executor,
+                _parse_in_worker,
+                token,
+                output_dir,
+                failed_reason,
+                self.use_cclib,
+                self.use_content_hash,
+            )
+            poll_interval = min(max(self.timeout / 10, 0.05), 1)
+            try:
+                while True:
+                    done, _ = await asyncio.wait({future}, timeout=poll_interval)
+                    if done:
+                        return future.result()
+                    self._collect_start_times()
+                    start_time = self._start_times.get(token)
+                    if (
+                        start_time is not None
+                        and time.monotonic() - start_time >= self.timeout
+                    ):
+                        self.log.error(
+                            "Parsing %s timed out, restarting the result parser pool.",
+                            output_dir,
+                        )
+                        self._recycle(executor)
+                        raise TimeoutError(
+                            f"Parsing {output_dir} took longer than {self.timeout} s."
+                        )
+            except BrokenProcessPool:
+                # a worker died (e.g. out of memory), the next request starts a new pool
+                self.log.error("Result parser pool broke while parsing %s.", output_dir)
+                if executor is self._executor:
+                    self._executor = None
+                raise
+            finally:
+                self._start_times.pop(token, None)
+
+    def shutdown(self):
+        """Stop the worker processes, parses that have not started yet are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._started_queue.close()
+            self._started_queue = None
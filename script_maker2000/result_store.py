@@ -0,0 +1,372 @@
+"""
+This module provides the result store, which keeps the parsed results of all calculations of a batch run
+in a few files instead of one _calc_result.json per calculation.
+
+The store is written to finished/results/result_store at the end of a batch run:
+
+- table.json: one column per scalar or dict entry (charge, enthalpy, metadata, ...),
+  with one row per calculation, keyed by the name of the result file,
+  and the modification time of every result file when it was stored.
+- <entry>.npy and <entry>_bounds.npy: the array entries (scfenergies, vibfreqs, atomcoords, ...)
+  of all calculations concatenated into one array. Row i covers bounds[i]:bounds[i + 1].
+
+Loading the results of a batch run therefore needs one json parse and memory-mapped array reads,
+independent of the number of calculations.
+Result files that were written again after the store (e.g. a job was restarted) are read from the file instead.
+"""
+
+import json
+import os
+import shutil
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from script_maker2000.analysis import (
+    single_value_entries,
+    multi_value_entries,
+    dict_entries,
+    special_entries,
+    extract_infos_from_results,
+    extract_result_data,
+    project_entries,
+)
+
+result_store_name = "result_store"
+result_store_version = 1
+
+# entries that are stored as concatenated numpy arrays
+array_entries = [
+    "scfenergies",
+    "final_sp_energy",
+    "ccenergies",
+    "vibfreqs",
+    "vibirs",
+    "atomcoords",
+]
+# all other entries used by extract_result_data are stored in the table
+table_entries = [
+    entry
+    for entry in single_value_entries
+    + multi_value_entries
+    + dict_entries
+    + special_entries
+    + ["atomlabels"]
+    if entry not in array_entries
+]
+
+
+def get_result_store_dir(raw_results_dir):
+    """
+    Get the result store of the batch run the raw results dir belongs to.
+
+    Args:
+        raw_results_dir (str|Path): The finished/raw_results dir of a batch run.
+
+    Returns:
+        Path: The result store dir.
+    """
+    return Path(raw_results_dir).parent / "results" / result_store_name
+
+
+def find_result_store(result_dir):
+    """
+    Find the result store for a calculation dir of a batch run.
+
+    Args:
+        result_dir (str|Path): A dir inside finished/raw_results of a batch run.
+
+    Returns:
+        tuple: (store dir, raw results dir) or (None, None) if there is no result store.
+    """
+    result_dir = Path(result_dir)
+    for parent in [result_dir] + list(result_dir.parents):
+        if parent.name == "raw_results":
+            store_dir = get_result_store_dir(parent)
+            if (store_dir / "table.json").exists():
+                return store_dir, parent
+            break
+    return None, None
+
+
+def write_result_store(raw_results_dir):
+    """
+    Collect all _calc_result.json files of a batch run into its result store.
+
+    The store is written next to the old one and replaces it afterwards,
+    so readers never see a partly written store.
+
+    Args:
+        raw_results_dir (str|Path): The finished/raw_results dir of the batch run.
+
+    Returns:
+        Path: The result store dir.
+    """
+    raw_results_dir = Path(raw_results_dir)
+    store_dir = get_result_store_dir(raw_results_dir)
+
+    names = []
+    dirnames = []
+    mtimes = []
+    columns = {entry: [] for entry in table_entries}
+    arrays = {entry: [] for entry in array_entries}
+    bounds = {entry: [0] for entry in array_entries}
+
+    for result_file in sorted(raw_results_dir.glob("**/*_calc_result.json")):
+        # stat before reading, a file changed while reading is read again from the file
+        mtimes.append(os.stat(result_file).st_mtime_ns)
+        with open(result_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        names.append(result_file.name.split("_calc_result.json")[0])
+        dirnames.append(str(result_file.parent.relative_to(raw_results_dir)))
+
+        for entry in table_entries:
+            columns[entry].append(data.get(entry))
+
+        for entry in array_entries:
+            values = np.asarray(data.get(entry, []), dtype=float)
+            if entry == "atomcoords":
+                # all geometries of a calculation are stacked, natom is the length of atomlabels
+                values = values.reshape(-1, 3)
+            arrays[entry].append(values)
+            bounds[entry].append(bounds[entry][-1] + len(values))
+
+    tmp_store_dir = store_dir.with_name(store_dir.name + ".tmp")
+    if tmp_store_dir.exists():
+        shutil.rmtree(tmp_store_dir)
+    tmp_store_dir.mkdir(parents=True)
+
+    for entry in array_entries:
+        if arrays[entry]:
+            values = np.concatenate(arrays[entry])
+        else:
+            values = np.zeros((0, 3) if entry == "atomcoords" else 0)
+        np.save(tmp_store_dir / f"{entry}.npy", values)
+        np.save(
+            tmp_store_dir / f"{entry}_bounds.npy", np.asarray(bounds[entry], np.int64)
+        )
+
+    # the table is written last, it marks the store as complete
+    table = {
+        "version": result_store_version,
+        "names": names,
+        "dirnames": dirnames,
+        "mtimes": mtimes,
+        "columns": columns,
+    }
+    with open(tmp_store_dir / "table.json", "w", encoding="utf-8") as f:
+        json.dump(table, f)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    os.replace(tmp_store_dir, store_dir)
+
+    return store_dir
+
+
+class ResultStore:
+    """
+    Read access to a result store. The arrays are memory-mapped, so only the selected rows are read.
+    """
+
+    def __init__(self, store_dir, raw_results_dir):
+        """
+        Initializes a ResultStore.
+
+        Args:
+            store_dir (str|Path): The result store dir.
+            raw_results_dir (str|Path): The raw results dir the stored dirnames are relative to.
+        """
+        self.store_dir = Path(store_dir)
+        self.raw_results_dir = Path(raw_results_dir)
+
+        with open(self.store_dir / "table.json", "r", encoding="utf-8") as f:
+            table = json.load(f)
+        if table["version"] != result_store_version:
+            raise ValueError(
+                f"Result store {self.store_dir} has version {table['version']}, "
+                + f"expected {result_store_version}."
+            )
+
+        self.names = table["names"]
+        self.dirnames = [
+            self.raw_results_dir / dirname for dirname in table["dirnames"]
+        ]
+        self.columns = table["columns"]
+        # stores written before the mtimes were added are compared with the time the store was written
+        self.mtimes = table.get("mtimes")
+        self.store_mtime_ns = os.stat(self.store_dir / "table.json").st_mtime_ns
+
+        self._rows_per_dir = defaultdict(list)
+        for i, dirname in enumerate(self.dirnames):
+            self._rows_per_dir[dirname].append(i)
+
+        self.arrays = {}
+        self.bounds = {}
+        for entry in array_entries:
+            self.arrays[entry] = np.load(self.store_dir / f"{entry}.npy", mmap_mode="r")
+            self.bounds[entry] = np.load(self.store_dir / f"{entry}_bounds.npy")
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows_in_dir(self, result_dir):
+        """
+        Get the rows of all results inside a dir.
+
+        Args:
+            result_dir (str|Path): The dir to search in.
+
+        Returns:
+            list: The row indices.
+        """
+        result_dir = Path(result_dir)
+        # usually the dir of a single calculation is selected
+        if result_dir in self._rows_per_dir:
+            return self._rows_per_dir[result_dir]
+        return [
+            i
+            for i, dirname in enumerate(self.dirnames)
+            if result_dir in dirname.parents
+        ]
+
+    def is_row_current(self, row):
+        """
+        Check if the result file of a row wasn't changed since the store was written.
+
+        Args:
+            row (int): The row index.
+
+        Returns:
+            bool: False if the result file is newer than the stored results.
+        """
+        result_file = self.dirnames[row] / f"{self.names[row]}_calc_result.json"
+        try:
+            mtime_ns = os.stat(result_file).st_mtime_ns
+        except FileNotFoundError:
+            # e.g. the raw results were removed, the store is all that is left
+            return True
+        if self.mtimes is None:
+            return mtime_ns <= self.store_mtime_ns
+        return mtime_ns == self.mtimes[row]
+
+    def get_data(self, row, entries=None):
+        """
+        Get the stored results of one calculation in the format of the _calc_result.json files.
+        Only the atomcoords are returned as an array.
+
+        Args:
+            row (int): The row index.
+            entries (list, optional): Only read these entries. Defaults to None (all entries).
+
+        Returns:
+            dict: The result data.
+        """
+        columns = project_entries(self.columns, entries)
+        data = {
+            entry: values[row]
+            for entry, values in columns.items()
+            if values[row] is not None
+        }
+
+        for entry in array_entries:
+            if entries is not None and entry not in entries:
+                continue
+            start, end = self.bounds[entry][row], self.bounds[entry][row + 1]
+            if start == end:
+                continue
+            values = np.asarray(self.arrays[entry][start:end])
+            if entry == "atomcoords":
+                # the trajectory stays an array, extract_result_data keeps it as one
+                natom = len(data.get("atomlabels", [])) or data["natom"]
+                data[entry] = values.reshape(-1, natom, 3)
+            else:
+                data[entry] = values.tolist()
+
+        return data
+
+
+def extract_infos_from_store(result_dirs, entries=None):
+    """
+    Same as `extract_infos_from_results` for a list of dirs,
+    but the results are read from the result store of their batch run if there is one.
+
+    Dirs without a result store or without stored results are read from their _calc_result.json files,
+    as are the calculations whose _calc_result.json file changed after the store was written.
+
+    Args:
+        result_dirs (list): List of calculation dirs.
+        entries (list, optional): Only read these entries, e.g. the ones shown in the result table.
+            Defaults to None (all entries).
+
+    Returns:
+        tuple: A tuple containing the result dictionary and a list of corrections.
+    """
+    result_dict = {}
+    corrections_list = []
+    json_dirs = []
+    # store dir -> ResultStore, every store is only loaded once
+    result_stores = {}
+
+    def _add_corrections(file_corrections):
+        for correction_ in file_corrections:
+            if correction_ not in corrections_list:
+                corrections_list.append(correction_)
+
+    for result_dir in result_dirs:
+        store_dir, raw_results_dir = find_result_store(result_dir)
+        if store_dir is None:
+            json_dirs.append(result_dir)
+            continue
+
+        if store_dir not in result_stores:
+            result_stores[store_dir] = ResultStore(store_dir, raw_results_dir)
+        result_store = result_stores[store_dir]
+
+        rows = result_store.rows_in_dir(result_dir)
+        # results parsed after the store was written
+        if not rows:
+            json_dirs.append(result_dir)
+            continue
+
+        for row in rows:
+            if not result_store.is_row_current(row):
+                if result_store.dirnames[row] not in json_dirs:
+                    json_dirs.append(result_store.dirnames[row])
+                continue
+            name = result_store.names[row]
+            file_dict, file_corrections = extract_result_data(
+                result_store.get_data(row, entries)
+            )
+            file_dict["dirname"] = str(result_store.dirnames[row])
+            file_dict["filename"] = name
+            result_dict[name] = file_dict
+            _add_corrections(file_corrections)
+
+    if json_dirs:
+        json_result_dict, json_corrections = extract_infos_from_results(
+            json_dirs, entries
+        )
+        result_dict.update(json_result_dict)
+        _add_corrections(json_corrections)
+
+    return result_dict, corrections_list
+
+
+def extract_result_details(result_dir, name):
+    """
+    Read all results of a single calculation, e.g. for the detailed view of a result table row.
+
+    Args:
+        result_dir (str|Path): The dir of the calculation.
+        name (str): The name of the calculation.
+
+    Returns:
+        dict: The extracted results, None if there are no results for the calculation.
+    """
+    if not Path(result_dir).is_dir():
+        return None
+    result_dict, _ = extract_infos_from_store([result_dir])
+    return result_dict.get(name)
@@ -0,0 +1,274 @@
+"""
+This module provides the results index, which lists the calculation dirs in the raw_results dir of a batch run.
+
+The result dashboard shows all calculations of all finished batch runs in a tree.
+Listing the raw_results dirs of many batch runs on a network share is slow,
+so the dirs of every batch run are kept in finished/raw_results_index.json:
+
+- one entry per molecule dir with the calculation dirs in it and the failed reason of failed calculations.
+- the modification times of the molecule dir and of its failed dirs. A dir only has to be listed again
+  if a calculation was added to or removed from it, which changes its modification time.
+
+The index is updated by the jobs when their results are moved to the raw_results dir
+and by the dashboard, when it finds a changed dir. The jobs only change the index in memory,
+the batch manager writes the changed indices once per loop with `write_results_indices`.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+results_index_name = "raw_results_index.json"
+results_index_version = 1
+
+# changes within this time of a scan might not change the modification time, these dirs are listed again
+racy_mtime_window_ns = 2 * 10**9
+
+
+def get_results_index_file(raw_results_dir):
+    """
+    Get the index file of a raw_results dir.
+
+    Args:
+        raw_results_dir (str|Path): The finished/raw_results dir of a batch run.
+
+    Returns:
+        Path: The index file.
+    """
+    return Path(raw_results_dir).parent / results_index_name
+
+
+def find_raw_results_dirs(finished_dir):
+    """
+    Find the raw_results dirs of a finished batch run.
+
+    Args:
+        finished_dir (str|Path): The output dir of the batch run.
+
+    Returns:
+        list: The raw_results dirs.
+    """
+    finished_dir = Path(finished_dir)
+    raw_results_dir = finished_dir / "finished" / "raw_results"
+    if raw_results_dir.is_dir():
+        return [raw_results_dir]
+    # e.g. a dir containing several batch runs
+    return sorted(path for path in finished_dir.glob("**/raw_results") if path.is_dir())
+
+
+def _get_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _sub_dirs(path):
+    return sorted(sub_dir for sub_dir in path.iterdir() if sub_dir.is_dir())
+
+
+class ResultsIndex:
+    """
+    Index of the calculation dirs in a raw_results dir.
+    """
+
+    def __init__(self, raw_results_dir):
+        """
+        Initializes a ResultsIndex and loads the index file, if it exists.
+
+        Args:
+            raw_results_dir (str|Path): The finished/raw_results dir of a batch run.
+        """
+        self.raw_results_dir = Path(raw_results_dir)
+        self.index_file = get_results_index_file(self.raw_results_dir)
+        self.log = logging.getLogger("ResultsIndex")
+
+        self.raw_results_mtime_ns = None
+        # molecule dir name -> {"dirs": {dir: mtime_ns}, "calcs": [[calc dir, failed reason]]}
+        self.mol_dirs = {}
+        # the index was changed since it was last written
+        self.dirty = False
+
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if index.get("version") != results_index_version:
+            return
+        self.raw_results_mtime_ns = index["raw_results_mtime_ns"]
+        self.mol_dirs = index["mol_dirs"]
+
+    def write(self):
+        """Write the index file, it is replaced in one step."""
+        self.dirty = False
+        index = {
+            "version": results_index_version,
+            "raw_results_mtime_ns": self.raw_results_mtime_ns,
+            "mol_dirs": self.mol_dirs,
+        }
+        tmp_index_file = self.index_file.with_name(
+            f"{self.index_file.name}.{os.getpid()}.tmp"
+        )
+        try:
+            with open(tmp_index_file, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_index_file, self.index_file)
+        except OSError as e:
+            # the index is only a cache, e.g. the batch run might not be writable
+            self.log.warning(f"Could not write {self.index_file}: {e}")
+
+    @staticmethod
+    def _stable_mtime_ns(path, scan_start_ns):
+        mtime_ns = _get_mtime_ns(path)
+        if mtime_ns is None or mtime_ns > scan_start_ns - racy_mtime_window_ns:
+            # the dir might change again without a new modification time
+            return None
+        return mtime_ns
+
+    def _scan_mol_dir(self, mol_name):
+        scan_start_ns = time.time_ns()
+        mol_main_dir = self.raw_results_dir / mol_name
+
+        mol_entry = {
+            "dirs": {".": self._stable_mtime_ns(mol_main_dir, scan_start_ns)},
+            "calcs": [],
+        }
+        for mol_sub_dir in _sub_dirs(mol_main_dir):
+            if "failed" not in mol_sub_dir.stem:
+                mol_entry["calcs"].append([mol_sub_dir.name, None])
+                continue
+
+            mol_entry["dirs"][mol_sub_dir.name] = self._stable_mtime_ns(
+                mol_sub_dir, scan_start_ns
+            )
+            for failed_reason_dir in _sub_dirs(mol_sub_dir):
+                failed_reason_path = f"{mol_sub_dir.name}/{failed_reason_dir.name}"
+                mol_entry["dirs"][failed_reason_path] = self._stable_mtime_ns(
+                    failed_reason_dir, scan_start_ns
+                )
+                for failed_mol_dir in _sub_dirs(failed_reason_dir):
+                    mol_entry["calcs"].append(
+                        [
+                            f"{failed_reason_path}/{failed_mol_dir.name}",
+                            failed_reason_dir.stem,
+                        ]
+                    )
+
+        self.mol_dirs[mol_name] = mol_entry
+
+    def _is_mol_dir_current(self, mol_name):
+        mol_main_dir = self.raw_results_dir / mol_name
+        for dir_name, mtime_ns in self.mol_dirs[mol_name]["dirs"].items():
+            if mtime_ns is None or _get_mtime_ns(mol_main_dir / dir_name) != mtime_ns:
+                return False
+        return True
+
+    def refresh(self):
+        """
+        Update the index from the raw_results dir. Only the dirs with a new modification time are listed again.
+
+        Returns:
+            list: (calculation dir, failed reason) of all calculations in the molecule dirs that were listed again.
+        """
+        changed_mol_names = []
+
+        scan_start_ns = time.time_ns()
+        raw_results_mtime_ns = _get_mtime_ns(self.raw_results_dir)
+        if raw_results_mtime_ns is None:
+            self.mol_dirs = {}
+            return []
+
+        if (
+            self.raw_results_mtime_ns is None
+            or raw_results_mtime_ns != self.raw_results_mtime_ns
+        ):
+            mol_names = {mol_dir.name for mol_dir in _sub_dirs(self.raw_results_dir)}
+            for mol_name in list(self.mol_dirs):
+                if mol_name not in mol_names:
+                    del self.mol_dirs[mol_name]
+            changed_mol_names.extend(sorted(mol_names - set(self.mol_dirs)))
+            self.raw_results_mtime_ns = self._stable_mtime_ns(
+                self.raw_results_dir, scan_start_ns
+            )
+
+        for mol_name in list(self.mol_dirs):
+            if not self._is_mol_dir_current(mol_name):
+                changed_mol_names.append(mol_name)
+
+        changed_calcs = []
+        for mol_name in changed_mol_names:
+            if not (self.raw_results_dir / mol_name).is_dir():
+                self.mol_dirs.pop(mol_name, None)
+                continue
+            self._scan_mol_dir(mol_name)
+            changed_calcs.extend(
+                (self.raw_results_dir / mol_name / calc_dir, failed_reason)
+                for calc_dir, failed_reason in self.mol_dirs[mol_name]["calcs"]
+            )
+
+        if changed_mol_names:
+            self.write()
+        return changed_calcs
+
+    def update_mol_dir(self, mol_name):
+        """
+        List a single molecule dir again, e.g. after results were moved into it.
+        The index is only marked as changed, call `write_if_dirty` to write it.
+
+        Args:
+            mol_name (str): The name of the molecule dir.
+        """
+        if (self.raw_results_dir / mol_name).is_dir():
+            self._scan_mol_dir(mol_name)
+        else:
+            self.mol_dirs.pop(mol_name, None)
+        self.dirty = True
+
+    def write_if_dirty(self):
+        """Write the index file if it was changed since it was last written."""
+        if self.dirty:
+            self.write()
+
+    def iter_calcs(self):
+        """
+        Iterate over all indexed calculations.
+
+        Yields:
+            tuple: (molecule dir, calculation dir, failed reason), the failed reason is None for finished calculations.
+        """
+        for mol_name in sorted(self.mol_dirs):
+            mol_main_dir = self.raw_results_dir / mol_name
+            for calc_dir, failed_reason in self.mol_dirs[mol_name]["calcs"]:
+                yield mol_main_dir, mol_main_dir / calc_dir, failed_reason
+
+
+# raw_results dir -> ResultsIndex, shared by all callers of a process
+_results_indices = {}
+
+
+def get_results_index(raw_results_dir):
+    """
+    Get the index of a raw_results dir. The index is kept in memory and only loaded once per process.
+
+    Args:
+        raw_results_dir (str|Path): The finished/raw_results dir of a batch run.
+
+    Returns:
+        ResultsIndex: The index, call `refresh` to pick up changes of the dirs.
+    """
+    key = str(Path(raw_results_dir).resolve())
+    if key not in _results_indices:
+        _results_indices[key] = ResultsIndex(raw_results_dir)
+    return _results_indices[key]
+
+
+def write_results_indices():
+    """Write all indices of this process that were changed since they were last written."""
+    for results_index in _results_indices.values():
+        results_index.write_if_dirty()
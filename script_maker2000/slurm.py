@@ -1,3 +1,19 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+
+# name of the dir in the output dir of a batch run that receives the completion records of the jobs
+completion_spool_name = "completion_spool"
+
+
 class Slurm_Script:
 
     def __init__(self, main_config: dict, specific_config: dict):
@@ -27,3 +43,520 @@ class Slurm_Script:
         """
 
         raise NotImplementedError()
+
+
+async def _exec_subprocess(*args):
+    """
+    Run a command as an asyncio subprocess and wait for it to finish.
+
+    If the waiting task is cancelled (e.g. by a timeout) the process is killed.
+
+    Args:
+        args (str): The command and its arguments.
+
+    Returns:
+        tuple: The return code, stdout and stderr of the process.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+    return process.returncode, stdout.decode(), stderr.decode()
+
+
+class SlurmClient:
+    """
+    Non-blocking interface to the slurm commands (sbatch, sacct, ...).
+
+    All work managers of a batch run share one client, so the number of slurm calls running at the
+    same time is limited for the whole batch run while the managers can still overlap their calls.
+    Every call has a timeout and is retried if it fails.
+    """
+
+    def __init__(
+        self,
+        max_parallel_calls=4,
+        timeout=120,
+        retries=3,
+        retry_wait=5,
+    ):
+        """
+        Initializes a SlurmClient.
+
+        Args:
+            max_parallel_calls (int, optional): Maximum number of slurm calls running at the same time.
+                Defaults to 4.
+            timeout (float, optional): Timeout in seconds for a single slurm call. Defaults to 120.
+            retries (int, optional): Number of attempts for a failing slurm call. Defaults to 3.
+            retry_wait (float, optional): Seconds to wait before a retry,
+                this is multiplied by the number of failed attempts. Defaults to 5.
+        """
+        self.max_parallel_calls = max_parallel_calls
+        self.timeout = timeout
+        self.retries = max(int(retries), 1)
+        self.retry_wait = retry_wait
+
+        self.log = logging.getLogger("SlurmClient")
+
+        # asyncio primitives are bound to the event loop they are first used in
+        self._loop = None
+        self._semaphore = None
+        self._submission_lock = None
+
+    def _init_loop_primitives(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_parallel_calls)
+            self._submission_lock = asyncio.Lock()
+
+    @property
+    def submission_lock(self):
+        """
+        Lock that work managers hold while counting running jobs and submitting new ones,
+        so the max_n_jobs limit can't be exceeded by two managers submitting at the same time.
+        """
+        self._init_loop_primitives()
+        return self._submission_lock
+
+    async def run(self, args, retry_on_timeout=True):
+        """
+        Run a slurm command without blocking the event loop.
+
+        Args:
+            args (list): The command and its arguments.
+            retry_on_timeout (bool, optional): Whether to retry a call that timed out.
+                This should be False for calls that are not safe to repeat,
+                e.g. a submission that might already have been accepted. Defaults to True.
+
+        Raises:
+            TimeoutError: If the last attempt timed out.
+
+        Returns:
+            subprocess.CompletedProcess: The finished process. As with `check=False`,
+            a non-zero return code of the last attempt is not raised.
+        """
+        self._init_loop_primitives()
+        args = [str(arg) for arg in args]
+
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with self._semaphore:
+                    returncode, stdout, stderr = await asyncio.wait_for(
+                        _exec_subprocess(*args), timeout=self.timeout
+                    )
+            except asyncio.TimeoutError as e:
+                self.log.warning(
+                    "Call %s timed out after %s s (attempt %d/%d).",
+                    args[0],
+                    self.timeout,
+                    attempt,
+                    self.retries,
+                )
+                if attempt == self.retries or not retry_on_timeout:
+                    raise TimeoutError(
+                        f"Slurm call {args} timed out after {self.timeout} s."
+                    ) from e
+            else:
+                if returncode == 0 or attempt == self.retries:
+                    return subprocess.CompletedProcess(args, returncode, stdout, stderr)
+
+                self.log.warning(
+                    "Call %s failed with exit code %s (attempt %d/%d): %s",
+                    args[0],
+                    returncode,
+                    attempt,
+                    self.retries,
+                    stderr,
+                )
+
+            await asyncio.sleep(self.retry_wait * attempt)
+
+    def _which(self, command):
+        command_path = shutil.which(command)
+        if not command_path:
+            raise ValueError(
+                f"{command} not found in path. Please make sure that slurm is installed on your system."
+            )
+        return command_path
+
+    async def sbatch(self, slurm_file):
+        """
+        Submit a slurm script.
+
+        Args:
+            slurm_file (str|Path): The sbatch script to submit.
+
+        Returns:
+            subprocess.CompletedProcess: The finished sbatch process.
+        """
+        return await self.run(
+            [self._which("sbatch"), slurm_file], retry_on_timeout=False
+        )
+
+    async def sacct(self, slurm_ids, sacct_format_keys):
+        """
+        Collect the accounting data of slurm jobs.
+
+        Args:
+            slurm_ids (list): The slurm job ids.
+            sacct_format_keys (list): The sacct columns to collect.
+
+        Returns:
+            subprocess.CompletedProcess: The finished sacct process with the parsable (-p) output.
+        """
+        slurm_ids = ",".join([str(slurm_id) for slurm_id in slurm_ids])
+        collection_format_arguments = ",".join(sacct_format_keys)
+
+        process = await self.run(
+            [
+                self._which("sacct"),
+                "-j",
+                slurm_ids,
+                "--format",
+                collection_format_arguments,
+                "-p",
+            ]
+        )
+        return process
+
+
+class CompletionSpool:
+    """
+    Directory that receives a small completion record (<slurm_id>.json) from every job when it ends.
+
+    The records are written by the sbatch scripts with an atomic rename,
+    so every file in the spool is complete. New records are found with a cheap scan of the
+    directory, only files that have not been read before are opened.
+    """
+
+    def __init__(self, spool_dir, scan_interval=1):
+        """
+        Initializes a CompletionSpool.
+
+        Args:
+            spool_dir (str|Path): The directory the jobs write their records to.
+            scan_interval (float, optional): Time in seconds between two scans while waiting for records.
+                Defaults to 1.
+        """
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.scan_interval = scan_interval
+
+        self.log = logging.getLogger("CompletionSpool")
+
+        # slurm id -> completion record
+        self.records = {}
+
+    def scan(self):
+        """
+        Read all records that were added since the last scan.
+
+        Returns:
+            dict: slurm id -> completion record of the new records.
+        """
+        new_records = {}
+        with os.scandir(self.spool_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                slurm_id = entry.name[: -len(".json")]
+                if slurm_id in self.records:
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as record_file:
+                        record = json.load(record_file)
+                except (OSError, json.JSONDecodeError):
+                    self.log.warning("Can't read completion record %s.", entry.path)
+                    continue
+                new_records[slurm_id] = record
+
+        self.records.update(new_records)
+        return new_records
+
+
+class SacctPoller:
+    """
+    Central sacct poller shared by all work managers of a batch run.
+
+    Instead of every work manager calling sacct for its own jobs, the poller keeps track of all
+    outstanding slurm ids and collects the state of all of them with a single sacct call.
+    The parsed states are cached for `max_age` seconds, so the managers polling in the same tick
+    are served from the cache. Calls that arrive while a poll is running wait for that poll.
+
+    The efficiency data (the full set of sacct columns) is only collected once per job,
+    for all jobs that reached a terminal state since the last collection.
+
+    With a completion spool the states of finished jobs are taken from their completion records.
+    sacct is then only called after `max_age` seconds without a record, to reconcile records
+    that were never written (e.g. jobs killed by slurm).
+    """
+
+    terminal_states = ["COMPLETED", "TIMEOUT", "FAILED", "CANCELLED"]
+    state_format_keys = ["JobID", "JobName", "State"]
+    efficiency_format_keys = [
+        "JobID",
+        "JobName",
+        "ExitCode",
+        "NCPUS",
+        "CPUTimeRAW",
+        "ElapsedRaw",
+        "TimelimitRaw",
+        "ConsumedEnergyRaw",
+        "MaxDiskRead",
+        "MaxDiskWrite",
+        "MaxVMSize",
+        "ReqMem",
+        "MaxRSS",
+    ]
+
+    def __init__(self, slurm_client, max_age=0, completion_spool=None):
+        """
+        Initializes a SacctPoller.
+
+        Args:
+            slurm_client (SlurmClient): The client used for the sacct calls.
+            max_age (float, optional): Time in seconds a polled state is reused before sacct is called again.
+                Defaults to 0 (every request of a new state calls sacct, concurrent requests are still combined).
+            completion_spool (CompletionSpool, optional): Spool with the completion records of the jobs.
+                Defaults to None (only sacct is used).
+        """
+        self.slurm_client = slurm_client
+        self.max_age = max_age
+        self.completion_spool = completion_spool
+
+        self.log = logging.getLogger("SacctPoller")
+
+        # slurm id -> last polled state
+        self._states = {}
+        # slurm id -> time of the last poll that included the id
+        self._last_polled = {}
+        # ids that have not reached a terminal state yet
+        self._active_ids = set()
+        # terminal ids whose efficiency data has not been collected yet
+        self._pending_efficiency_ids = set()
+        # sacct lines of finished jobs indexed by slurm id, the batch step is folded into the job line
+        self._efficiency_df = pd.DataFrame()
+
+        # poll kind -> (running poll task, ids included in that poll)
+        self._polls = {}
+
+    async def _sacct_df(self, slurm_ids, sacct_format_keys):
+
+        process = await self.slurm_client.sacct(slurm_ids, sacct_format_keys)
+        sacct_output = (process.stdout or "").strip()
+        if getattr(process, "returncode", 0) != 0 or not sacct_output:
+            # e.g. slurmdbd is not reachable, the jobs keep their last state until the next poll
+            self.log.warning(
+                "sacct failed (exit code %s): %s",
+                getattr(process, "returncode", None),
+                (getattr(process, "stderr", None) or "").strip(),
+            )
+            return pd.DataFrame(columns=sacct_format_keys, dtype=str)
+
+        data_io = StringIO(sacct_output)
+        df = pd.read_csv(data_io, sep="|", index_col=False, dtype={"JobID": str})
+
+        return df
+
+    async def _poll(self, kind, slurm_ids, select_ids, fetch):
+        """
+        Run a poll that includes `slurm_ids` or wait for a running one that does.
+
+        Args:
+            kind (str): The kind of poll, only polls of the same kind are combined.
+            slurm_ids (set): The ids the caller needs.
+            select_ids (callable): Returns all ids that should be part of a new poll.
+            fetch (coroutine function): Collects the data for a set of ids.
+        """
+        while True:
+            task, task_ids = self._polls.get(kind, (None, frozenset()))
+            if task is None or task.done():
+                task_ids = frozenset(select_ids())
+                task = asyncio.ensure_future(fetch(task_ids))
+                self._polls[kind] = (task, task_ids)
+                await asyncio.shield(task)
+                return
+
+            await asyncio.shield(task)
+            if slurm_ids <= task_ids:
+                return
+
+    async def job_states(self, slurm_ids):
+        """
+        Get the slurm state of jobs.
+
+        Args:
+            slurm_ids (list): The slurm ids of the jobs.
+
+        Returns:
+            dict: slurm id (str) -> state. Jobs that are not known to sacct yet are missing.
+        """
+        slurm_ids = {str(slurm_id) for slurm_id in slurm_ids}
+        for slurm_id in slurm_ids:
+            if self._states.get(slurm_id) not in self.terminal_states:
+                self._active_ids.add(slurm_id)
+
+        now = time.monotonic()
+        if self.completion_spool is not None:
+            self._read_completion_records()
+            # with a spool, sacct is only asked about jobs without a record for max_age seconds
+            for slurm_id in slurm_ids:
+                self._last_polled.setdefault(slurm_id, now)
+
+        outdated_ids = {
+            slurm_id
+            for slurm_id in slurm_ids
+            if slurm_id in self._active_ids
+            and now - self._last_polled.get(slurm_id, float("-inf")) > self.max_age
+        }
+        if outdated_ids:
+            await self._poll(
+                "state",
+                outdated_ids,
+                lambda: self._active_ids,
+                self._fetch_states,
+            )
+
+        return {
+            slurm_id: self._states[slurm_id]
+            for slurm_id in slurm_ids
+            if slurm_id in self._states
+        }
+
+    def _read_completion_records(self):
+        """Take the states of the jobs with a new completion record from the spool."""
+        new_records = self.completion_spool.scan()
+        for slurm_id, record in new_records.items():
+            self._states[slurm_id] = record["state"]
+            if slurm_id in self._active_ids:
+                self._active_ids.discard(slurm_id)
+                self._pending_efficiency_ids.add(slurm_id)
+
+        if new_records:
+            self.log.debug("Read %d new completion records.", len(new_records))
+
+    async def wait_for_completions(self, timeout, slurm_ids=()):
+        """
+        Wait until one of the given jobs has a completion record or the timeout is reached.
+
+        Without a completion spool this simply waits for `timeout` seconds.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+            slurm_ids (list, optional): The slurm ids of the jobs the caller is waiting for. Defaults to ().
+        """
+        if self.completion_spool is None:
+            await asyncio.sleep(timeout)
+            return
+
+        slurm_ids = {str(slurm_id) for slurm_id in slurm_ids}
+        end_time = time.monotonic() + timeout
+        while True:
+            self._read_completion_records()
+            if any(
+                self._states.get(slurm_id) in self.terminal_states
+                for slurm_id in slurm_ids
+            ):
+                return
+
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                return
+            await asyncio.sleep(
+                min(self.completion_spool.scan_interval, remaining_time)
+            )
+
+    async def _fetch_states(self, slurm_ids):
+
+        poll_time = time.monotonic()
+        slurm_df = await self._sacct_df(slurm_ids, self.state_format_keys)
+
+        # only keep the lines of the jobs themselves, not of their steps (batch, extern)
+        slurm_df = slurm_df[~slurm_df["JobID"].str.contains(".", regex=False)]
+        slurm_df = slurm_df.drop_duplicates("JobID")
+        new_states = dict(zip(slurm_df["JobID"], slurm_df["State"]))
+
+        for slurm_id in slurm_ids:
+            self._last_polled[slurm_id] = poll_time
+            state = new_states.get(slurm_id)
+            if state is None:
+                continue
+            self._states[slurm_id] = state
+            if state in self.terminal_states:
+                self._active_ids.discard(slurm_id)
+                self._pending_efficiency_ids.add(slurm_id)
+
+        self.log.debug(
+            "Polled %d jobs, %d are still active.",
+            len(slurm_ids),
+            len(self._active_ids),
+        )
+
+    async def efficiency_data(self, slurm_ids):
+        """
+        Get the full sacct data of finished jobs.
+
+        The data of every job is only collected once and handed out on the first request.
+
+        Args:
+            slurm_ids (list): The slurm ids of the jobs.
+
+        Returns:
+            pd.DataFrame: One line per job indexed by the slurm id (str).
+                The columns of the job line keep their names,
+                the columns of the batch step line have the suffix "_batch".
+        """
+        slurm_ids = {str(slurm_id) for slurm_id in slurm_ids}
+        missing_ids = slurm_ids - set(self._efficiency_df.index)
+        if missing_ids:
+            await self._poll(
+                "efficiency",
+                missing_ids,
+                lambda: self._pending_efficiency_ids | missing_ids,
+                self._fetch_efficiency_data,
+            )
+
+        requested = self._efficiency_df.index.isin(slurm_ids)
+        efficiency_df = self._efficiency_df[requested]
+        self._efficiency_df = self._efficiency_df[~requested]
+        return efficiency_df
+
+    async def _fetch_efficiency_data(self, slurm_ids):
+
+        slurm_df = await self._sacct_df(slurm_ids, self.efficiency_format_keys)
+        if slurm_df.empty:
+            # the data is collected with the next request
+            return
+        self._pending_efficiency_ids -= slurm_ids
+
+        # fold the batch step (<id>.batch) into the line of its job, the extern step is not used
+        split_ids = slurm_df["JobID"].str.split(".", n=1)
+        base_ids = split_ids.str[0]
+        steps = split_ids.str[1]
+
+        job_lines = slurm_df[steps.isna()].set_index(base_ids[steps.isna()])
+        batch_lines = (
+            slurm_df[steps == "batch"]
+            .drop(columns=["JobID", "JobName"], errors="ignore")
+            .set_index(base_ids[steps == "batch"])
+        )
+        job_lines = job_lines[
+            job_lines.index.isin(slurm_ids) & ~job_lines.index.duplicated()
+        ]
+        batch_lines = batch_lines[~batch_lines.index.duplicated()]
+        efficiency_df = job_lines.join(batch_lines, rsuffix="_batch")
+        efficiency_df.index.name = None
+
+        if self._efficiency_df.empty:
+            self._efficiency_df = efficiency_df
+        else:
+            self._efficiency_df = pd.concat([self._efficiency_df, efficiency_df])
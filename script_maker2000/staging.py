@@ -0,0 +1,145 @@
+"""
+This module provides the file staging between the layers of a batch run.
+
+All dirs of a batch run (start_input_files, working/<config key>/..., finished/raw_results) live in the same
+output dir, so files don't have to be copied from one layer to the next:
+
+- `stage_file` hardlinks a file if possible, then tries a reflink (copy on write clone) and only copies
+  the file as a last resort, e.g. across file systems. Staged files are never changed in place, the calculations
+  write new files into their output dirs.
+- `move_path` renames a file or dir and only falls back to shutil.move across file systems.
+- `make_dirs` creates many dirs with as few system calls as possible, parent dirs that are known to exist
+  are cached instead of being checked with every mkdir.
+"""
+
+import errno
+import os
+import shutil
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # not available on windows
+    fcntl = None
+
+# ioctl request of linux to clone a file, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+# dirs that are known to exist, the cache is only a hint and is corrected if a dir was removed
+_known_dirs = set()
+_known_dirs_lock = threading.Lock()
+
+
+def _mkdir(path):
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        if not path.is_dir():
+            raise
+    except FileNotFoundError:
+        # the parent is missing, e.g. removed since it was cached
+        with _known_dirs_lock:
+            _known_dirs.discard(path.parent)
+        path.mkdir(parents=True, exist_ok=True)
+    with _known_dirs_lock:
+        _known_dirs.add(path.parent)
+
+
+def make_dirs(dirs):
+    """
+    Create dirs and their missing parents.
+
+    Every dir costs a single mkdir call if its parent was created or seen before,
+    the dirs of one layer transition usually share a few parents.
+
+    Args:
+        dirs (iterable): The dirs (str|Path) to create. Existing dirs are skipped.
+    """
+    for path in sorted({Path(path) for path in dirs}):
+        with _known_dirs_lock:
+            parent_known = path.parent in _known_dirs
+        if parent_known:
+            _mkdir(path)
+        else:
+            path.mkdir(parents=True, exist_ok=True)
+            with _known_dirs_lock:
+                _known_dirs.add(path.parent)
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported.")
+    with open(src, "rb") as src_file, open(dst, "xb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def stage_file(src, dst, hardlink=True):
+    """
+    Make a file available at a new path without copying its content if possible.
+
+    The methods are tried in order: hardlink, reflink, copy.
+    Hardlinked files share their content, use `hardlink=False` for files outside the output dir
+    that might be changed in place later on.
+
+    Args:
+        src (str|Path): The file to stage.
+        dst (str|Path): The new path, its parent dir has to exist and the path must not exist.
+        hardlink (bool, optional): Allow hardlinks. Defaults to True.
+
+    Returns:
+        str: The used method, "hardlink", "reflink" or "copy".
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except FileExistsError:
+            raise
+        except OSError:
+            # e.g. EXDEV across file systems or EPERM on file systems without hardlinks
+            pass
+    try:
+        _reflink(src, dst)
+        return "reflink"
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def move_path(src, dst):
+    """
+    Move a file or dir, creating the parent dir of the new path if necessary.
+
+    Like shutil.move, a path moved onto an existing dir is moved into it.
+
+    Args:
+        src (str|Path): The file or dir to move.
+        dst (str|Path): The new path.
+
+    Returns:
+        Path: The new path.
+    """
+    src = Path(src)
+    dst = Path(dst)
+    if dst.is_dir():
+        return Path(shutil.move(src, dst))
+
+    make_dirs([dst.parent])
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+    return dst
@@ -0,0 +1,324 @@
+"""
+This module provides the step archives, which replace the input and output dirs of done calculation steps.
+
+Packing every step dir into its own zip file creates thousands of tiny files on the parallel file system.
+Instead the step dirs of a layer are appended to a few large archives next to them:
+
+- step_archive_0000.zip, step_archive_0001.zip, ...: up to `steps_per_archive` step dirs each,
+  the members are named <step dir name>/<path in the step dir>.
+- step_archive_index.jsonl: one line per step dir with its archive and the offset, sizes and compression
+  of its members, so a single step can be extracted without reading the archives' central directories.
+
+The StepArchiver packs the step dirs in a background thread, so the batch processing loop isn't blocked.
+"""
+
+import json
+import logging
+import shutil
+import struct
+import threading
+import zipfile
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+step_archive_prefix = "step_archive_"
+step_archive_index_name = "step_archive_index.jsonl"
+default_steps_per_archive = 1000
+
+step_archive_compression_methods = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+}
+
+# signature, version, flags, compression, time, date, crc, sizes, name length, extra length
+_local_header_format = "<4s5H3L2H"
+_local_header_size = struct.calcsize(_local_header_format)
+
+
+def _get_archive_path(parent_dir, archive_number):
+    return parent_dir / f"{step_archive_prefix}{archive_number:04d}.zip"
+
+
+def _get_last_archive_number(parent_dir):
+    archive_numbers = [
+        int(archive.stem[len(step_archive_prefix) :])
+        for archive in parent_dir.glob(f"{step_archive_prefix}*.zip")
+        if archive.stem[len(step_archive_prefix) :].isdigit()
+    ]
+    return max(archive_numbers, default=0)
+
+
+def _get_member_entry(zinfo):
+    return {
+        "name": zinfo.filename,
+        "offset": zinfo.header_offset,
+        "compress_size": zinfo.compress_size,
+        "file_size": zinfo.file_size,
+        "compress_type": zinfo.compress_type,
+        "crc": zinfo.CRC,
+    }
+
+
+def _recover_index_entries(zipf, archive_name, indexed_steps):
+    # steps that were packed, but the run was killed before the index was extended
+    members_per_step = defaultdict(list)
+    for zinfo in zipf.infolist():
+        step_name = zinfo.filename.split("/", 1)[0]
+        if step_name not in indexed_steps:
+            members_per_step[step_name].append(_get_member_entry(zinfo))
+    return [
+        {"step": step_name, "archive": archive_name, "members": members}
+        for step_name, members in members_per_step.items()
+    ]
+
+
+def _pack_into_parent(
+    parent_dir, step_dirs, steps_per_archive, compression, compresslevel
+):
+    archive_number = _get_last_archive_number(parent_dir)
+    index_entries = []
+
+    zipf = None
+    try:
+        for step_dir in step_dirs:
+            if zipf is None:
+                zipf = zipfile.ZipFile(
+                    _get_archive_path(parent_dir, archive_number),
+                    "a",
+                    compression=compression,
+                    compresslevel=compresslevel,
+                )
+                archived_steps = {name.split("/", 1)[0] for name in zipf.namelist()}
+                index_entries.extend(
+                    _recover_index_entries(
+                        zipf,
+                        _get_archive_path(parent_dir, archive_number).name,
+                        read_step_archive_index(parent_dir),
+                    )
+                )
+            if step_dir.name in archived_steps:
+                # packed before, but the dir wasn't removed (e.g. the run was killed)
+                continue
+            if len(archived_steps) >= steps_per_archive:
+                zipf.close()
+                archive_number += 1
+                zipf = zipfile.ZipFile(
+                    _get_archive_path(parent_dir, archive_number),
+                    "a",
+                    compression=compression,
+                    compresslevel=compresslevel,
+                )
+                archived_steps = set()
+
+            members = []
+            for file in sorted(step_dir.rglob("*")):
+                if not file.is_file():
+                    continue
+                zipf.write(
+                    file, f"{step_dir.name}/{file.relative_to(step_dir).as_posix()}"
+                )
+                members.append(_get_member_entry(zipf.filelist[-1]))
+            archived_steps.add(step_dir.name)
+            index_entries.append(
+                {
+                    "step": step_dir.name,
+                    "archive": _get_archive_path(parent_dir, archive_number).name,
+                    "members": members,
+                }
+            )
+    finally:
+        if zipf is not None:
+            zipf.close()
+
+    # the index is only extended once the archives are complete
+    with open(parent_dir / step_archive_index_name, "a", encoding="utf-8") as f:
+        for index_entry in index_entries:
+            f.write(json.dumps(index_entry) + "\n")
+
+
+def pack_step_dirs(
+    step_dirs,
+    steps_per_archive=default_steps_per_archive,
+    compression=zipfile.ZIP_DEFLATED,
+    compresslevel=None,
+):
+    """
+    Append step dirs to the step archives of their parent dir and remove them.
+
+    Args:
+        step_dirs (list): The step dirs, e.g. working/<config key>/output/<step id>.
+        steps_per_archive (int, optional): Maximum number of step dirs per archive. Defaults to 1000.
+        compression (int, optional): zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED. Defaults to zipfile.ZIP_DEFLATED.
+        compresslevel (int, optional): The compression level, see zipfile.ZipFile. Defaults to None.
+    """
+    step_dirs_per_parent = defaultdict(list)
+    for step_dir in step_dirs:
+        step_dir = Path(step_dir)
+        if step_dir.is_dir() and step_dir not in step_dirs_per_parent[step_dir.parent]:
+            step_dirs_per_parent[step_dir.parent].append(step_dir)
+
+    for parent_dir, parent_step_dirs in step_dirs_per_parent.items():
+        _pack_into_parent(
+            parent_dir, parent_step_dirs, steps_per_archive, compression, compresslevel
+        )
+        for step_dir in parent_step_dirs:
+            shutil.rmtree(step_dir)
+
+
+def read_step_archive_index(parent_dir):
+    """
+    Read the step archive index of a dir.
+
+    Args:
+        parent_dir (str|Path): The dir containing the step archives.
+
+    Returns:
+        dict: step dir name -> index entry.
+    """
+    index = {}
+    index_file = Path(parent_dir) / step_archive_index_name
+    if not index_file.exists():
+        return index
+    with open(index_file, "r", encoding="utf-8") as f:
+        for line in f:
+            index_entry = json.loads(line)
+            index[index_entry["step"]] = index_entry
+    return index
+
+
+def _read_member(f, member):
+    f.seek(member["offset"])
+    header = struct.unpack(_local_header_format, f.read(_local_header_size))
+    if header[0] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"No zip member at offset {member['offset']}.")
+    name_length, extra_length = header[-2:]
+    f.seek(member["offset"] + _local_header_size + name_length + extra_length)
+    data = f.read(member["compress_size"])
+
+    if member["compress_type"] == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+    elif member["compress_type"] != zipfile.ZIP_STORED:
+        raise NotImplementedError(
+            f"Compression type {member['compress_type']} is not supported."
+        )
+    if zlib.crc32(data) != member["crc"]:
+        raise zipfile.BadZipFile(f"Bad CRC for {member['name']}.")
+    return data
+
+
+def extract_step(parent_dir, step_name, target_dir=None):
+    """
+    Extract a single step dir from the step archives.
+
+    Args:
+        parent_dir (str|Path): The dir containing the step archives.
+        step_name (str): The name of the step dir.
+        target_dir (str|Path, optional): The dir the step dir is restored in. Defaults to None (`parent_dir`).
+
+    Raises:
+        KeyError: If the step isn't in the index.
+
+    Returns:
+        Path: The restored step dir.
+    """
+    parent_dir = Path(parent_dir)
+    target_dir = parent_dir if target_dir is None else Path(target_dir)
+    index_entry = read_step_archive_index(parent_dir)[step_name]
+
+    step_dir = target_dir / step_name
+    step_dir.mkdir(parents=True, exist_ok=True)
+    with open(parent_dir / index_entry["archive"], "rb") as f:
+        for member in index_entry["members"]:
+            file = target_dir / member["name"]
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_bytes(_read_member(f, member))
+    return step_dir
+
+
+class StepArchiver:
+    """
+    Packs the step dirs of done jobs into the step archives in a background thread.
+    """
+
+    def __init__(
+        self,
+        steps_per_archive=default_steps_per_archive,
+        compression="deflated",
+        compresslevel=None,
+    ):
+        """
+        Initializes a StepArchiver.
+
+        Args:
+            steps_per_archive (int, optional): Maximum number of step dirs per archive. Defaults to 1000.
+            compression (str, optional): One of `step_archive_compression_methods`. Defaults to "deflated".
+            compresslevel (int, optional): The compression level, see zipfile.ZipFile. Defaults to None.
+
+        Raises:
+            ValueError: If the compression is unknown.
+        """
+        if compression not in step_archive_compression_methods:
+            raise ValueError(
+                f"Unknown step archive compression {compression}, "
+                + f"use one of {list(step_archive_compression_methods)}."
+            )
+        self.steps_per_archive = max(int(steps_per_archive), 1)
+        self.compression = step_archive_compression_methods[compression]
+        self.compresslevel = compresslevel
+
+        self.log = logging.getLogger("StepArchiver")
+
+        # one thread, so every archive has a single writer
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._draining = False
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="StepArchiver"
+            )
+        return self._executor
+
+    def submit(self, step_dirs):
+        """
+        Queue step dirs for packing. The dirs must not change anymore.
+
+        Args:
+            step_dirs (list): The step dirs.
+        """
+        with self._lock:
+            self._pending.extend(step_dirs)
+            if self._draining:
+                return
+            self._draining = True
+        self.executor.submit(self._drain)
+
+    def _drain(self):
+        # the dirs queued while packing are packed together in the next round
+        while True:
+            with self._lock:
+                step_dirs, self._pending = self._pending, []
+                if not step_dirs:
+                    self._draining = False
+                    return
+            try:
+                pack_step_dirs(
+                    step_dirs,
+                    self.steps_per_archive,
+                    self.compression,
+                    self.compresslevel,
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                # the dirs are kept, they are part of the campaign archive either way
+                self.log.error(f"Could not pack {len(step_dirs)} step dirs: {e}")
+
+    def shutdown(self):
+        """Wait until all queued step dirs are packed."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -94,6 +94,30 @@ class TemplateModule:
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def get_slurm_file(self, job):
+        """
+        Interface to get the slurm script of a prepared job.
+
+        Raises:
+            NotImplementedError: _description_
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def write_job_array(self, jobs, max_parallel=None):
+        """
+        Interface to write the slurm script of a job array for a batch of jobs.
+
+        Args:
+            jobs (list): List of jobs to submit.
+            max_parallel (int, optional): Maximum number of jobs running at the same time.
+
+        Raises:
+            NotImplementedError: _description_
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def restart_jobs(self, job_list, key):
         """
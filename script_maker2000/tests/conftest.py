@@ -393,10 +393,24 @@ def model_sbatch_output(args, slurm_id_cache_list=[]):
     slurm_id_cache_list.append(new_id)
     fake_output_str = f"job {new_id}"
 
+    # job arrays run the sbatch file of every job listed in the index file
+    if Path(args[1]).stem.startswith("array_"):
+        with open(Path(args[1]).parent / "index.txt", "r") as f:
+            input_dirs = [Path(line.strip()) for line in f if line.strip()]
+        for input_dir in input_dirs:
+            model_job_output(input_dir / (input_dir.name + ".sbatch"))
+    else:
+        model_job_output(args[1])
+
+    return fake_output_str
+
+
+def model_job_output(slurm_file):
+
     # get mol id
-    mol_id = Path(args[1]).stem.split("___")[1]
-    step_id = Path(args[1]).stem.split("___")[0]
-    run_id = Path(args[1]).stem
+    mol_id = Path(slurm_file).stem.split("___")[1]
+    step_id = Path(slurm_file).stem.split("___")[0]
+    run_id = Path(slurm_file).stem
 
     # change slurm output if resubmit test is run
 
@@ -421,7 +435,7 @@ def model_sbatch_output(args, slurm_id_cache_list=[]):
         example_output_dir = Path(__file__).parent / "test_data" / "example_outputs"
 
     # get output_dir for this mol_id
-    mol_output_dir = Path(args[1]).parents[2] / "output" / run_id
+    mol_output_dir = Path(slurm_file).parents[2] / "output" / run_id
     try:
         example_output_mol_dir = list(example_output_dir.glob(f"*{mol_id}"))[0]
     except IndexError as e:
@@ -438,8 +452,6 @@ def model_sbatch_output(args, slurm_id_cache_list=[]):
         mol_output_dir.mkdir(exist_ok=True, parents=True)
         shutil.copy(file, mol_output_dir / new_file)
 
-    return fake_output_str
-
 
 def model_sacct_output(args, monkey_patch_job_dict):
     id_list = [
@@ -485,11 +497,12 @@ def model_sacct_output(args, monkey_patch_job_dict):
     job_names = []
 
     for id_trio in id_list:
-        pure_id = int(id_trio[0])
+        # compare as strings to also support array ids like <array_id>_<task_id>
+        pure_id = id_trio[0]
 
         for job in job_dict_.values():
             for value in job.slurm_id_per_key.values():
-                if value == pure_id:
+                if str(value) == pure_id:
                     job_names.append(job.current_step_id)
                     break
     for id_trio, job_name in zip(id_list, job_names):
@@ -500,7 +513,8 @@ def model_sacct_output(args, monkey_patch_job_dict):
             new_line = ""
             for format_option in format_options:
                 if format_option == "JobID":
-                    new_line += str(pure_id) + "|"
+                    # steps are reported as <id>.batch and <id>.extern like sacct does
+                    new_line += str(id_) + "|"
                 elif format_option == "JobName":
                     if id_ == pure_id:
                         new_line += job_name + "|"
@@ -544,6 +558,24 @@ def fake_slurm_function():
     return _fake_slurm_function
 
 
+@pytest.fixture(autouse=True)
+def slurm_calls_via_subprocess_run(monkeypatch):
+    """Route the async slurm calls through subprocess.run so the tests can replace it."""
+
+    async def _exec_subprocess(*args):
+        # look up subprocess.run at call time to use the fake of the current test
+        process = subprocess.run(
+            list(args), shell=False, check=False, capture_output=True, text=True
+        )
+        return (
+            getattr(process, "returncode", 0),
+            process.stdout,
+            getattr(process, "stderr", ""),
+        )
+
+    monkeypatch.setattr("script_maker2000.slurm._exec_subprocess", _exec_subprocess)
+
+
 @pytest.fixture
 def analysis_tmp_dir():
 
@@ -6,13 +6,21 @@ from script_maker2000.cpu_benchmark_analysis import (
 
 from script_maker2000.analysis import (
     extract_infos_from_results,
+    extract_result_data,
+    get_coords_frame,
     parse_output_file,
+    add_broadening,
+    add_broadening_batch,
     # basic_connectivity_check,
 )
+from script_maker2000.orca_parser import parse_orca_output
+from script_maker2000.parse_cache import ResultFileCache
 
+import json
+import shutil
 from pathlib import Path
-
-# import pytest
+import numpy as np
+import pytest
 
 
 def test_extract_efficency_dataframe():
@@ -74,6 +82,71 @@ def test_parse_and_extract(analysis_tmp_dir):
     assert result_dict["imaginary_freq"] is False
 
 
+def test_parse_orca_output(analysis_tmp_dir):
+    test_data_dir = Path(__file__).parent / "test_data" / "analysis_test_data"
+    name = "PBEh_3c_opt__PBEh3c_freq_2cores_sp___C3H9GeNOS"
+    with open(test_data_dir / (name + "_calc_result.json"), "r") as f:
+        cclib_results = json.load(f)
+
+    results = parse_orca_output(analysis_tmp_dir / (name + ".out"))
+    result_data, corrections = extract_result_data(results)
+    cclib_result_data, cclib_corrections = extract_result_data(cclib_results)
+
+    # the analysis sees the same data for both parsers
+    assert set(result_data.keys()) == set(cclib_result_data.keys())
+    assert corrections == cclib_corrections
+    for key, value in cclib_result_data.items():
+        if isinstance(value, (int, float)):
+            assert result_data[key] == pytest.approx(value), key
+        elif key == "coords":
+            assert result_data[key]["symbols"] == value["symbols"]
+            np.testing.assert_array_equal(
+                result_data[key]["positions"], value["positions"]
+            )
+        elif key.startswith("metadata"):
+            assert result_data[key] == value, key
+        else:
+            np.testing.assert_allclose(result_data[key], value)
+
+    # the optimization steps
+    results = parse_orca_output(analysis_tmp_dir / "PBEh_3c_opt___C3H9GeNOS.out")
+    assert results["optdone"] is True
+    assert len(results["atomcoords"]) == len(results["scfenergies"]) == 26
+    assert len(results["atomlabels"]) == results["natom"] == 16
+
+    # the trajectory is one array, the viewer format is built per step
+    coords = extract_result_data(results)[0]["coords"]
+    assert coords["positions"].shape == (26, 16, 3)
+    frame = get_coords_frame(coords, -1)
+    assert len(frame) == 16
+    assert frame[0] == {
+        "symbol": results["atomlabels"][0],
+        "x": results["atomcoords"][-1][0][0],
+        "y": results["atomcoords"][-1][0][1],
+        "z": results["atomcoords"][-1][0][2],
+    }
+    # positions coming back from the dash store are lists
+    coords["positions"] = coords["positions"].tolist()
+    assert get_coords_frame(coords, -1) == frame
+
+    # modes without IR intensity are filled up
+    results = parse_orca_output(analysis_tmp_dir / "FREQ_Sb_5_M016973.out")
+    assert results["vibfreqs"][0] < 0
+    assert len(results["vibfreqs"]) == len(results["vibirs"]) == 3 * 44 - 6
+    assert results["vibirs"][0] == 0
+
+    with pytest.raises(ValueError):
+        parse_orca_output(test_data_dir / (name + "_calc_result.json"))
+
+    # cclib is only used when asked
+    json_file = parse_output_file(analysis_tmp_dir / "dlpno_qz.out", use_cclib=True)
+    with open(json_file, "r") as f:
+        assert "moenergies" in json.load(f)
+    json_file = parse_output_file(analysis_tmp_dir / "dlpno_qz.out")
+    with open(json_file, "r") as f:
+        assert "moenergies" not in json.load(f)
+
+
 # def test_basic_connectivity_check():
 #     # Test with valid dict input
 #     calc_results_dict = {
@@ -287,3 +360,89 @@ def test_parse_and_extract(analysis_tmp_dir):
 #         },  # changed coords
 #     }
 #     assert basic_connectivity_check(calc_results_changed_no_xyz_input) is False
+
+
+def test_parse_cache(analysis_tmp_dir, monkeypatch):
+    output_file = analysis_tmp_dir / "dlpno_qz.out"
+    json_file = parse_output_file(output_file, use_content_hash=True)
+    with open(json_file, "r") as f:
+        results = json.load(f)
+    assert results["parse_info"]["parser"].startswith("orca_parser")
+    assert "sha256" in results["parse_info"]
+
+    def _fail_parse(*args):
+        raise AssertionError("The output was parsed again.")
+
+    monkeypatch.setattr("script_maker2000.analysis.parse_orca_output", _fail_parse)
+
+    # unchanged output, only the failed reason is updated
+    assert parse_output_file(output_file) == json_file
+    parse_output_file(output_file, failed_reason="walltime_error")
+    with open(json_file, "r") as f:
+        assert json.load(f)["Failed"] == "walltime_error"
+
+    # copies have a new modification time, but the same content
+    copied_dir = analysis_tmp_dir / "copy"
+    copied_dir.mkdir()
+    shutil.copy(output_file, copied_dir)
+    shutil.copy(json_file, copied_dir)
+    parse_output_file(copied_dir / "dlpno_qz.out", failed_reason="walltime_error")
+
+    # a changed output is parsed again
+    with open(output_file, "a") as f:
+        f.write("\n")
+    with pytest.raises(AssertionError):
+        parse_output_file(output_file)
+
+
+def test_result_file_cache(analysis_tmp_dir):
+    json_files = [
+        parse_output_file(output_file)
+        for output_file in sorted(analysis_tmp_dir.glob("*.out"))
+    ]
+
+    result_file_cache = ResultFileCache(max_size=2)
+    first_results = result_file_cache.load(json_files[0])
+    assert result_file_cache.load(json_files[0]) is first_results
+
+    for json_file in json_files[1:]:
+        result_file_cache.load(json_file)
+    assert len(result_file_cache) == 2
+    assert result_file_cache.load(json_files[0]) is not first_results
+
+
+@pytest.mark.parametrize("line_profile", ["Gaussian", "Lorentzian"])
+def test_add_broadening(line_profile):
+    energies = [400.0, 1234.5, 1240.0, 3050.2]
+    strengths = [10.0, 0.5, 80.0, 25.0]
+
+    x, y = add_broadening(energies, strengths, line_profile, line_param=10, step=10)
+
+    # reference: sum of the line profiles of all peaks at every grid point
+    assert np.allclose(x, np.arange(350.0, 3100.2, 10))
+    y_expected = np.zeros(len(x))
+    for e, f in zip(energies, strengths):
+        if line_profile == "Gaussian":
+            y_expected += f * np.exp(-(((e - x) / 10) ** 2))
+        else:
+            y_expected += 0.5 * 10 * f / (np.pi * ((x - e) ** 2 + 0.25 * 10**2))
+    assert np.allclose(y, y_expected)
+
+    # the convolution only rounds the peak positions to the grid
+    x_fine, y_fine = add_broadening(energies, strengths, line_profile, step=0.5)
+    _, y_fft = add_broadening(energies, strengths, line_profile, step=0.5, method="fft")
+    assert np.max(np.abs(y_fft - y_fine)) < 1e-2 * np.max(y_fine)
+
+    x_batch, y_batch = add_broadening_batch(
+        [energies, energies[:2], []], [strengths, strengths[:2], []], line_profile
+    )
+    assert np.allclose(x_batch, x)
+    assert y_batch.shape == (3, len(x))
+    assert np.allclose(y_batch[0], y)
+    # the spectra are evaluated on the common grid
+    x_single, y_single = add_broadening(energies[:2], strengths[:2], line_profile)
+    assert np.allclose(y_batch[1][np.isin(x, x_single)], y_single)
+    assert not y_batch[2].any()
+
+    with pytest.raises(ValueError):
+        add_broadening(energies, strengths, "Voigt")
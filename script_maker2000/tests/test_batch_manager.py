@@ -1,12 +1,24 @@
 from pathlib import Path
+import itertools
+import os
 import shutil
 import asyncio
 import pytest
 import json
+import numpy as np
 
 from script_maker2000.batch_manager import BatchManager
+from script_maker2000.job import Job
+from script_maker2000.job_graph import build_step_graph
 from script_maker2000.files import read_batch_config_file
 from script_maker2000.analysis import extract_infos_from_results
+from script_maker2000.result_store import (
+    extract_infos_from_store,
+    extract_result_details,
+    get_result_store_dir,
+)
+from script_maker2000.results_index import ResultsIndex
+from script_maker2000.campaign_archive import extract_campaign_archive
 
 
 def test_batch_manager(clean_tmp_dir, monkeypatch, fake_slurm_function):
@@ -130,6 +142,142 @@ def test_batch_loop_with_files(clean_tmp_dir, monkeypatch, fake_slurm_function):
     assert str(working_dir) in batch_config[config_name]["finished"]
 
 
+def test_step_graph(multilayer_tmp_dir):
+
+    main_config_path = multilayer_tmp_dir / "example_config.json"
+    batch_manager = BatchManager(main_config_path)
+    jobs = list(batch_manager.job_dict.values())
+    step_graph = batch_manager.step_graph
+
+    # one node per distinct (molecule, key prefix)
+    expected_nodes = {
+        (job.mol_id, tuple(job.all_keys[: i + 1]))
+        for job in jobs
+        for i in range(len(job.all_keys))
+    }
+    assert set(step_graph.keys()) == expected_nodes
+    assert len(step_graph) < sum(len(job.all_keys) for job in jobs)
+
+    for (mol_id, keys), node in step_graph.items():
+        assert node.key == keys[-1]
+        for job in node.jobs:
+            assert job.mol_id == mol_id
+            assert tuple(job.all_keys[: len(keys)]) == keys
+            assert job.step_nodes[node.key] is node
+            assert job.current_step_id == node.step_id or job.current_key != node.key
+        for child_key, child_node in node.children.items():
+            assert child_node.keys == keys + (child_key,)
+            assert set(child_node.jobs) <= set(node.jobs)
+
+    # overlapping jobs share the node of their current step
+    for job in jobs:
+        current_node = job.step_nodes[job.current_key]
+        assert set(job.overlapping_jobs) == set(current_node.jobs) - {job}
+
+    # the graph is rebuilt when continuing a run
+    continued_job_dict = batch_manager._jobs_from_backup_dict(
+        {job.unique_job_id: job.export_as_dict() for job in jobs}
+    )
+    assert len(batch_manager.step_graph) == len(expected_nodes)
+    for job in continued_job_dict.values():
+        assert len(job.overlapping_jobs) == len(
+            batch_manager.job_dict[job.unique_job_id].overlapping_jobs
+        )
+
+
+def test_step_graph_three_layers(tmp_path):
+
+    jobs = [
+        Job("mol_1", keys, tmp_path, 0, 1)
+        for keys in itertools.product(["opt"], ["sp_1", "sp_2"], ["freq"])
+    ]
+    step_graph = build_step_graph(jobs)
+    assert len(step_graph) == 5
+
+    for job in jobs:
+        job.current_key = "opt"
+    assert jobs[0].overlapping_jobs == [jobs[1]]
+
+    # same key, but different geometries from sp_1 and sp_2
+    for job in jobs:
+        job.current_key = "freq"
+    assert jobs[0].overlapping_jobs == []
+    assert jobs[0].step_nodes["freq"] is not jobs[1].step_nodes["freq"]
+
+
+def test_step_node_state(tmp_path):
+
+    jobs = [
+        Job("mol_1", keys, tmp_path, 0, 1)
+        for keys in itertools.product(["opt"], ["sp_1", "sp_2"])
+    ]
+    build_step_graph(jobs)
+    for job in jobs:
+        job.start_new_key("opt", 0)
+    primary_job, follower = jobs
+    assert primary_job.runs_step("opt") and not follower.runs_step("opt")
+
+    # the step node owns the state, the follower isn't touched by the submission
+    primary_job.slurm_id_per_key["opt"] = "123"
+    primary_job.current_status = "submitted"
+    assert follower.current_status == "submitted"
+    assert follower.slurm_id_per_key == {"opt": "123"}
+    assert follower.status_per_key == {"opt": "submitted"}
+    assert follower._current_status != primary_job.status_code  # noqa
+
+    primary_job.failed_reason = "unknown_error"
+    primary_job.current_status = "failed"
+    assert follower.check_status_for_key("sp_2") == "failed"
+    assert follower.failed_reason == "unknown_error"
+
+    # backups of older runs marked the followers as submitted_overlapping_job
+    follower_dict = follower.export_as_dict()
+    follower_dict["_current_status"] = "submitted_overlapping_job"
+    follower_dict["status_per_key"] = {"opt": "submitted_overlapping_job"}
+    continued_jobs = [Job.import_from_dict(follower_dict, tmp_path)]
+    build_step_graph(continued_jobs)
+    assert continued_jobs[0].current_status == "submitted"
+    assert continued_jobs[0].step_nodes["opt"].slurm_id == "123"
+
+
+def test_compact_job(tmp_path):
+
+    jobs = [Job(f"mol_{i}", ["opt", "sp"], tmp_path, 0, 1) for i in range(3)]
+    job = jobs[0]
+    # no per job dicts, the layout and the keys are shared
+    assert not hasattr(job, "__dict__")
+    assert job.all_keys is jobs[1].all_keys
+    assert job.current_dirs["input"] is None
+
+    job.start_new_key("opt", 0)
+    assert job.current_dirs["input"] == (
+        tmp_path / "working" / "opt" / "input" / "opt___mol_0"
+    )
+    assert job.current_dirs["walltime_error"] == (
+        tmp_path / "working" / "opt" / "failed" / "walltime_error" / "opt___mol_0"
+    )
+    assert job.finished_per_key["sp"] == (
+        tmp_path / "working" / "sp" / "finished" / "opt__sp___mol_0"
+    )
+    assert job.raw_success_dir == tmp_path / "finished" / "raw_results" / "mol_0"
+
+    job.slurm_id_per_key["opt"] = "123"
+    job.current_status = "submitted"
+    assert job.status_per_key == {"opt": "submitted"}
+    assert job.check_status_for_key("opt") == "submitted"
+    assert job.check_status_for_key("sp") == "not_found"
+    job.status_per_key["sp"] = "some_new_status"
+    assert job.status_per_key["sp"] == "some_new_status"
+    del job.status_per_key["sp"]
+
+    with pytest.raises(ValueError):
+        job.current_key = "freq"
+
+    imported_job = Job.import_from_dict(job.export_as_dict(), tmp_path)
+    assert imported_job.export_as_dict() == job.export_as_dict()
+    assert imported_job.current_dirs["output"] == job.current_dirs["output"]
+
+
 def test_parallel_steps(multilayer_tmp_dir, monkeypatch, fake_slurm_function):
 
     main_config_path = multilayer_tmp_dir / "example_config.json"
@@ -153,7 +301,8 @@ def test_parallel_steps(multilayer_tmp_dir, monkeypatch, fake_slurm_function):
         monkeypatch.setattr("subprocess.run", new_fake_slurm_function)
 
         monkeypatch.setattr(batch_manager, "wait_time", 0.1)
-        monkeypatch.setattr(batch_manager, "max_loop", 10)
+        # the outputs are parsed in worker processes while the batch loop keeps ticking
+        monkeypatch.setattr(batch_manager, "max_loop", -1)
 
         for work_manager_list in batch_manager.work_managers.values():
             for work_manager in work_manager_list:
@@ -196,6 +345,18 @@ def test_parallel_steps(multilayer_tmp_dir, monkeypatch, fake_slurm_function):
     # assert zip exists
     zip_file = batch_manager.working_dir / "output.zip"
     assert zip_file.exists()
+    # the step dirs of the done jobs are packed into the step archives of their layer
+    assert list(
+        batch_manager.working_dir.glob("working/*/output/step_archive_0000.zip")
+    )
+    assert not list(batch_manager.working_dir.glob("working/*/output/archive_*.zip"))
+
+    # the results of the jobs are in the part archives listed in the main archive
+    extract_path = batch_manager.working_dir.parent / "extracted_output"
+    assert list(batch_manager.working_dir.glob("archive_parts/*.zip"))
+    extract_campaign_archive(zip_file, extract_path)
+    assert len(list(extract_path.glob("finished/raw_results/*/failed/*/*"))) == 14
+    assert len(list(extract_path.glob("finished/raw_results/*/[!failed]*"))) == 24
 
     # check the job_dict
 
@@ -219,7 +380,9 @@ def perform_checks(batch_manager):
             with open(json_file, "r") as f:
                 calc_results = json.load(f)
 
-            assert "atomcharges" in calc_results.keys()
+            # only the entries used by the analysis are parsed, cclib attributes like atomcharges are skipped
+            assert "atomcoords" in calc_results.keys()
+            assert "atomcharges" not in calc_results.keys()
             assert calc_results["mult"] == 1
 
     test_dict, _ = extract_infos_from_results(
@@ -231,6 +394,51 @@ def perform_checks(batch_manager):
         assert "mult" in test_dict[key].keys()
         assert "charge" in test_dict[key].keys()
 
+    # the result store of the run contains the same results
+    raw_results_dir = batch_manager.working_dir / "finished" / "raw_results"
+    assert (get_result_store_dir(raw_results_dir) / "table.json").exists()
+    store_dict, _ = extract_infos_from_store([raw_results_dir])
+    # the trajectories are arrays
+    np.testing.assert_equal(store_dict, dict(test_dict))
+
+    # the jobs add their results to the index of the raw_results dir
+    indexed_dirs = {
+        calc_dir for _, calc_dir, _ in ResultsIndex(raw_results_dir).iter_calcs()
+    }
+    assert indexed_dirs
+    assert {Path(entry["dirname"]) for entry in test_dict.values()} <= indexed_dirs
+
+    # the result table only reads the selected entries, the details are read per row
+    table_dict, _ = extract_infos_from_store([raw_results_dir], ["charge", "mult"])
+    assert table_dict.keys() == test_dict.keys()
+    for key, entry in table_dict.items():
+        assert set(entry.keys()) == {"charge", "mult", "dirname", "filename"}
+        np.testing.assert_equal(
+            extract_result_details(entry["dirname"], key), test_dict[key]
+        )
+
+    mol_dir = sorted(raw_results_dir.glob("*"))[0]
+    store_dict, _ = extract_infos_from_store([mol_dir])
+    assert store_dict and all(
+        Path(entry["dirname"]).is_relative_to(mol_dir) for entry in store_dict.values()
+    )
+
+    # result files written after the store are read from the file
+    name, entry = sorted(test_dict.items())[0]
+    json_file = Path(entry["dirname"]) / f"{name}_calc_result.json"
+    with open(json_file, "r") as f:
+        calc_results = json.load(f)
+    calc_results["charge"] = 5
+    with open(json_file, "w") as f:
+        json.dump(calc_results, f)
+    store_mtime_ns = (
+        (get_result_store_dir(raw_results_dir) / "table.json").stat().st_mtime_ns
+    )
+    os.utime(json_file, ns=(store_mtime_ns + 10**9, store_mtime_ns + 10**9))
+    store_dict, _ = extract_infos_from_store([raw_results_dir], ["charge"])
+    assert store_dict[name]["charge"] == 5
+    assert store_dict.keys() == test_dict.keys()
+
 
 @pytest.mark.skipif(shutil.which("sbatch") is not None, reason="Only run locally.")
 def test_multilayer_sucess_resubmit(
@@ -279,12 +487,15 @@ def test_multilayer_sucess_resubmit(
     monkeypatch.setattr("subprocess.run", new_fake_slurm_function)
 
     monkeypatch.setattr(batch_manager, "wait_time", 0.1)
-    monkeypatch.setattr(batch_manager, "max_loop", 10)
+    # the work managers no longer block the event loop while submitting or parsing,
+    # so the batch manager loop runs more often during one work manager loop
+    monkeypatch.setattr(batch_manager, "max_loop", 60)
 
     for work_manager_list in batch_manager.work_managers.values():
         for work_manager in work_manager_list:
             monkeypatch.setattr(work_manager, "wait_time", 0.1)
-            monkeypatch.setattr(work_manager, "max_loop", 8)
+            # the later layers keep looping while the outputs of the earlier ones are parsed
+            monkeypatch.setattr(work_manager, "max_loop", 20)
 
     # first_worker = list(batch_manager.work_managers.values())[0][0]
     # #worker_output = asyncio.run(first_worker.loop())
@@ -330,6 +541,54 @@ def test_multilayer_sucess_resubmit(
     assert results["failed"] == 2
 
 
+def test_job_journal(pre_started_dir):
+
+    main_config_path = pre_started_dir / "example_config.json"
+    batch_manager = BatchManager(main_config_path)
+    working_dir = batch_manager.working_dir
+    journal_file = working_dir / "job_backup_journal.jsonl"
+
+    # the first save writes a full snapshot
+    batch_manager.save_current_jobs()
+    assert not journal_file.exists()
+    with open(working_dir / "job_backup.json", "r") as f:
+        snapshot = json.load(f)
+    assert len(snapshot) == len(batch_manager.job_dict)
+
+    # later saves only append the changed jobs,
+    # i.e. the jobs passing through the step whose state changed
+    job = list(batch_manager.job_dict.values())[0]
+    job.failed_reason = "unknown_error"
+    job.current_status = "failed"
+    batch_manager.save_current_jobs()
+    batch_manager.save_current_jobs()
+
+    with open(journal_file, "r") as f:
+        journal_lines = f.readlines()
+    step_jobs = job.step_nodes[job.current_key].jobs
+    assert len(journal_lines) == len(step_jobs)
+    assert {json.loads(line)["unique_job_id"] for line in journal_lines} == {
+        step_job.unique_job_id for step_job in step_jobs
+    }
+    with open(working_dir / "job_backup.json", "r") as f:
+        assert json.load(f) == snapshot
+
+    # replay the journal, an interrupted last line is skipped
+    with open(journal_file, "a") as f:
+        f.write('{"unique_job_id": "')
+    job_dict = batch_manager._jobs_from_backup_json(working_dir / "job_backup.json")
+    assert len(job_dict) == len(batch_manager.job_dict)
+    assert job_dict[job.unique_job_id].current_status == "failed"
+    assert job_dict[job.unique_job_id].failed_reason == "unknown_error"
+
+    # compaction folds the journal into the snapshot
+    batch_manager.save_current_jobs(compact=True)
+    assert not journal_file.exists()
+    with open(working_dir / "job_backup.json", "r") as f:
+        snapshot = json.load(f)
+    assert snapshot[job.unique_job_id]["_current_status"] == "failed"
+
+
 def test_continue_run(pre_started_dir, monkeypatch, fake_slurm_function):
 
     main_config_path = pre_started_dir / "example_config.json"
@@ -351,7 +610,8 @@ def test_continue_run(pre_started_dir, monkeypatch, fake_slurm_function):
         monkeypatch.setattr("shutil.which", lambda x: x)
 
         monkeypatch.setattr(batch_manager, "wait_time", 0.14)
-        monkeypatch.setattr(batch_manager, "max_loop", 5)
+        # the outputs are parsed in worker processes while the batch manager loop keeps running
+        monkeypatch.setattr(batch_manager, "max_loop", 30)
 
         for work_manager_list in batch_manager.work_managers.values():
             for work_manager in work_manager_list:
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+import zipfile
+import json
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+from script_maker2000.cli import extract_archive
+from script_maker2000.campaign_archive import (
+    CampaignArchiver,
+    archive_manifest_name,
+    extract_campaign_archive,
+    is_job_done,
+)
+
+
+def _make_job(working_dir, unique_job_id, final_dir_names, status="finished"):
+    final_dirs = {}
+    for key in final_dir_names:
+        final_dir = working_dir / "finished" / "raw_results" / "mol" / key
+        final_dir.mkdir(parents=True)
+        (final_dir / f"{key}.out").write_text(f"output of {key}\n" * 100)
+        (final_dir / f"{key}.gbw").write_bytes(b"\0" * 1000)
+        final_dirs[key] = final_dir
+    return SimpleNamespace(
+        unique_job_id=unique_job_id,
+        final_dirs=final_dirs,
+        current_status=status,
+        current_key=final_dir_names[-1],
+        all_keys=final_dir_names,
+    )
+
+
+def test_campaign_archive(tmp_path):
+    working_dir = tmp_path / "output"
+    job_1 = _make_job(working_dir, "opt__sp___mol", ["opt", "sp"])
+    job_2 = _make_job(working_dir, "freq___mol", ["freq"], status="failed")
+    job_3 = _make_job(working_dir, "opt2___mol", ["opt2"], status="submitted")
+    (working_dir / "job_backup.json").write_text("{}")
+
+    assert is_job_done(job_1) and is_job_done(job_2) and not is_job_done(job_3)
+
+    archiver = CampaignArchiver(working_dir, max_workers=2, exclude_patterns=[".gbw"])
+    archiver.archive_job(job_1)
+    # unchanged jobs aren't packed again
+    part_future = archiver._parts[job_1.unique_job_id][1]
+    archiver.archive_job(job_1)
+    assert archiver._parts[job_1.unique_job_id][1] is part_future
+
+    output_file = archiver.finalize([job_1, job_2, job_3], working_dir / "output.zip")
+
+    with zipfile.ZipFile(output_file) as zipf:
+        manifest = json.loads(zipf.read(archive_manifest_name))
+        main_members = set(zipf.namelist())
+    assert manifest["parts"] == {
+        "archive_parts/opt__sp___mol.zip": [
+            "finished/raw_results/mol/opt/opt.out",
+            "finished/raw_results/mol/sp/sp.out",
+        ],
+        "archive_parts/freq___mol.zip": ["finished/raw_results/mol/freq/freq.out"],
+    }
+    # the files of unfinished jobs and all other files are in the main archive
+    assert main_members == {
+        archive_manifest_name,
+        "job_backup.json",
+        "finished/raw_results/mol/opt2/opt2.out",
+    }
+
+    extract_path = tmp_path / "extracted"
+    extract_campaign_archive(output_file, extract_path)
+    for file in working_dir.rglob("*.out"):
+        extracted_file = extract_path / file.relative_to(working_dir)
+        assert extracted_file.read_text() == file.read_text()
+    assert not list(extract_path.rglob("*.gbw"))
+
+    # the main archive is shipped together with the part archives next to it
+    moved_output_file = tmp_path / "moved" / "output.zip"
+    moved_output_file.parent.mkdir()
+    shutil.copy(output_file, moved_output_file)
+    shutil.copytree(
+        working_dir / "archive_parts", moved_output_file.parent / "archive_parts"
+    )
+    result = CliRunner().invoke(
+        extract_archive,
+        ["--zip", str(moved_output_file), "-e", str(tmp_path / "restored")],
+    )
+    assert result.exit_code == 0
+    for file in working_dir.rglob("*.out"):
+        restored_file = tmp_path / "restored" / file.relative_to(working_dir)
+        assert restored_file.read_text() == file.read_text()
+
+    # a continued run reuses the parts of the done jobs
+    part_mtime = (working_dir / "archive_parts" / "freq___mol.zip").stat().st_mtime_ns
+    archiver = CampaignArchiver(working_dir, compression="stored")
+    archiver.finalize([job_1, job_2, job_3], working_dir / "output.zip")
+    assert (
+        working_dir / "archive_parts" / "freq___mol.zip"
+    ).stat().st_mtime_ns == part_mtime
+    with zipfile.ZipFile(output_file) as zipf:
+        assert "output.zip" not in zipf.namelist()
+        assert len(json.loads(zipf.read(archive_manifest_name))["parts"]) == 2
+
+    with pytest.raises(ValueError):
+        CampaignArchiver(working_dir, compression="zstd")
@@ -0,0 +1,68 @@
+from collections import Counter
+
+from script_maker2000.job import Job
+from script_maker2000.job_graph import build_step_graph
+from script_maker2000.job_registry import JobRegistry
+
+
+def test_job_state_table(tmp_path):
+    jobs = [
+        Job(f"mol_{i}", keys, tmp_path, 0, 1)
+        for i in range(700)
+        for keys in [["opt", "sp_1"], ["opt", "sp_2"]]
+    ]
+    build_step_graph(jobs)
+    job_dict = JobRegistry(jobs)
+    state_table = job_dict.state_table
+    # the table grows beyond its initial capacity
+    assert len(state_table) == 1400
+
+    for i, job in enumerate(jobs):
+        if i % 2:
+            # the overlapping jobs follow the first job of their step
+            continue
+        job.start_new_key("opt", 0)
+        if i % 3 == 0:
+            job.slurm_id_per_key["opt"] = str(i)
+            job.current_status = "submitted"
+        elif i % 5 == 0:
+            job.iterations_per_key["opt"] = 1
+            job.current_status = "failed"
+            job.failed_reason = "walltime_error"
+    for job in jobs[1::2]:
+        if job.current_key == "not_assigned":
+            job.start_new_key("opt", 0)
+
+    def count(values):
+        return dict(Counter(values))
+
+    assert state_table.count_statuses() == count(job.current_status for job in jobs)
+    assert state_table.count_status("submitted") == sum(
+        job.current_status == "submitted" for job in jobs
+    )
+    assert state_table.count_failed_reasons() == count(
+        job.failed_reason for job in jobs if job.current_status == "failed"
+    )
+    assert state_table.count_key_statuses() == count(
+        status for job in jobs for status in job.status_per_key.values()
+    )
+    assert state_table.count_restarted() == sum(
+        bool(job.iterations_per_key) for job in jobs
+    )
+
+    ready_jobs = state_table.get_jobs(state_table.rows_to_advance())
+    assert ready_jobs == [
+        job for job in jobs if job.current_status in ["finished", "failed"]
+    ]
+    assert state_table.count_waiting() == len(jobs) - len(ready_jobs)
+
+    # settled jobs aren't advanced until they change again
+    state_table.settle(ready_jobs[0], "walltime_error")
+    assert state_table.count_settled() == {"walltime_error": 1}
+    assert ready_jobs[0] not in state_table.get_jobs(state_table.rows_to_advance())
+    ready_jobs[0].failed_reason = "unknown_error"
+    assert state_table.count_settled() == {}
+
+    del job_dict[jobs[0].unique_job_id]
+    assert len(state_table) == len(jobs) - 1
+    assert state_table.count_statuses() == count(job.current_status for job in jobs[1:])
@@ -0,0 +1,103 @@
+import json
+import sqlite3
+import pytest
+from click.testing import CliRunner
+
+from script_maker2000.batch_manager import BatchManager
+from script_maker2000.cli import job_status
+from script_maker2000.job_store import (
+    JsonJobStore,
+    SQLiteJobStore,
+    create_job_store,
+    count_job_status,
+    read_job_status_counts,
+)
+
+
+def test_create_job_store(pre_started_dir):
+    batch_manager = BatchManager(pre_started_dir / "example_config.json")
+    main_config = batch_manager.main_config
+    assert isinstance(batch_manager.job_store, JsonJobStore)
+
+    main_config["main_config"]["job_store"] = "sqlite"
+    assert isinstance(
+        create_job_store(main_config, batch_manager.working_dir), SQLiteJobStore
+    )
+
+    main_config["main_config"]["job_store"] = "xml"
+    with pytest.raises(NotImplementedError):
+        create_job_store(main_config, batch_manager.working_dir)
+
+
+def test_sqlite_job_store(pre_started_dir):
+    config_path = pre_started_dir / "example_config.json"
+    with open(config_path, "r") as f:
+        main_config = json.load(f)
+    main_config["main_config"]["job_store"] = "sqlite"
+    with open(config_path, "w") as f:
+        json.dump(main_config, f, indent=4)
+
+    # the first run without a database starts from job_backup.json
+    batch_manager = BatchManager(config_path)
+    working_dir = batch_manager.working_dir
+    assert isinstance(batch_manager.job_store, SQLiteJobStore)
+    with open(working_dir / "job_backup.json", "r") as f:
+        job_backup = json.load(f)
+    assert len(batch_manager.job_dict) == len(job_backup)
+    json_counts = read_job_status_counts(working_dir)
+    assert json_counts == count_job_status(job_backup)
+
+    batch_manager.save_current_jobs()
+    assert (working_dir / "job_store.sqlite").exists()
+    assert read_job_status_counts(working_dir) == json_counts
+
+    # only the changed jobs (the jobs of the changed step) are written in the next transaction
+    job = list(batch_manager.job_dict.values())[0]
+    step_jobs = job.step_nodes[job.current_key].jobs
+    job.slurm_id_per_key[job.current_key] = "123"
+    job.failed_reason = "unknown_error"
+    job.current_status = "failed"
+    assert batch_manager.job_dict.pop_changed_jobs() == step_jobs
+    for step_job in step_jobs:
+        batch_manager.job_dict.update_job(step_job)
+    batch_manager.save_current_jobs()
+
+    status_counts = read_job_status_counts(working_dir)
+    n_changed = sum(
+        job_backup[step_job.unique_job_id]["failed_reason"] != "unknown_error"
+        for step_job in step_jobs
+    )
+    assert status_counts["unknown_error"] == (
+        json_counts.get("unknown_error", 0) + n_changed
+    )
+    assert sum(status_counts.values()) == len(job_backup)
+
+    key_counts = read_job_status_counts(working_dir, per_key=True)
+    assert key_counts[job.current_key]["failed"] >= 1
+    connection = sqlite3.connect(working_dir / "job_store.sqlite")
+    slurm_id = connection.execute(
+        "SELECT slurm_id FROM key_status WHERE unique_job_id = ? AND config_key = ?",
+        (job.unique_job_id, job.current_key),
+    ).fetchone()[0]
+    connection.close()
+    assert slurm_id == "123"
+
+    # job_backup.json is only updated on compaction
+    with open(working_dir / "job_backup.json", "r") as f:
+        assert json.load(f) == job_backup
+    batch_manager.save_current_jobs(compact=True)
+    with open(working_dir / "job_backup.json", "r") as f:
+        job_backup = json.load(f)
+    assert job_backup[job.unique_job_id]["_current_status"] == "failed"
+    batch_manager.job_store.close()
+
+    # continuing the run loads the jobs from the database
+    continued_batch_manager = BatchManager(config_path)
+    continued_job = continued_batch_manager.job_dict[job.unique_job_id]
+    assert continued_job.current_status == "failed"
+    assert continued_job.failed_reason == "unknown_error"
+
+    runner = CliRunner()
+    result = runner.invoke(job_status, ["--results_path", str(working_dir)])
+    assert result.exit_code == 0
+    assert json.loads(result.output) == status_counts
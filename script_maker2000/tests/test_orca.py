@@ -3,7 +3,14 @@ import subprocess
 import pytest
 import time
 from pathlib import Path
-from script_maker2000.orca import OrcaModule
+from script_maker2000.orca import (
+    OrcaModule,
+    _search_file,
+    _search_file_backwards,
+    orca_memory_error_pattern,
+    orca_normal_termination_pattern,
+    slurm_walltime_error_pattern,
+)
 
 
 def test_OrcaModule(pre_config_tmp_dir):
@@ -24,6 +31,13 @@ def test_OrcaModule(pre_config_tmp_dir):
     ) == len(
         list(pre_config_tmp_dir.glob("example_xyz_output/start_input_files/*.xyz"))
     )
+    for sbatch_file in pre_config_tmp_dir.glob(
+        "example_xyz_output/sp_config/input/*/*.sbatch"
+    ):
+        sbatch_text = sbatch_file.read_text()
+        assert "__completion_spool" not in sbatch_text
+        assert 'COMPLETION_SPOOL_DIR=""' in sbatch_text
+
     # run orca test only when available.
     if shutil.which("orca"):
 
@@ -71,3 +85,38 @@ def test_orca_submission(pre_config_tmp_dir, monkeypatch):
         sbatch_file = list(input_dir.glob("*.sbatch"))[0]
         assert Path(process[1]) == Path(sbatch_file)
         time.sleep(0.3)
+
+
+def test_search_output_files(tmp_path, monkeypatch):
+    # small chunks so the patterns end up on chunk borders
+    monkeypatch.setattr("script_maker2000.orca.scan_chunk_size", 16)
+    monkeypatch.setattr("script_maker2000.orca.scan_chunk_overlap", 128)
+
+    out_file = tmp_path / "test.out"
+    out_file.write_bytes(
+        b"x" * 1000
+        + b"\nError  (ORCA_SCF): Not enough memory available!\n"
+        + "\xe4 not utf-8 \xff".encode("latin-1")
+        + b"y" * 1003
+        + b"\n****ORCA TERMINATED NORMALLY****\n"
+        + b"z" * 37
+    )
+    assert _search_file_backwards(out_file, orca_normal_termination_pattern)
+    assert _search_file(out_file, orca_memory_error_pattern)
+    assert not _search_file_backwards(out_file, slurm_walltime_error_pattern)
+    assert not _search_file(out_file, slurm_walltime_error_pattern)
+
+    # empty files can't be memory mapped
+    empty_file = tmp_path / "empty.out"
+    empty_file.touch()
+    assert not _search_file(empty_file, orca_memory_error_pattern)
+    assert not _search_file_backwards(empty_file, orca_normal_termination_pattern)
+
+    slurm_file = tmp_path / "slurm_test.out"
+    slurm_file.write_bytes(
+        b"a" * 100
+        + b"slurmstepd: error: *** JOB 123 ON node1 CANCELLED AT "
+        + b"2024-01-01T12:00:00 DUE TO TIME LIMIT ***\n"
+        + b"b" * 100
+    )
+    assert _search_file_backwards(slurm_file, slurm_walltime_error_pattern)
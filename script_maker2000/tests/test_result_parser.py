@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from script_maker2000.result_parser import ResultParser
+
+
+def slow_parse(output_dir, *args):
+    time.sleep(60)
+    return output_dir
+
+
+def test_result_parser(analysis_tmp_dir):
+    output_files = sorted(analysis_tmp_dir.glob("*.out"))
+    result_parser = ResultParser(max_workers=2)
+
+    async def parse_all():
+        return await asyncio.gather(
+            *[result_parser.parse(output_file) for output_file in output_files],
+            result_parser.parse(analysis_tmp_dir / "missing.out"),
+            return_exceptions=True,
+        )
+
+    try:
+        results = asyncio.run(parse_all())
+    finally:
+        result_parser.shutdown()
+
+    for output_file, json_file in zip(output_files, results[:-1]):
+        assert json_file == output_file.with_name(
+            output_file.stem + "_calc_result.json"
+        )
+        assert json_file.exists()
+    # errors are handed to the caller instead of stopping the other parses
+    assert isinstance(results[-1], Exception)
+
+
+def test_result_parser_timeout(analysis_tmp_dir, monkeypatch):
+    output_file = sorted(analysis_tmp_dir.glob("*.out"))[0]
+    monkeypatch.setattr("script_maker2000.result_parser.parse_output_file", slow_parse)
+
+    # the timeout starts once a worker picked up the parse, not while the pool starts
+    result_parser = ResultParser(max_workers=1, timeout=0.5)
+
+    async def parse_with_timeout():
+        task = asyncio.create_task(result_parser.parse(output_file))
+        await asyncio.sleep(0.2)
+        processes = list(result_parser.executor._processes.values())
+        with pytest.raises(TimeoutError):
+            await task
+        return processes
+
+    start_time = time.monotonic()
+    processes = asyncio.run(parse_with_timeout())
+    assert time.monotonic() - start_time < 30
+
+    # the abandoned parse is stopped and the next request starts a new pool
+    assert result_parser._executor is None
+    assert processes
+    for process in processes:
+        process.join(5)
+        assert not process.is_alive()
+
+    monkeypatch.undo()
+    result_parser.timeout = 600
+    try:
+        json_file = asyncio.run(result_parser.parse(output_file))
+    finally:
+        result_parser.shutdown()
+    assert json_file.exists()
@@ -0,0 +1,110 @@
+import os
+import json
+
+from script_maker2000.results_index import (
+    ResultsIndex,
+    find_raw_results_dirs,
+    get_results_index,
+    get_results_index_file,
+    write_results_indices,
+)
+from script_maker2000.dash_ui.results_window_calls import (
+    _get_all_mol_dirs_in_finished_dirs,
+)
+
+
+def _set_old_mtimes(path):
+    # dirs changed right before a scan are listed again, so the test dirs are made older
+    for dir_path in [path] + [p for p in path.glob("**/*") if p.is_dir()]:
+        os.utime(dir_path, ns=(1_000_000_000, 1_000_000_000))
+
+
+def _make_calc_dir(calc_dir):
+    calc_dir.mkdir(parents=True)
+    with open(calc_dir / f"{calc_dir.name}_calc_result.json", "w") as f:
+        json.dump({"charge": 0}, f)
+
+
+def test_results_index(tmp_path):
+    raw_results_dir = tmp_path / "finished" / "raw_results"
+    _make_calc_dir(raw_results_dir / "mol_1" / "opt___mol_1")
+    _make_calc_dir(
+        raw_results_dir / "mol_1" / "failed" / "walltime_error" / "opt__sp___mol_1"
+    )
+    _make_calc_dir(raw_results_dir / "mol_2" / "opt___mol_2")
+    _set_old_mtimes(raw_results_dir)
+
+    assert find_raw_results_dirs(tmp_path) == [raw_results_dir]
+
+    results_index = ResultsIndex(raw_results_dir)
+    changed_calcs = results_index.refresh()
+    assert set(changed_calcs) == {
+        (raw_results_dir / "mol_1" / "opt___mol_1", None),
+        (
+            raw_results_dir / "mol_1" / "failed" / "walltime_error" / "opt__sp___mol_1",
+            "walltime_error",
+        ),
+        (raw_results_dir / "mol_2" / "opt___mol_2", None),
+    }
+    assert get_results_index_file(raw_results_dir).exists()
+
+    # nothing changed, the dirs aren't listed again
+    assert results_index.refresh() == []
+    loaded_index = ResultsIndex(raw_results_dir)
+    assert loaded_index.refresh() == []
+    assert list(loaded_index.iter_calcs()) == list(results_index.iter_calcs())
+
+    # a new calculation changes the modification time of its molecule dir
+    _make_calc_dir(raw_results_dir / "mol_2" / "opt__sp___mol_2")
+    _set_old_mtimes(raw_results_dir)
+    os.utime(raw_results_dir / "mol_2", ns=(2_000_000_000, 2_000_000_000))
+    changed_calcs = loaded_index.refresh()
+    assert {calc_dir.name for calc_dir, _ in changed_calcs} == {
+        "opt___mol_2",
+        "opt__sp___mol_2",
+    }
+    assert len(list(loaded_index.iter_calcs())) == 4
+
+    # the tree is filtered in memory
+    config_dict = {"test_config": {"finished": [str(tmp_path)]}}
+    tree = _get_all_mol_dirs_in_finished_dirs(config_dict, ["sp"])
+    mol_dicts = tree["children"][0]["children"]
+    assert [mol_dict["title"] for mol_dict in mol_dicts] == ["mol_1", "mol_2"]
+    assert mol_dicts[0]["children"] == [
+        {
+            "title": "opt__sp___mol_1",
+            "key": "__failed__"
+            + str(
+                raw_results_dir
+                / "mol_1"
+                / "failed"
+                / "walltime_error"
+                / "opt__sp___mol_1"
+            ),
+            "children": [],
+        }
+    ]
+    assert [calc["title"] for calc in mol_dicts[1]["children"]] == ["opt__sp___mol_2"]
+
+
+def test_results_index_update_mol_dir(tmp_path):
+    raw_results_dir = tmp_path / "finished" / "raw_results"
+    _make_calc_dir(raw_results_dir / "mol_1" / "opt___mol_1")
+    results_index = get_results_index(raw_results_dir)
+    results_index.refresh()
+    index_file = get_results_index_file(raw_results_dir)
+    index_mtime_ns = index_file.stat().st_mtime_ns
+
+    # the jobs only change the index in memory
+    _make_calc_dir(raw_results_dir / "mol_1" / "opt__sp___mol_1")
+    _make_calc_dir(raw_results_dir / "mol_2" / "opt___mol_2")
+    results_index.update_mol_dir("mol_1")
+    results_index.update_mol_dir("mol_2")
+    assert results_index.dirty
+    assert index_file.stat().st_mtime_ns == index_mtime_ns
+    assert len(list(ResultsIndex(raw_results_dir).iter_calcs())) == 1
+
+    # the changed indices are written at once
+    write_results_indices()
+    assert not results_index.dirty
+    assert len(list(ResultsIndex(raw_results_dir).iter_calcs())) == 3
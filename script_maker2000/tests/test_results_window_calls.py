@@ -0,0 +1,98 @@
+from script_maker2000.analysis import parse_output_file, convert_energies
+from script_maker2000.dash_ui.results_window_calls import (
+    update_detailed_screen_header,
+    update_table_values,
+    update_energy_convergence_plot,
+)
+
+import os
+import shutil
+
+import cclib
+import numpy as np
+import pytest
+
+
+def test_update_table_values_energy_units(analysis_tmp_dir):
+    for file in analysis_tmp_dir.glob("*.out"):
+        parse_output_file(file)
+
+    column_input = ["mol_info", "energies", "thermo"]
+    records_ev, columns, complete_table_data = update_table_values(
+        [str(analysis_tmp_dir)], column_input, "eV", {}
+    )
+    assert len(records_ev) == 4
+    assert {column["id"] for column in columns} >= {"final_sp_energy", "enthalpy"}
+
+    for energy_unit in ["hartree", "kcal/mol", "kJ/mol", "wavenumber"]:
+        records, _, _ = update_table_values(
+            [str(analysis_tmp_dir)], column_input, energy_unit, complete_table_data
+        )
+        for record, record_ev in zip(records, records_ev):
+            for key in ["final_sp_energy", "enthalpy", "Dispersion_correction"]:
+                if key not in record_ev:
+                    continue
+                assert record[key] == pytest.approx(
+                    cclib.parser.utils.convertor(record_ev[key], "eV", energy_unit)
+                )
+            assert record["charge"] == record_ev["charge"]
+
+    # the converted tables are cached per unit
+    records, _, _ = update_table_values(
+        [str(analysis_tmp_dir)], column_input, "kJ/mol", complete_table_data
+    )
+    assert (
+        records
+        is update_table_values(
+            [str(analysis_tmp_dir)], column_input, "kJ/mol", complete_table_data
+        )[0]
+    )
+    assert (
+        update_table_values(
+            [str(analysis_tmp_dir)], column_input, "eV", complete_table_data
+        )[0]
+        == records_ev
+    )
+
+
+def test_update_table_values_changed_results(analysis_tmp_dir):
+    output_files = sorted(analysis_tmp_dir.glob("*.out"))
+    for file in output_files[:2]:
+        parse_output_file(file)
+
+    column_input = ["mol_info"]
+    records, _, complete_table_data = update_table_values(
+        [str(analysis_tmp_dir)], column_input, "eV", {}
+    )
+    assert len(records) == 2
+
+    # new results change the modification time of their dir, the cached table is replaced
+    parse_output_file(output_files[2])
+    mtime_ns = os.stat(analysis_tmp_dir).st_mtime_ns + 10**9
+    os.utime(analysis_tmp_dir, ns=(mtime_ns, mtime_ns))
+    records, _, complete_table_data = update_table_values(
+        [str(analysis_tmp_dir)], column_input, "eV", complete_table_data
+    )
+    assert len(records) == 3
+
+    # results removed since the table was loaded have no details
+    name = records[0]["filename"]
+    shutil.rmtree(analysis_tmp_dir)
+    assert update_detailed_screen_header([0], records, complete_table_data) == (
+        f"No results found for {name}.",
+        {},
+        False,
+    )
+
+
+def test_update_energy_convergence_plot():
+    energies = [-100.0, -100.5, -100.7]
+    fig, is_in = update_energy_convergence_plot(
+        {"final_energy_path": energies}, "hartree"
+    )
+    assert is_in
+    np.testing.assert_allclose(fig.data[0].y, convert_energies(energies, "hartree"))
+    np.testing.assert_allclose(
+        fig.data[0].y,
+        [cclib.parser.utils.convertor(energy, "eV", "hartree") for energy in energies],
+    )
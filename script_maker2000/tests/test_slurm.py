@@ -0,0 +1,247 @@
+import asyncio
+import json
+import sys
+import time
+import pytest
+
+import script_maker2000.slurm
+from script_maker2000.slurm import SlurmClient, SacctPoller, CompletionSpool
+
+# the conftest replaces this with a subprocess.run wrapper for all tests
+original_exec_subprocess = script_maker2000.slurm._exec_subprocess
+
+
+def test_slurm_client_run(monkeypatch):
+    monkeypatch.setattr(
+        "script_maker2000.slurm._exec_subprocess", original_exec_subprocess
+    )
+    client = SlurmClient()
+
+    process = asyncio.run(
+        client.run([sys.executable, "-c", "print('job 123')"], retry_on_timeout=False)
+    )
+    assert process.returncode == 0
+    assert process.stdout.strip() == "job 123"
+
+
+def test_slurm_client_retry(monkeypatch):
+    calls = []
+
+    async def fake_exec(*args):
+        calls.append(args)
+        if len(calls) < 3:
+            return 1, "", "slurm_load_jobs error: Socket timed out"
+        return 0, "job 42", ""
+
+    monkeypatch.setattr("script_maker2000.slurm._exec_subprocess", fake_exec)
+    client = SlurmClient(retries=3, retry_wait=0)
+
+    process = asyncio.run(client.run(["sacct", "-j", 42]))
+    assert len(calls) == 3
+    assert calls[0] == ("sacct", "-j", "42")
+    assert process.stdout == "job 42"
+
+    # the last failed attempt is returned, not raised
+    calls.clear()
+    client = SlurmClient(retries=2, retry_wait=0)
+    process = asyncio.run(client.run(["sacct", "-j", 42]))
+    assert len(calls) == 2
+    assert process.returncode == 1
+
+
+def test_slurm_client_timeout(monkeypatch):
+    calls = []
+
+    async def slow_exec(*args):
+        calls.append(args)
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr("script_maker2000.slurm._exec_subprocess", slow_exec)
+    client = SlurmClient(timeout=0.05, retries=3, retry_wait=0)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.run(["sacct"]))
+    assert len(calls) == 3
+
+    # submissions are never repeated after a timeout
+    calls.clear()
+    monkeypatch.setattr("shutil.which", lambda x: x)
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.sbatch("test.sbatch"))
+    assert len(calls) == 1
+
+
+def test_slurm_client_parallel_calls(monkeypatch):
+    running = []
+    max_running = []
+
+    async def fake_exec(*args):
+        running.append(args)
+        max_running.append(len(running))
+        await asyncio.sleep(0.05)
+        running.remove(args)
+        return 0, f"job {args[1]}", ""
+
+    monkeypatch.setattr("script_maker2000.slurm._exec_subprocess", fake_exec)
+    client = SlurmClient(max_parallel_calls=3)
+
+    async def submit_all():
+        return await asyncio.gather(*[client.run(["sbatch", i]) for i in range(9)])
+
+    start = time.perf_counter()
+    processes = asyncio.run(submit_all())
+    duration = time.perf_counter() - start
+
+    assert [process.stdout for process in processes] == [f"job {i}" for i in range(9)]
+    assert max(max_running) == 3
+    # the calls overlap instead of running one after another
+    assert duration < 9 * 0.05
+
+
+def test_slurm_client_missing_command(monkeypatch):
+    monkeypatch.setattr("shutil.which", lambda x: None)
+    client = SlurmClient()
+
+    with pytest.raises(ValueError):
+        asyncio.run(client.sbatch("test.sbatch"))
+    with pytest.raises(ValueError):
+        asyncio.run(client.sacct([1, 2], ["JobID"]))
+
+
+def fake_sacct_exec(calls, states):
+    """Fake sacct that reports the given states for the job and its steps."""
+
+    async def _fake_exec(*args):
+        calls.append(args)
+        slurm_ids = args[2].split(",")
+        format_keys = args[4].split(",")
+        lines = ["|".join(format_keys) + "|"]
+        for slurm_id in slurm_ids:
+            if slurm_id not in states:
+                continue
+            for job_id, job_name in [
+                (slurm_id, "job_" + slurm_id),
+                (slurm_id + ".batch", "batch"),
+                (slurm_id + ".extern", "extern"),
+            ]:
+                values = {
+                    "JobID": job_id,
+                    "JobName": job_name,
+                    "State": states[slurm_id],
+                }
+                lines.append(
+                    "|".join(values.get(key, "1") for key in format_keys) + "|"
+                )
+        return 0, "\n".join(lines) + "\n", ""
+
+    return _fake_exec
+
+
+def test_sacct_poller_coalesce(monkeypatch):
+    calls = []
+    states = {"1": "RUNNING", "2": "COMPLETED", "12": "COMPLETED", "3": "PENDING"}
+    monkeypatch.setattr(
+        "script_maker2000.slurm._exec_subprocess", fake_sacct_exec(calls, states)
+    )
+    monkeypatch.setattr("shutil.which", lambda x: x)
+    poller = SacctPoller(SlurmClient(), max_age=60)
+
+    async def poll_layers():
+        # three managers asking at the same time
+        return await asyncio.gather(
+            poller.job_states([1, 2]),
+            poller.job_states(["12"]),
+            poller.job_states([1]),
+        )
+
+    layer_states = asyncio.run(poll_layers())
+    assert layer_states[0] == {"1": "RUNNING", "2": "COMPLETED"}
+    assert layer_states[1] == {"12": "COMPLETED"}
+    assert layer_states[2] == {"1": "RUNNING"}
+    # the first call collects its ids, the second one all remaining ids at once
+    assert len(calls) <= 2
+    assert set(calls[-1][2].split(",")) >= {"12"}
+
+    # cached states are reused, new ids trigger a poll of all active ids
+    n_calls = len(calls)
+    assert asyncio.run(poller.job_states([1])) == {"1": "RUNNING"}
+    assert len(calls) == n_calls
+    assert asyncio.run(poller.job_states([3])) == {"3": "PENDING"}
+    assert len(calls) == n_calls + 1
+    assert set(calls[-1][2].split(",")) == {"1", "3"}
+
+    # the efficiency data is collected once for all terminal jobs
+    efficiency_df = asyncio.run(poller.efficiency_data([2]))
+    assert len(calls) == n_calls + 2
+    assert set(calls[-1][2].split(",")) == {"2", "12"}
+    assert "MaxRSS" in calls[-1][4]
+    # the batch step is folded into the line of the job
+    assert list(efficiency_df.index) == ["2"]
+    assert efficiency_df.loc["2", "JobName"] == "job_2"
+    assert "MaxRSS_batch" in efficiency_df.columns
+    assert "JobName_batch" not in efficiency_df.columns
+
+    efficiency_df = asyncio.run(poller.efficiency_data([12]))
+    assert len(calls) == n_calls + 2
+    assert list(efficiency_df.index) == ["12"]
+    assert efficiency_df.loc["12", "JobID"] == "12"
+
+
+def test_sacct_poller_failed_sacct(monkeypatch):
+    async def failing_exec(*args):
+        return 1, "", "sacct: error: Problem talking to the database"
+
+    monkeypatch.setattr("script_maker2000.slurm._exec_subprocess", failing_exec)
+    monkeypatch.setattr("shutil.which", lambda x: x)
+    poller = SacctPoller(SlurmClient(retries=1), max_age=0)
+
+    # the jobs keep their unknown state instead of raising
+    assert asyncio.run(poller.job_states([1, 2])) == {}
+    assert asyncio.run(poller.efficiency_data([1])).empty
+
+
+def test_completion_spool(monkeypatch, tmp_path):
+    calls = []
+    states = {"1": "RUNNING", "2": "RUNNING"}
+    monkeypatch.setattr(
+        "script_maker2000.slurm._exec_subprocess", fake_sacct_exec(calls, states)
+    )
+    monkeypatch.setattr("shutil.which", lambda x: x)
+    spool = CompletionSpool(tmp_path / "spool", scan_interval=0.01)
+    poller = SacctPoller(SlurmClient(), max_age=60, completion_spool=spool)
+
+    def write_record(slurm_id, state):
+        record = {"slurm_id": slurm_id, "exit_code": 0, "state": state}
+        with open(spool.spool_dir / f"{slurm_id}.json", "w") as f:
+            json.dump(record, f)
+
+    # fresh jobs without a record don't trigger sacct
+    assert asyncio.run(poller.job_states([1, 2])) == {}
+    assert not calls
+
+    # the wait ends as soon as a record of one of the jobs arrives
+    write_record("1", "COMPLETED")
+    start = time.perf_counter()
+    asyncio.run(poller.wait_for_completions(5, [1, 2]))
+    assert time.perf_counter() - start < 1
+    assert asyncio.run(poller.job_states([1, 2])) == {"1": "COMPLETED"}
+    assert not calls
+
+    # without a record the wait runs into the timeout
+    start = time.perf_counter()
+    asyncio.run(poller.wait_for_completions(0.05, [2]))
+    assert time.perf_counter() - start >= 0.05
+
+    # records that never arrive are reconciled with sacct after max_age
+    poller.max_age = 0
+    assert asyncio.run(poller.job_states([1, 2])) == {
+        "1": "COMPLETED",
+        "2": "RUNNING",
+    }
+    assert len(calls) == 1
+    assert calls[0][2] == "2"
+
+    # the efficiency data of the recorded job is still collected from sacct
+    states["1"] = "COMPLETED"
+    efficiency_df = asyncio.run(poller.efficiency_data([1]))
+    assert list(efficiency_df.index) == ["1"]
@@ -0,0 +1,60 @@
+import errno
+import os
+import shutil
+
+import pytest
+
+import script_maker2000.staging as staging
+from script_maker2000.staging import make_dirs, move_path, stage_file
+
+
+def test_stage_file(tmp_path, monkeypatch):
+    src = tmp_path / "finished" / "opt___mol.xyz"
+    src.parent.mkdir()
+    src.write_text("1\n\nH 0.0 0.0 0.0\n")
+    (tmp_path / "input").mkdir()
+
+    assert stage_file(src, tmp_path / "input" / "a.xyz") == "hardlink"
+    assert os.path.samefile(src, tmp_path / "input" / "a.xyz")
+    with pytest.raises(FileExistsError):
+        stage_file(src, tmp_path / "input" / "a.xyz")
+
+    # e.g. a different file system
+    def raise_exdev(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(staging.os, "link", raise_exdev)
+    monkeypatch.setattr(staging, "_reflink", raise_exdev)
+    assert stage_file(src, tmp_path / "input" / "b.xyz") == "copy"
+    assert not os.path.samefile(src, tmp_path / "input" / "b.xyz")
+    assert (tmp_path / "input" / "b.xyz").read_text() == src.read_text()
+
+
+def test_move_path_and_make_dirs(tmp_path):
+    working_dir = tmp_path / "working" / "opt"
+    step_dirs = [
+        working_dir / layer_dir / f"opt___mol_{i}"
+        for layer_dir in ["input", "output"]
+        for i in range(3)
+    ]
+    make_dirs(step_dirs)
+    make_dirs(step_dirs)
+    assert all(step_dir.is_dir() for step_dir in step_dirs)
+
+    # the cached parent dirs are created again if they were removed
+    shutil.rmtree(working_dir)
+    make_dirs(step_dirs)
+    assert all(step_dir.is_dir() for step_dir in step_dirs)
+
+    output_dir = working_dir / "output" / "opt___mol_0"
+    (output_dir / "opt___mol_0.out").write_text("output")
+    finished_dir = working_dir / "finished" / "opt___mol_0"
+    assert move_path(output_dir, finished_dir) == finished_dir
+    assert (finished_dir / "opt___mol_0.out").read_text() == "output"
+    assert not output_dir.exists()
+
+    # like shutil.move, existing dirs are moved into
+    assert move_path(working_dir / "output" / "opt___mol_1", finished_dir) == (
+        finished_dir / "opt___mol_1"
+    )
+    assert (finished_dir / "opt___mol_1").is_dir()
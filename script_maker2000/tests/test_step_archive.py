@@ -0,0 +1,108 @@
+import zipfile
+
+import pytest
+
+from script_maker2000.step_archive import (
+    StepArchiver,
+    extract_step,
+    pack_step_dirs,
+    read_step_archive_index,
+)
+
+
+def _make_step_dir(parent_dir, step_name):
+    step_dir = parent_dir / step_name
+    (step_dir / "sub").mkdir(parents=True)
+    (step_dir / f"{step_name}.out").write_text(f"output of {step_name}\n" * 100)
+    (step_dir / "sub" / "slurm.out").write_bytes(bytes(range(256)))
+    return step_dir
+
+
+def test_pack_step_dirs(tmp_path):
+    output_dir = tmp_path / "working" / "opt" / "output"
+    contents = {}
+    step_dirs = []
+    for i in range(3):
+        step_dir = _make_step_dir(output_dir, f"opt___mol_{i}")
+        step_dirs.append(step_dir)
+        contents[step_dir.name] = {
+            file.relative_to(output_dir): file.read_bytes()
+            for file in step_dir.rglob("*")
+            if file.is_file()
+        }
+
+    pack_step_dirs(step_dirs[:2], steps_per_archive=2)
+    pack_step_dirs(step_dirs[2:], steps_per_archive=2, compression=zipfile.ZIP_STORED)
+
+    # the step dirs are replaced by two archives and the index
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        "step_archive_0000.zip",
+        "step_archive_0001.zip",
+        "step_archive_index.jsonl",
+    ]
+    index = read_step_archive_index(output_dir)
+    assert index["opt___mol_1"]["archive"] == "step_archive_0000.zip"
+    assert index["opt___mol_2"]["archive"] == "step_archive_0001.zip"
+    with zipfile.ZipFile(output_dir / "step_archive_0000.zip") as zipf:
+        assert len(zipf.namelist()) == 4
+        assert zipf.testzip() is None
+
+    for step_name, step_contents in contents.items():
+        extract_path = tmp_path / "extracted"
+        step_dir = extract_step(output_dir, step_name, extract_path)
+        assert step_dir == extract_path / step_name
+        for file, content in step_contents.items():
+            assert (extract_path / file).read_bytes() == content
+
+    with pytest.raises(KeyError):
+        extract_step(output_dir, "opt___mol_3")
+
+
+def test_pack_step_dirs_after_crash(tmp_path):
+    output_dir = tmp_path / "working" / "opt" / "output"
+    step_dirs = [_make_step_dir(output_dir, f"opt___mol_{i}") for i in range(3)]
+    pack_step_dirs(step_dirs[:1])
+    content = (step_dirs[1] / "opt___mol_1.out").read_bytes()
+
+    # the run was killed after the step was added to the archive, but before the index was extended
+    with zipfile.ZipFile(output_dir / "step_archive_0000.zip", "a") as zipf:
+        for file in sorted(step_dirs[1].rglob("*")):
+            if file.is_file():
+                zipf.write(file, f"opt___mol_1/{file.relative_to(step_dirs[1])}")
+
+    pack_step_dirs(step_dirs[1:])
+    assert not step_dirs[1].exists()
+    index = read_step_archive_index(output_dir)
+    assert sorted(index) == ["opt___mol_0", "opt___mol_1", "opt___mol_2"]
+    assert len(index["opt___mol_1"]["members"]) == 2
+
+    step_dir = extract_step(output_dir, "opt___mol_1", tmp_path / "extracted")
+    assert (step_dir / "opt___mol_1.out").read_bytes() == content
+    with zipfile.ZipFile(output_dir / "step_archive_0000.zip") as zipf:
+        # the step isn't added twice
+        assert len(zipf.namelist()) == 6
+
+
+def test_step_archiver(tmp_path):
+    input_dir = tmp_path / "working" / "opt" / "input"
+    output_dir = tmp_path / "working" / "opt" / "output"
+
+    step_archiver = StepArchiver(steps_per_archive=10)
+    for i in range(5):
+        step_archiver.submit(
+            [
+                _make_step_dir(input_dir, f"opt___mol_{i}"),
+                _make_step_dir(output_dir, f"opt___mol_{i}"),
+            ]
+        )
+    step_archiver.shutdown()
+
+    for parent_dir in [input_dir, output_dir]:
+        assert sorted(path.name for path in parent_dir.iterdir()) == [
+            "step_archive_0000.zip",
+            "step_archive_index.jsonl",
+        ]
+        assert len(read_step_archive_index(parent_dir)) == 5
+
+    with pytest.raises(ValueError):
+        StepArchiver(compression="lzma")
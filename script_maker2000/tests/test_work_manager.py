@@ -1,6 +1,10 @@
 from script_maker2000.orca import OrcaModule
 from script_maker2000.work_manager import WorkManager
+from script_maker2000.job_registry import JobRegistry
 import asyncio
+import subprocess
+import numpy as np
+import pandas as pd
 
 
 def test_workmanager(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
@@ -44,7 +48,7 @@ def test_workmanager(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
         assert len(list(dir.glob("*sbatch"))) == 1
 
     current_job_dict["submitted"].extend(
-        work_manager.submit_jobs(current_job_dict["not_started"])
+        asyncio.run(work_manager.submit_jobs(current_job_dict["not_started"]))
     )
     assert len(current_job_dict["submitted"]) == 11
     assert len(list((orca_test.working_dir / "output").glob("*"))) == 11
@@ -53,7 +57,7 @@ def test_workmanager(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
 
     # check on submitted jobs
     current_job_dict["returned"].extend(
-        work_manager.check_submitted_jobs(current_job_dict["submitted"])
+        asyncio.run(work_manager.check_submitted_jobs(current_job_dict["submitted"]))
     )
 
     # haven't refreshed the job status yet
@@ -62,12 +66,21 @@ def test_workmanager(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
 
     # check on returned jobs
     # manage finished jobs
-    fresh_finished, reset_jobs = work_manager.manage_returned_jobs(
-        current_job_dict["returned"]
+    fresh_finished, reset_jobs = asyncio.run(
+        work_manager.manage_returned_jobs(current_job_dict["returned"])
     )
 
-    work_manager.manage_finished_jobs(fresh_finished)
+    asyncio.run(work_manager.manage_finished_jobs(fresh_finished))
     assert len(reset_jobs) == 4
+    for job in fresh_finished:
+        efficiency_data = job.efficiency_data["opt_config"]
+        assert efficiency_data["NCPUS"] == 16
+        assert efficiency_data["CPUTimeRAW"].to("second").magnitude == 656
+        assert efficiency_data["TimelimitRaw"].to("second").magnitude == 120
+        assert efficiency_data["ConsumedEnergyRaw"].to("joule").magnitude == 11000
+        assert efficiency_data["MaxDiskRead"].to("byte").magnitude == 1723e6
+        assert efficiency_data["MaxVMSize"].to("byte").magnitude == 22753e3
+        assert efficiency_data["ReqMem"].to("byte").magnitude == 56000e6
     restarted_jobs = work_manager.restart_walltime_error_jobs(reset_jobs)
 
     assert len(restarted_jobs) == 4
@@ -80,19 +93,19 @@ def test_workmanager(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
     )
     assert len(current_job_dict["not_started"]) == 4
     current_job_dict["submitted"].extend(
-        work_manager.submit_jobs(current_job_dict["not_started"])
+        asyncio.run(work_manager.submit_jobs(current_job_dict["not_started"]))
     )
 
     assert len(current_job_dict["submitted"]) == 4
 
     current_job_dict["returned"].extend(
-        work_manager.check_submitted_jobs(current_job_dict["submitted"])
+        asyncio.run(work_manager.check_submitted_jobs(current_job_dict["submitted"]))
     )
-    fresh_finished, reset_jobs = work_manager.manage_returned_jobs(
-        current_job_dict["returned"]
+    fresh_finished, reset_jobs = asyncio.run(
+        work_manager.manage_returned_jobs(current_job_dict["returned"])
     )
 
-    work_manager.manage_finished_jobs(fresh_finished)
+    asyncio.run(work_manager.manage_finished_jobs(fresh_finished))
 
     assert len(reset_jobs) == 0
 
@@ -138,15 +151,15 @@ def test_submit_file_limit(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_func
     # change the max number of jobs to submit
     work_manager.main_config["main_config"]["max_n_jobs"] = 5
     current_job_dict["submitted"].extend(
-        work_manager.submit_jobs(current_job_dict["not_started"])
+        asyncio.run(work_manager.submit_jobs(current_job_dict["not_started"]))
     )
     assert len(current_job_dict["submitted"]) == 5
 
     current_job_dict["returned"].extend(
-        work_manager.check_submitted_jobs(current_job_dict["submitted"])
+        asyncio.run(work_manager.check_submitted_jobs(current_job_dict["submitted"]))
     )
-    returned_jobs, walltime_error_jobs = work_manager.manage_returned_jobs(
-        current_job_dict["returned"]
+    returned_jobs, walltime_error_jobs = asyncio.run(
+        work_manager.manage_returned_jobs(current_job_dict["returned"])
     )
 
     for job in returned_jobs:
@@ -156,7 +169,9 @@ def test_submit_file_limit(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_func
     work_manager.main_config["main_config"]["max_n_jobs"] = 2
     current_job_dict = work_manager.check_job_status()
 
-    new_submissions = work_manager.submit_jobs(current_job_dict["not_started"])
+    new_submissions = asyncio.run(
+        work_manager.submit_jobs(current_job_dict["not_started"])
+    )
     assert len(new_submissions) == 2
 
     # now see if second work manager runs into the same limitation
@@ -169,7 +184,7 @@ def test_submit_file_limit(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_func
         work_manager.prepare_jobs(current_job_dict2["found"])
     )
     current_job_dict2["submitted"].extend(
-        work_manager.submit_jobs(current_job_dict2["not_started"])
+        asyncio.run(work_manager.submit_jobs(current_job_dict2["not_started"]))
     )
     assert len(current_job_dict2["submitted"]) == 0
 
@@ -193,8 +208,10 @@ def test_submit_file_limit_multi_layer(
     orca_test = OrcaModule(config_path, "opt_config1")
     work_manager = WorkManager(orca_test, job_dict_multilayer)
     # no files present for sp_config yet
+    # both sp layers share the opt step, it is scheduled once through its primary job
+    assert job_dict_multilayer.count_for_key("opt_config1")["found"] == 22
     current_job_dict = work_manager.check_job_status()
-    assert len(current_job_dict["found"]) == 22
+    assert len(current_job_dict["found"]) == 11
 
     # prepare jobs
     current_job_dict["not_started"].extend(
@@ -204,9 +221,56 @@ def test_submit_file_limit_multi_layer(
     # change the max number of jobs to submit
     work_manager.main_config["main_config"]["max_n_jobs"] = 5
     current_job_dict["submitted"].extend(
-        work_manager.submit_jobs(current_job_dict["not_started"])
+        asyncio.run(work_manager.submit_jobs(current_job_dict["not_started"]))
     )
-    assert len(current_job_dict["submitted"]) == 10
+    assert len(current_job_dict["submitted"]) == 5
+    # the jobs following the submitted steps read their state from the step node
+    assert job_dict_multilayer.count_for_key("opt_config1")["submitted"] == 10
+    assert job_dict_multilayer.state_table.count_steps("submitted") == 5
+    for job in current_job_dict["submitted"]:
+        for overlapping_job in job.overlapping_jobs:
+            assert overlapping_job.current_status == "submitted"
+            assert (
+                overlapping_job.slurm_id_per_key["opt_config1"]
+                == job.slurm_id_per_key["opt_config1"]
+            )
+
+
+def test_filter_data_missing_batch_line(clean_tmp_dir, job_dict):
+    orca_test = OrcaModule(clean_tmp_dir / "example_config.json", "opt_config")
+    work_manager = WorkManager(orca_test, job_dict)
+
+    # job 2 was cancelled before its batch step started, so its "_batch" columns are empty
+    efficiency_df = pd.DataFrame(
+        {
+            "JobID": ["1", "2"],
+            "JobName": ["job_1", "job_2"],
+            "ExitCode": ["0:0", "0:0"],
+            "NCPUS": [16, 16],
+            "CPUTimeRAW": [656, 0],
+            "ElapsedRaw": [41, 0],
+            "TimelimitRaw": [2, 2],
+            "ReqMem": ["56000M", "56000M"],
+            "ConsumedEnergyRaw_batch": [11000, np.nan],
+            "MaxDiskRead_batch": ["1723M", np.nan],
+            "MaxDiskWrite_batch": ["2M", np.nan],
+            "MaxVMSize_batch": ["22753K", np.nan],
+        },
+        index=["1", "2"],
+    )
+    efficiency_data = work_manager._filter_data(efficiency_df)
+
+    assert efficiency_data["1"]["MaxDiskRead"].to("byte").magnitude == 1723e6
+    assert efficiency_data["1"]["NCPUS"] == 16
+    for key in ["ConsumedEnergyRaw", "MaxDiskRead", "MaxDiskWrite", "MaxVMSize"]:
+        assert efficiency_data["2"][key] == "Missing"
+    assert efficiency_data["2"]["ElapsedRaw"].to("second").magnitude == 0
+
+    # no job has a batch step line
+    efficiency_data = work_manager._filter_data(
+        efficiency_df.drop(columns=["MaxVMSize_batch"])
+    )
+    assert efficiency_data["1"]["MaxVMSize"] == "Missing"
 
 
 def test_workmanager_loop(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
@@ -244,3 +308,196 @@ def test_workmanager_loop(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_funct
     assert len(list(work_manager.failed_dir.glob("*/*"))) == 7
 
     assert len(list(work_manager.input_dir.glob("*"))) == 11
+
+
+def test_workmanager_loop_slurm_timeouts(
+    clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function
+):
+    config_path = clean_tmp_dir / "example_config.json"
+    orca_test = OrcaModule(config_path, "opt_config")
+    work_manager = WorkManager(orca_test, job_dict)
+    job_dict = work_manager.job_dict
+
+    def new_fake_slurm_function(*args, monkey_patch_job_dict=job_dict, **kwargs):
+        return fake_slurm_function(
+            *args, monkey_patch_job_dict=monkey_patch_job_dict, **kwargs
+        )
+
+    monkeypatch.setattr("subprocess.run", new_fake_slurm_function)
+    monkeypatch.setattr("shutil.which", lambda x: x)
+    monkeypatch.setattr(work_manager, "max_loop", 6)
+    monkeypatch.setattr(work_manager, "wait_time", 0.3)
+
+    # every second sbatch call and the first sacct poll time out
+    sbatch = work_manager.slurm_client.sbatch
+    sbatch_calls = []
+
+    async def flaky_sbatch(slurm_file):
+        sbatch_calls.append(slurm_file)
+        if len(sbatch_calls) % 2 == 0:
+            raise TimeoutError(f"sbatch {slurm_file} timed out.")
+        return await sbatch(slurm_file)
+
+    job_states = work_manager.sacct_poller.job_states
+    poll_calls = []
+
+    async def flaky_job_states(slurm_ids):
+        poll_calls.append(slurm_ids)
+        if len(poll_calls) == 1:
+            raise TimeoutError("sacct timed out.")
+        return await job_states(slurm_ids)
+
+    monkeypatch.setattr(work_manager.slurm_client, "sbatch", flaky_sbatch)
+    monkeypatch.setattr(work_manager.sacct_poller, "job_states", flaky_job_states)
+
+    # the loop carries on and the jobs whose submission timed out are submitted again
+    asyncio.run(work_manager.loop())
+    current_job_dict = work_manager.check_job_status()
+    assert len(poll_calls) > 1
+    assert len(current_job_dict["finished"]) == 4
+    assert len(current_job_dict["failed"]) == 7
+
+
+def test_job_registry_index(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
+
+    def new_fake_slurm_function(*args, monkey_patch_job_dict=job_dict, **kwargs):
+        return fake_slurm_function(
+            *args, monkey_patch_job_dict=monkey_patch_job_dict, **kwargs
+        )
+
+    monkeypatch.setattr("subprocess.run", new_fake_slurm_function)
+    monkeypatch.setattr("shutil.which", lambda x: x)
+
+    config_path = clean_tmp_dir / "example_config.json"
+
+    assert isinstance(job_dict, JobRegistry)
+    orca_test = OrcaModule(config_path, "opt_config")
+    work_manager = WorkManager(orca_test, job_dict)
+    # a plain dict falls back to checking every job
+    scan_manager = WorkManager(orca_test, dict(job_dict))
+
+    def assert_same_status():
+        for config_key in ["opt_config", "sp_config"]:
+            work_manager.config_key = config_key
+            scan_manager.config_key = config_key
+            indexed = work_manager.check_job_status()
+            scanned = scan_manager.check_job_status()
+            assert {key: len(value) for key, value in indexed.items() if value} == {
+                key: len(value) for key, value in scanned.items() if value
+            }
+            for status, jobs in scanned.items():
+                assert set(indexed[status]) == set(jobs)
+        work_manager.config_key = "opt_config"
+
+    assert_same_status()
+    assert job_dict.count_for_key("opt_config")["found"] == 11
+
+    current_job_dict = work_manager.check_job_status()
+    not_started = work_manager.prepare_jobs(current_job_dict["found"])
+    assert_same_status()
+
+    submitted = asyncio.run(work_manager.submit_jobs(not_started))
+    assert_same_status()
+    assert job_dict.count_for_key("opt_config")["submitted"] == 11
+
+    returned = asyncio.run(work_manager.check_submitted_jobs(submitted))
+    assert_same_status()
+
+    fresh_finished, reset_jobs = asyncio.run(
+        work_manager.manage_returned_jobs(returned)
+    )
+    assert_same_status()
+
+    for job in fresh_finished:
+        job.advance_to_next_key()
+    assert_same_status()
+    assert job_dict.count_for_key("sp_config")["found"] == 4
+
+
+def test_submit_job_array(clean_tmp_dir, job_dict, monkeypatch, fake_slurm_function):
+
+    def new_fake_slurm_function(*args, monkey_patch_job_dict=job_dict, **kwargs):
+        return fake_slurm_function(
+            *args, monkey_patch_job_dict=monkey_patch_job_dict, **kwargs
+        )
+
+    monkeypatch.setattr("subprocess.run", new_fake_slurm_function)
+    monkeypatch.setattr("shutil.which", lambda x: x)
+
+    config_path = clean_tmp_dir / "example_config.json"
+
+    orca_test = OrcaModule(config_path, "opt_config")
+    work_manager = WorkManager(orca_test, job_dict)
+    work_manager.use_job_arrays = True
+    work_manager.main_config["main_config"]["max_n_jobs"] = 5
+
+    current_job_dict = work_manager.check_job_status()
+    not_started = work_manager.prepare_jobs(current_job_dict["found"])
+
+    # rejected arrays leave the jobs not started
+    def rejecting_sbatch(*args, **kwargs):
+        return subprocess.CompletedProcess(
+            args, 1, "", "sbatch: error: Batch job submission failed"
+        )
+
+    monkeypatch.setattr("subprocess.run", rejecting_sbatch)
+    assert asyncio.run(work_manager.submit_jobs(not_started)) == []
+    assert job_dict.state_table.count_status("not_started") == 11
+    monkeypatch.setattr("subprocess.run", new_fake_slurm_function)
+
+    # the arrays are capped at the job limit and split below the maximum array size
+    work_manager.max_array_size = 2
+    submitted = asyncio.run(work_manager.submit_jobs(not_started))
+    assert len(submitted) == 5
+    assert job_dict.state_table.count_status("submitted") == 5
+    array_dirs = sorted((orca_test.working_dir / "array_jobs").glob("*"))
+    # the script of the rejected array is kept for debugging
+    assert len(array_dirs) == 4
+
+    # the remaining jobs are submitted once there are free slots
+    work_manager.main_config["main_config"]["max_n_jobs"] = 20
+    work_manager.max_array_size = 1000
+    remaining = asyncio.run(
+        work_manager.submit_jobs(work_manager.check_job_status()["not_started"])
+    )
+    assert len(remaining) == 6
+    submitted += remaining
+    array_dirs = sorted(
+        (orca_test.working_dir / "array_jobs").glob("*"),
+        key=lambda array_dir: array_dir.stat().st_mtime_ns,
+    )
+    assert len(array_dirs) == 5
+
+    with open(array_dirs[-1] / "index.txt", "r") as f:
+        index_lines = f.read().splitlines()
+    assert len(index_lines) == 6
+
+    array_script = list(array_dirs[-1].glob("*.sbatch"))[0].read_text()
+    assert "#SBATCH --array=0-5" in array_script
+    assert "__" + "index_file" not in array_script
+
+    for job in remaining:
+        array_id, job_task_id = job.slurm_id_per_key["opt_config"].split("_")
+        assert index_lines[int(job_task_id)].endswith(job.current_dirs["input"].name)
+
+    # the array tasks are tracked like single jobs
+    returned = asyncio.run(work_manager.check_submitted_jobs(submitted))
+    assert len(returned) == 11
+    fresh_finished, reset_jobs = asyncio.run(
+        work_manager.manage_returned_jobs(returned)
+    )
+    asyncio.run(work_manager.manage_finished_jobs(fresh_finished))
+    assert len(reset_jobs) == 4
+    for job in fresh_finished:
+        if job.current_status == "finished":
+            assert job.efficiency_data["opt_config"]["JobID"] == str(
+                job.slurm_id_per_key["opt_config"]
+            )
+
+    # restarted jobs have their own walltime and are not submitted as array
+    work_manager.restart_walltime_error_jobs(reset_jobs)
+    current_job_dict = work_manager.check_job_status()
+    not_started = work_manager.prepare_jobs(current_job_dict["found"])
+    resubmitted = asyncio.run(work_manager.submit_jobs(not_started))
+    assert len(resubmitted) == 4
+    assert len(list((orca_test.working_dir / "array_jobs").glob("*"))) == 5
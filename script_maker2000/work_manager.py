@@ -1,24 +1,48 @@
 import logging
 import asyncio
+import re
 from collections import defaultdict
-import time
-import subprocess
-import shutil
 
 import pandas as pd
-from io import StringIO
 from pint import UnitRegistry
 
 from script_maker2000.job import Job
+from script_maker2000.job_registry import JobRegistry
+from script_maker2000.slurm import SlurmClient, SacctPoller
+from script_maker2000.result_parser import ResultParser
 
 
 possible_layer_types = ["orca"]
 possible_resource_settings = ["normal", "large", "custom"]
 
+# efficiency data -> (sacct line the value is taken from, unit)
+efficiency_columns = {
+    "JobID": ("job", None),
+    "JobName": ("job", None),
+    "ExitCode": ("job", None),
+    "NCPUS": ("job", None),
+    "CPUTimeRAW": ("job", "second"),
+    "ElapsedRaw": ("job", "second"),
+    "TimelimitRaw": ("job", "minute"),
+    "ConsumedEnergyRaw": ("batch", "joule"),
+    "MaxDiskRead": ("batch", "byte"),
+    "MaxDiskWrite": ("batch", "byte"),
+    "MaxVMSize": ("batch", "byte"),
+    "ReqMem": ("job", "byte"),
+}
+size_scaling = {"K": 1e3, "M": 1e6, "G": 1e9, "T": 1e12, "P": 1e15}
+
 
 class WorkManager:
 
-    def __init__(self, WorkModule, job_dict: Job) -> None:
+    def __init__(
+        self,
+        WorkModule,
+        job_dict: Job,
+        slurm_client=None,
+        sacct_poller=None,
+        result_parser=None,
+    ) -> None:
         """
         Initializes a WorkManager object.
 
@@ -31,6 +55,12 @@ class WorkManager:
         Args:
             WorkModule (type): The WorkModule object associated with this WorkManager.
             job_dict (Job): The dictionary of jobs associated with this WorkManager.
+            slurm_client (SlurmClient, optional): The client used for all slurm calls.
+                Work managers of one batch run should share a client. Defaults to None (new client).
+            sacct_poller (SacctPoller, optional): The poller used to collect the job states.
+                Work managers of one batch run should share a poller. Defaults to None (new poller).
+            result_parser (ResultParser, optional): The process pool used to parse the results.
+                Work managers of one batch run should share a parser. Defaults to None (new parser).
         """
 
         self.main_config = WorkModule.main_config
@@ -39,6 +69,18 @@ class WorkManager:
 
         self.ureg = UnitRegistry(cache_folder=":auto:")
 
+        if slurm_client is None:
+            slurm_client = SlurmClient()
+        self.slurm_client = slurm_client
+
+        if sacct_poller is None:
+            sacct_poller = SacctPoller(self.slurm_client)
+        self.sacct_poller = sacct_poller
+
+        if result_parser is None:
+            result_parser = ResultParser()
+        self.result_parser = result_parser
+
         self.config_key = self.workModule.config_key
         self.module_config = WorkModule.internal_config
         self.step_id = self.module_config["step_id"]
@@ -53,6 +95,14 @@ class WorkManager:
 
         # This way the wait time can be adjusted with monkeypatch for faster testing
         self.wait_time = self.main_config["main_config"]["wait_for_results_time"]
+        # submit all prepared jobs of one loop as a single slurm job array
+        self.use_job_arrays = self.main_config["main_config"].get(
+            "use_job_arrays", False
+        )
+        # slurm rejects arrays with more tasks than MaxArraySize (default 1001)
+        self.max_array_size = max(
+            int(self.main_config["main_config"].get("max_array_size", 1000)), 1
+        )
         self.max_loop = -1  # -1 means infinite loop until all jobs are done
         # Change max loop with monkeypatch for testing
 
@@ -66,19 +116,28 @@ class WorkManager:
     # loop
     # check if all jobs are done
 
-    def check_job_status(self, ignore_overlapping_jobs=True):
-        """Go over all jobs and check their status for this work manager."""
+    def check_job_status(self):
+        """Go over all jobs and check their status for this work manager.
+
+        Every step is scheduled and executed once, so only the job running the step is collected
+        for each StepNode (see `Job.runs_step`), the other jobs of the step follow its state.
+        When the job dict is a JobRegistry the jobs are taken directly from its status index,
+        otherwise every job is checked individually.
+        """
 
-        current_job_dict = defaultdict(list)
         current_key = self.config_key
+        if isinstance(self.job_dict, JobRegistry):
+            return self.job_dict.jobs_for_key(current_key, step_runners_only=True)
+
+        current_job_dict = defaultdict(list)
         for job_id, job in self.job_dict.items():
-            status_result = job.check_status_for_key(
-                current_key, ignore_overlapping_jobs=ignore_overlapping_jobs
-            )
+            status_result = job.check_status_for_key(current_key)
             if status_result == "not_assigned":
                 # this job is not assigned to this work manager
                 # and will be skipped
                 continue
+            if not job.runs_step(current_key):
+                continue
 
             current_job_dict[status_result].append(job)
             # possible status results:
@@ -109,90 +168,168 @@ class WorkManager:
 
         return found_jobs
 
-    def submit_jobs(self, not_started_jobs):
+    async def submit_jobs(self, not_started_jobs):
         """
         Submits a list of jobs for execution.
 
+        The sbatch calls are made through the shared slurm client,
+        which limits how many of them run at the same time.
+
         Args:
             not_started_jobs (list): A list of Job objects that have not been started yet.
 
         Returns:
             list: A list of Job objects that have been submitted for execution.
         """
-        # check if the total number of submitted jobs is below the maximum
-        total_running_jobs = 0
-        max_jobs = self.main_config["main_config"]["max_n_jobs"]
-        for job in self.job_dict.values():
-            if job.current_status == "submitted":
-                total_running_jobs += 1
+        # other managers must not submit while the running jobs are counted and submitted
+        async with self.slurm_client.submission_lock:
+            # check if the total number of submitted jobs is below the maximum
+            # every step is one slurm job, no matter how many jobs pass through it
+            max_jobs = self.main_config["main_config"]["max_n_jobs"]
+            if isinstance(self.job_dict, JobRegistry):
+                total_running_jobs = self.job_dict.state_table.count_steps("submitted")
+            else:
+                total_running_jobs = 0
+                for job in self.job_dict.values():
+                    if job.current_status == "submitted" and job.runs_step(
+                        job.current_key
+                    ):
+                        total_running_jobs += 1
+
+            started_jobs = []
+
+            if self.use_job_arrays:
+                array_jobs = await self.submit_job_array(
+                    not_started_jobs, free_slots=max_jobs - total_running_jobs
+                )
+                started_jobs.extend(array_jobs)
+                total_running_jobs += len(array_jobs)
 
-        started_jobs = []
-        overlapping_jobs = []
-        for job in not_started_jobs:
-            if job.current_status == "not_started":
-                if total_running_jobs >= max_jobs:
+            jobs_to_submit = []
+            for job in not_started_jobs:
+                if job.current_status != "not_started":
+                    # e.g. submitted as part of an array
                     continue
-
-                process = self.workModule.run_job(job)
-                job_id = int(process.stdout.split("job ")[1])
-                job.slurm_id_per_key[self.config_key] = job_id
-                job.current_status = "submitted"
+                if total_running_jobs >= max_jobs:
+                    break
+                jobs_to_submit.append(job)
                 total_running_jobs += 1
-                started_jobs.append(job)
-                time.sleep(0.2)
-            elif job.current_status == "submitted_overlapping_job":
-                overlapping_jobs.append(job)
 
-        self.log.info(
-            "Only %d (+%d overlapping jobs) out of %d jobs were submitted due to max job limit of %d."
-            % (
-                len(started_jobs),
-                len(overlapping_jobs),
-                len(not_started_jobs),
-                max_jobs,
+            # every submission is kept on its own, a failed sbatch call doesn't drop the ids of the others
+            submitted = await asyncio.gather(
+                *[self._submit_job(job) for job in jobs_to_submit],
+                return_exceptions=True,
             )
-        )
+            # jobs whose submission failed stay not_started and are submitted again later
+            started_jobs.extend(
+                job
+                for job, success in zip(jobs_to_submit, submitted)
+                if success is True
+            )
+            # unexpected errors are raised once the submitted jobs kept their slurm ids
+            for success in submitted:
+                if isinstance(success, BaseException):
+                    raise success
 
-        self.log.info(
-            "Submitted %d new jobs with %d overlapping jobs."
-            % (len(started_jobs), len(overlapping_jobs))
-        )
+        self.log.info("Submitted %d new jobs." % len(started_jobs))
 
         if len(started_jobs) != len(not_started_jobs):
             self.log.info(
-                f"Only {len(started_jobs)} (+{len(overlapping_jobs)} overlapping jobs) out of {len(not_started_jobs)} "
+                f"Only {len(started_jobs)} out of {len(not_started_jobs)} "
                 + f"jobs were submitted due to max job limit of {max_jobs}."
             )
 
-        total_started_jobs = started_jobs + overlapping_jobs
-        return total_started_jobs
+        return started_jobs
 
-    def _get_slurm_sacct_output(self, slurm_ids, sacct_format_keys):
+    async def _submit_job(self, job):
+        """Submit a single prepared job and mark it as submitted."""
 
-        slurm_ids = ",".join([str(slurm_id) for slurm_id in slurm_ids])
-        collection_format_arguments = ",".join(sacct_format_keys)
+        slurm_file = self.workModule.get_slurm_file(job)
+        try:
+            process = await self.slurm_client.sbatch(slurm_file)
+        except (TimeoutError, OSError) as e:
+            # the job stays not_started and is submitted again in the next loop
+            self.log.error(f"sbatch of {slurm_file} failed: {e}")
+            return False
+        job_id = self._read_slurm_id(process, slurm_file)
+        if job_id is None:
+            return False
+        job.slurm_id_per_key[self.config_key] = job_id
+        job.current_status = "submitted"
+        return True
+
+    def _read_slurm_id(self, process, slurm_file):
+        """
+        Read the slurm id from the output of sbatch.
 
-        ouput_sacct = subprocess.run(
-            [
-                shutil.which("sacct"),
-                "-j",
-                slurm_ids,
-                "--format",
-                collection_format_arguments,
-                "-p",
-            ],
-            shell=False,
-            check=False,
-            capture_output=True,
-            text=True,
-        )
+        Args:
+            process (subprocess.CompletedProcess): The sbatch process.
+            slurm_file (Path): The submitted sbatch script.
 
-        data_io = StringIO(ouput_sacct.stdout.strip())
-        df = pd.read_csv(data_io, sep="|", index_col=False)
+        Returns:
+            int: The slurm id, None if the submission was rejected.
+        """
+        match = re.search(r"job (\d+)", process.stdout or "")
+        if getattr(process, "returncode", 0) != 0 or match is None:
+            self.log.error(
+                f"sbatch rejected {slurm_file} (exit code {getattr(process, 'returncode', None)}): "
+                + f"{(process.stderr or process.stdout or '').strip()}"
+            )
+            return None
+        return int(match.group(1))
+
+    async def submit_job_array(self, not_started_jobs, free_slots):
+        """
+        Submits the not started jobs as slurm job arrays.
 
-        return df
+        At most `free_slots` jobs are submitted, so together with the already submitted jobs
+        no more than max_n_jobs are running and the other layers can still submit their jobs.
+        The jobs are split into arrays of at most `max_array_size` tasks (optional main config entry,
+        defaults to 1000), larger arrays are rejected by slurm (MaxArraySize).
+        Jobs that are restarted after a walltime error have their own walltime
+        and are left for the single job submission.
+
+        Args:
+            not_started_jobs (list): A list of Job objects that have not been started yet.
+            free_slots (int): The number of jobs that can still be started.
 
-    def check_submitted_jobs(self, submitted_jobs):
+        Returns:
+            list: A list of Job objects that have been submitted as part of an array.
+        """
+        array_jobs = [
+            job
+            for job in not_started_jobs
+            if job.current_status == "not_started"
+            and job.iterations_per_key.get(self.config_key, 0) == 0
+        ][: max(free_slots, 0)]
+
+        submitted_jobs = []
+        for start in range(0, len(array_jobs), self.max_array_size):
+            chunk = array_jobs[start : start + self.max_array_size]
+            array_slurm_file = self.workModule.write_job_array(chunk)
+            try:
+                process = await self.slurm_client.sbatch(array_slurm_file)
+            except (TimeoutError, OSError) as e:
+                self.log.error(f"sbatch of {array_slurm_file} failed: {e}")
+                break
+            array_id = self._read_slurm_id(process, array_slurm_file)
+            if array_id is None:
+                # the remaining jobs stay not_started and are submitted again later
+                break
+
+            for task_id, job in enumerate(chunk):
+                job.slurm_id_per_key[self.config_key] = f"{array_id}_{task_id}"
+                job.current_status = "submitted"
+            submitted_jobs.extend(chunk)
+
+            self.log.info(
+                "Submitted %d jobs as job array %d.",
+                len(chunk),
+                array_id,
+            )
+        return submitted_jobs
+
+    async def check_submitted_jobs(self, submitted_jobs):
         """
         Find new jobs in the output directory and check if they have returned.
 
@@ -207,27 +344,27 @@ class WorkManager:
             job.slurm_id_per_key[self.config_key]: job for job in submitted_jobs
         }
 
-        # select which columns to collect
-        sacct_format_keys = ["JobID", "JobName", "State"]
         finished_jobs = []
 
         if not job_slurm_ids:
             return finished_jobs
 
-        slurm_df = self._get_slurm_sacct_output(job_slurm_ids.keys(), sacct_format_keys)
-        self.log.debug(slurm_df)
+        # the poller combines the sacct calls of all work managers
+        try:
+            slurm_states = await self.sacct_poller.job_states(job_slurm_ids.keys())
+        except (TimeoutError, OSError) as e:
+            # the jobs stay submitted and are checked again in the next loop
+            self.log.error(f"Polling the job states failed, skipping this check: {e}")
+            return finished_jobs
+        self.log.debug(slurm_states)
 
-        # remove lines with batch and extern
-        slurm_df = slurm_df[~slurm_df["JobName"].str.contains("batch|extern")]
         for slurm_id, job in job_slurm_ids.items():
-            slurm_job = slurm_df[slurm_df["JobID"].astype(int) == int(slurm_id)]
-            if slurm_job.empty:
+            # compare as strings, array tasks have ids like <array_id>_<task_id>
+            slurm_state = slurm_states.get(str(slurm_id))
+            if slurm_state is None:
                 continue
 
-            slurm_job = slurm_job.iloc[0]
-            slurm_state = slurm_job["State"]
-
-            if slurm_state in ["COMPLETED", "TIMEOUT", "FAILED", "CANCELLED"]:
+            if slurm_state in self.sacct_poller.terminal_states:
                 job.current_status = "returned"
                 finished_jobs.append(job)
 
@@ -239,10 +376,14 @@ class WorkManager:
 
         return finished_jobs
 
-    def manage_returned_jobs(self, returned_jobs):
+    async def manage_returned_jobs(self, returned_jobs):
         """
         Manages the returned jobs by checking their status and performing necessary actions.
 
+        The output of every returned job is parsed in the shared result parser pool
+        before the job is moved on, so the _calc_result.json file is part of its results.
+        A job whose output can't be parsed is handled as an unknown_error.
+
         Args:
             returned_jobs (list): A list of Job objects representing the returned jobs.
 
@@ -253,19 +394,11 @@ class WorkManager:
         """
         # get job status from work module
         return_status_dict = defaultdict(lambda: 0)
-        overlapping_jobs_info = []
         non_existing_output = []
         reset_jobs = []
+        checked_jobs = []
 
         for job in returned_jobs:
-            # first check if the job was successful and
-            # if the job was already performed by an overlapping job
-            if job.check_status_for_key(self.config_key) != "returned":
-                overlapping_jobs_info.append(
-                    f"Job {job.unique_job_id} was already handled due to overlapping jobs."
-                )
-                continue
-
             if not job.current_dirs["output"].exists():
                 non_existing_output.append(job)
                 self.log.warning(
@@ -276,6 +409,26 @@ class WorkManager:
                 continue
 
             work_module_status = self.workModule.check_job_status(job)
+            checked_jobs.append((job, work_module_status))
+
+        # parse all outputs at once, the parsing doesn't block the other work managers
+        parse_results = await asyncio.gather(
+            *[
+                self.result_parser.parse(
+                    job.current_dirs["output"],
+                    None if work_module_status == "success" else work_module_status,
+                )
+                for job, work_module_status in checked_jobs
+            ],
+            return_exceptions=True,
+        )
+
+        for (job, work_module_status), parse_result in zip(checked_jobs, parse_results):
+            if isinstance(parse_result, Exception):
+                self.log.error(
+                    "Can't parse the output of %s: %r", job.unique_job_id, parse_result
+                )
+                work_module_status = "unknown_error"
 
             # check if status is walltime error, if skip the return manager
 
@@ -296,11 +449,6 @@ class WorkManager:
         for job in reset_jobs:
             returned_jobs.remove(job)
 
-        self.log.info(
-            "Skipped %d overlapping jobs as they are already done.",
-            len(overlapping_jobs_info),
-        )
-
         if non_existing_output:
             error_message = (
                 "Caught %d non existing output dirs after slurm was finished."
@@ -326,7 +474,7 @@ class WorkManager:
 
         return reset_jobs_list
 
-    def manage_finished_jobs(self, finished_jobs):
+    async def manage_finished_jobs(self, finished_jobs):
         """
         Manage the finished jobs by collecting the orca output data and performing connectivity checks.
 
@@ -346,48 +494,24 @@ class WorkManager:
 
             job_slurm_ids[job.slurm_id_per_key[self.config_key]] = job
 
-        # collect the orca output data for all jobs
-
-        for job in finished_jobs:
-
-            self.workModule.collect_results(job, self.config_key)
-
-            # if result_dict and result_dict["connectivity_check"] is False:
-            #     self.log.warning("Connectivity check for %s was not successful!", job)
-
-        collection_format_arguments = [
-            "JobID",
-            "JobName",
-            "ExitCode",
-            "NCPUS",
-            "CPUTimeRAW",
-            "ElapsedRaw",
-            "TimelimitRaw",
-            "ConsumedEnergyRaw",
-            "MaxDiskRead",
-            "MaxDiskWrite",
-            "MaxVMSize",
-            "ReqMem",
-            "MaxRSS",
-        ]
         if not job_slurm_ids:
             return
 
-        slurm_df = self._get_slurm_sacct_output(
-            job_slurm_ids.keys(), collection_format_arguments
-        )
+        try:
+            efficiency_df = await self.sacct_poller.efficiency_data(
+                job_slurm_ids.keys()
+            )
+        except (TimeoutError, OSError) as e:
+            self.log.error(f"Collecting the efficiency data failed: {e}")
+            return
+        efficiency_data = self._filter_data(efficiency_df)
 
         for slurm_id, job in job_slurm_ids.items():
-            slurm_job = slurm_df[
-                slurm_df["JobID"]
-                .astype(str)
-                .str.contains(f"{slurm_id}|{slurm_id}.batch|{slurm_id}.extern")
-            ]
-            if slurm_job.empty:
-                continue
-
-            slurm_job_dict = slurm_job.to_dict(orient="list")
-            job.efficiency_data[self.config_key] = self._filter_data(slurm_job_dict)
+            if str(slurm_id) in efficiency_data:
+                job.efficiency_data[self.config_key] = efficiency_data[str(slurm_id)]
+                # the efficiency data is not part of the status, report the change to the journal
+                if isinstance(self.job_dict, JobRegistry):
+                    self.job_dict.update_job(job)
 
     async def loop(self):
         """
@@ -443,16 +567,16 @@ class WorkManager:
 
             # submit jobs
             current_job_dict["submitted"].extend(
-                self.submit_jobs(current_job_dict["not_started"])
+                await self.submit_jobs(current_job_dict["not_started"])
             )
 
             # check on submitted jobs
             current_job_dict["returned"].extend(
-                self.check_submitted_jobs(current_job_dict["submitted"])
+                await self.check_submitted_jobs(current_job_dict["submitted"])
             )
 
             # manage finished jobs
-            fresh_finished, reset_jobs = self.manage_returned_jobs(
+            fresh_finished, reset_jobs = await self.manage_returned_jobs(
                 current_job_dict["returned"]
             )
 
@@ -463,13 +587,21 @@ class WorkManager:
             )
 
             # check on newly finished jobs to collect efficiency data
-            self.manage_finished_jobs(fresh_finished)
+            await self.manage_finished_jobs(fresh_finished)
 
             if all_jobs_done(current_job_dict):
                 break
 
             # time.sleep(self.wait_time)
-            await asyncio.sleep(self.wait_time)
+            # with a completion spool the loop continues as soon as one of the jobs has ended
+            running_slurm_ids = [
+                job.slurm_id_per_key[self.config_key]
+                for job in current_job_dict["submitted"]
+                if job.current_status == "submitted"
+            ]
+            await self.sacct_poller.wait_for_completions(
+                self.wait_time, running_slurm_ids
+            )
 
             if self.max_loop > 0 and n_loops >= self.max_loop:
                 self.log.info(f"Breaking loop after {n_loops}.")
@@ -480,77 +612,64 @@ class WorkManager:
         self.is_finished = True
         return f"All jobs done after {n_loops}."
 
-    def _convert_order_of_magnitude(self, value):
-
-        if isinstance(value, float):
-            return value
-        if isinstance(value, int):
-            return float(value)
-
-        if "K" in value:
-            scaling = 1000
-        elif "M" in value:
-            scaling = 1000000
-        elif "G" in value:
-            scaling = 1000000000
-        elif "T" in value:
-            scaling = 1000000000000
-        elif "P" in value:
-            scaling = 1000000000000000
-        else:
-            scaling = 1
+    def _convert_order_of_magnitude(self, values):
+        """
+        Convert sacct sizes like "1723M" to floats.
 
-        try:
-            new_value = float(value[:-1]) * scaling
-        except ValueError:
-            if int(value) == 0:
-                new_value = 0.0
-        return new_value
+        Args:
+            values (pd.Series): The sizes as returned by sacct.
 
-    def _filter_data(self, data):
+        Returns:
+            pd.Series: The sizes as floats, NaN if a value is missing.
+        """
+        values = values.astype(str).str.strip()
+        scaling = values.str[-1].str.upper().map(size_scaling)
+        numbers = values.where(scaling.isna(), values.str[:-1])
+        return pd.to_numeric(numbers, errors="coerce") * scaling.fillna(1)
 
+    def _filter_data(self, efficiency_df):
+        """
+        Convert the sacct data of finished jobs to the efficiency data of a job.
+
+        All columns are converted at once for all jobs.
+        Values that sacct left empty, e.g. the batch step values of a job that was killed
+        before its batch step started, are "Missing".
+
+        Args:
+            efficiency_df (pd.DataFrame): One line per job as returned by `SacctPoller.efficiency_data`.
+
+        Returns:
+            dict: slurm id -> efficiency data of the job.
+        """
         ureg = self.ureg
-        filtered_data = {}
+        converted_columns = {}
 
-        for key, value in data.items():
-            if value[0] == [""] and value[1] == [""]:
-                filtered_data[key] = "Missing"
+        for key, (sacct_line, unit) in efficiency_columns.items():
+            column = key if sacct_line == "job" else f"{key}_batch"
+            if column not in efficiency_df:
+                # e.g. none of the jobs has a batch step line
+                converted_columns[key] = ["Missing"] * len(efficiency_df)
                 continue
+            values = efficiency_df[column]
+            missing = values.isna() | (values.astype(str).str.strip() == "")
 
-            if key == "JobID":
-                filtered_data[key] = value[0]
-            elif key == "JobName":
-                filtered_data[key] = value[0]
-            elif key == "ExitCode":
-                filtered_data[key] = value[0]
-            elif key == "NCPUS":
-                filtered_data[key] = value[0]
-            elif key == "CPUTimeRAW":
-                filtered_data[key] = float(value[0]) * ureg.second
-            elif key == "ElapsedRaw":
-                filtered_data[key] = float(value[0]) * ureg.second
-            elif key == "TimelimitRaw":
-                filtered_data[key] = float(value[0]) * ureg.minute
-            elif key == "ConsumedEnergyRaw":
-                filtered_data[key] = float(value[1]) * ureg.joule
-            elif key == "MaxDiskRead":
-                filtered_data[key] = (
-                    self._convert_order_of_magnitude(value[1]) * ureg.byte
-                )
-            elif key == "MaxDiskWrite":
-                filtered_data[key] = (
-                    self._convert_order_of_magnitude(value[1]) * ureg.byte
-                )
-            elif key == "MaxVMSize":
-                filtered_data[key] = (
-                    self._convert_order_of_magnitude(value[1]) * ureg.byte
-                )
-            elif key == "ReqMem":
-                filtered_data[key] = (
-                    self._convert_order_of_magnitude(value[0]) * ureg.byte
-                )
-            elif key == "maxRamUsage":
-                filtered_data[key] = (
-                    self._convert_order_of_magnitude(value[1]) * ureg.byte
-                )
+            if unit is None:
+                converted_columns[key] = values.where(~missing, "Missing").tolist()
+                continue
+
+            if unit == "byte":
+                values = self._convert_order_of_magnitude(values)
+            else:
+                values = pd.to_numeric(values, errors="coerce")
+            unit = ureg(unit).units
+            converted_columns[key] = [
+                "Missing" if is_missing else value * unit
+                for value, is_missing in zip(values.tolist(), missing.tolist())
+            ]
+
+        filtered_data = {}
+        for i, slurm_id in enumerate(efficiency_df.index):
+            filtered_data[slurm_id] = {
+                key: values[i] for key, values in converted_columns.items()
+            }
         return filtered_data